@@ -0,0 +1,65 @@
+"""In-process FTP server for benchmarks, using pyftpdlib."""
+from __future__ import absolute_import
+
+import os
+import threading
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+
+class FtpServer(object):
+    """FTP server on a free local port, serving root to a single user."""
+
+    def __init__(self, root, user="bench", password="bench"):
+        self.root = root
+        self.user = user
+        self.password = password
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.files_received = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        """Start serving and return the URL of the root, with credentials."""
+        server = self
+        authorizer = DummyAuthorizer()
+        authorizer.add_user(self.user, self.password, self.root,
+                            perm="elradfmwMT")
+
+        class Handler(FTPHandler):
+            def on_file_received(self, file):
+                with server._lock:  # pylint: disable=protected-access
+                    server.files_received += 1
+                    server.bytes_received += os.path.getsize(file)
+
+            def on_file_sent(self, file):
+                with server._lock:  # pylint: disable=protected-access
+                    server.bytes_sent += os.path.getsize(file)
+
+        Handler.authorizer = authorizer
+        self._server = ThreadedFTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "ftp://%s:%s@127.0.0.1:%d" % (
+            self.user, self.password, self._server.address[1])
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close_all()
+
+    def reset(self):
+        """Zero the transfer counters."""
+        with self._lock:
+            self.files_received = self.bytes_received = self.bytes_sent = 0
+
+    def stats(self):
+        with self._lock:
+            return {"files_received": self.files_received,
+                    "bytes_received": self.bytes_received,
+                    "bytes_sent": self.bytes_sent}
@@ -0,0 +1,186 @@
+"""Stand-in TES server for benchmarks."""
+from __future__ import absolute_import, division
+
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves import urllib
+
+
+class MockTES(object):
+    """
+    In-process TES server whose tasks do not run anything.
+
+    Every request takes ``latency`` seconds. A task is QUEUED for
+    ``queue_time`` seconds, RUNNING for ``run_time`` seconds and then
+    COMPLETE, or EXECUTOR_ERROR with probability ``failure_rate``. When a
+    task completes, its ftp:// outputs are created below ``ftp_root``, its
+    s3://bucket/key outputs as ``s3_root``/bucket/key and its file://
+    outputs on the local disk, so that cwl-tes finds them.
+    """
+
+    def __init__(self, latency=0.0, queue_time=0.0, run_time=0.1,
+                 failure_rate=0.0, ftp_root=None, s3_root=None, seed=0):
+        self.latency = latency
+        self.queue_time = queue_time
+        self.run_time = run_time
+        self.failure_rate = failure_rate
+        self.ftp_root = ftp_root
+        self.s3_root = s3_root
+        self.tasks = {}
+        self.counts = {}
+        self.create_times = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Serve on a free local port and return the base URL."""
+        tes = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                tes.handle(self, "GET")
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                tes.handle(self, "POST")
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stats(self):
+        """Request counts and the submission rate."""
+        with self._lock:
+            stats = {"requests": dict(self.counts),
+                     "tasks": len(self.tasks),
+                     "failed": sum(1 for task in self.tasks.values()
+                                   if task["fail"])}
+            times = sorted(self.create_times)
+        if len(times) > 1 and times[-1] > times[0]:
+            stats["submit_per_second"] = (len(times) - 1) / \
+                (times[-1] - times[0])
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def handle(self, request, method):
+        time.sleep(self.latency)
+        parse = urllib.parse.urlparse(request.path)
+        path = parse.path.rstrip("/")
+        query = urllib.parse.parse_qs(parse.query)
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        self._count("bytes_received", len(body))
+        if method == "POST" and path == "/v1/tasks":
+            if request.headers.get("Content-Encoding") == "gzip":
+                body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+            self._count("create")
+            task_id = uuid.uuid4().hex
+            with self._lock:
+                self.tasks[task_id] = {
+                    "task": json.loads(body.decode("utf-8")),
+                    "created": time.time(), "canceled": False,
+                    "fail": self._random.random() < self.failure_rate}
+                self.create_times.append(time.time())
+            return self._send(request, {"id": task_id})
+        if method == "POST" and path.endswith(":cancel"):
+            self._count("cancel")
+            task = self.tasks.get(path.split("/")[-1][:-len(":cancel")])
+            if task is None:
+                return self._send(request, {}, 404)
+            task["canceled"] = True
+            return self._send(request, {})
+        if method == "GET" and path == "/v1/tasks/service-info":
+            return self._send(request, {"name": "cwl-tes benchmark"})
+        if method == "GET" and path == "/v1/tasks":
+            self._count("list")
+            with self._lock:
+                ids = list(self.tasks)
+            return self._send(request, {"tasks": [
+                {"id": task_id, "state": self._state(task_id)}
+                for task_id in ids]})
+        if method == "GET" and path.startswith("/v1/tasks/"):
+            self._count("get")
+            task_id = path.split("/")[-1]
+            if task_id not in self.tasks:
+                return self._send(request, {}, 404)
+            state = self._state(task_id)
+            response = {"id": task_id, "state": state}
+            if query.get("view", ["MINIMAL"])[0] == "FULL":
+                executors = self.tasks[task_id]["task"]["executors"]
+                exit_code = 1 if state == "EXECUTOR_ERROR" else 0
+                response["logs"] = [{"logs": [
+                    {"exit_code": exit_code} for _ in executors]}]
+            return self._send(request, response)
+        return self._send(request, {}, 404)
+
+    def _send(self, request, obj, status=200):
+        data = json.dumps(obj).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _state(self, task_id):
+        task = self.tasks[task_id]
+        if task["canceled"]:
+            return "CANCELED"
+        elapsed = time.time() - task["created"]
+        if elapsed < self.queue_time:
+            return "QUEUED"
+        if elapsed < self.queue_time + self.run_time:
+            return "RUNNING"
+        if task["fail"]:
+            return "EXECUTOR_ERROR"
+        with self._lock:
+            if not task.get("done"):
+                task["done"] = True
+                self._create_outputs(task["task"])
+        return "COMPLETE"
+
+    def _create_outputs(self, task):
+        for output in task.get("outputs", []):
+            url = urllib.parse.urlparse(output["url"])
+            if url.scheme == "ftp" and self.ftp_root:
+                path = os.path.join(self.ftp_root, url.path.lstrip("/"))
+            elif url.scheme == "s3" and self.s3_root:
+                path = os.path.join(
+                    self.s3_root, url.netloc, url.path.lstrip("/"))
+            elif url.scheme == "file":
+                path = url.path
+            else:
+                continue
+            if output.get("type") == "DIRECTORY":
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                continue
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as handle:
+                handle.write("output of %s\n" % task.get("name"))
@@ -0,0 +1,237 @@
+"""
+Benchmarks of cwl-tes against a stand-in TES server and local storage.
+
+Usage: python -m benchmarks.run [--scenario NAME ...] [--storage ftp|s3]
+                                [--output FILE]
+
+Each scenario runs the cwl-tes command line on a synthetic workflow and
+reports its wall time, the TES requests it made, the data it moved to and
+from the FTP or S3 stand-in and the job phase timings from
+--metrics-summary, as JSON.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .ftp_server import FtpServer
+from .mock_tes import MockTES
+from .s3_server import S3Server
+
+WORKFLOWS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "workflows")
+# the checkout that cwl_tes is run from, for the cwl-tes subprocess
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wide_scatter(workdir, size):
+    """One scatter step of size jobs."""
+    job = {"messages": ["message %d" % i for i in range(size)]}
+    return os.path.join(WORKFLOWS, "scatter.cwl"), job, []
+
+
+def deep_chain(workdir, size):
+    """size steps in a row, each passing a file to the next."""
+    with open(os.path.join(workdir, "input.txt"), "w") as handle:
+        handle.write("input\n")
+    steps = {}
+    for i in range(size):
+        steps["step%d" % i] = {
+            "run": os.path.join(WORKFLOWS, "cat.cwl"),
+            "in": {"input": "step%d/output" % (i - 1) if i else "input"},
+            "out": ["output"]}
+    workflow = {
+        "cwlVersion": "v1.0", "class": "Workflow",
+        "inputs": {"input": "File"},
+        "outputs": {"output": {"type": "File",
+                               "outputSource": "step%d/output" % (size - 1)}},
+        "steps": steps}
+    path = os.path.join(workdir, "chain.cwl")
+    with open(path, "w") as handle:
+        json.dump(workflow, handle, indent=2)
+    job = {"input": {"class": "File",
+                     "location": os.path.join(workdir, "input.txt")}}
+    return path, job, []
+
+
+def big_directory(workdir, size, file_size=4096):
+    """A directory of size files as the input of a single job."""
+    directory = os.path.join(workdir, "big")
+    os.makedirs(directory)
+    data = os.urandom(file_size)
+    for i in range(size):
+        subdir = os.path.join(directory, "d%03d" % (i // 1000))
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, "f%06d" % i), "wb") as handle:
+            handle.write(data)
+    job = {"directory": {"class": "Directory", "location": directory}}
+    return os.path.join(WORKFLOWS, "ls.cwl"), job, []
+
+
+def big_directory_archive(workdir, size):
+    """big_directory, uploaded as one archive."""
+    workflow, job, args = big_directory(workdir, size)
+    return workflow, job, args + ["--archive-directories", "100"]
+
+
+SCENARIOS = {
+    "wide_scatter": (wide_scatter, 200),
+    "deep_chain": (deep_chain, 20),
+    "big_directory": (big_directory, 2000),
+    "big_directory_archive": (big_directory_archive, 2000),
+}
+
+
+def start_storage(kind, root):
+    """
+    Serve root over FTP or S3; return the server, the remote storage URL and
+    local directory of root, and the cwl-tes arguments and environment
+    needed to reach it.
+    """
+    if kind == "s3":
+        server = S3Server(root)
+        endpoint = server.start()
+        os.makedirs(os.path.join(root, "bench"))
+        env = dict(os.environ, AWS_ACCESS_KEY_ID="bench",
+                   AWS_SECRET_ACCESS_KEY="bench",
+                   AWS_DEFAULT_REGION="us-east-1")
+        return (server, "s3://bench", os.path.join(root, "bench"),
+                ["--s3-endpoint-url", endpoint], env)
+    server = FtpServer(root)
+    return server, server.start(), root, [], None
+
+
+def run_scenario(name, size, options, storage):
+    """Run one scenario against a fresh TES server and return its results."""
+    make, default_size = SCENARIOS[name]
+    size = size or default_size
+    server, storage_url, storage_dir, storage_args, env = storage
+    workdir = tempfile.mkdtemp(prefix="cwl-tes-bench-")
+    os.makedirs(os.path.join(storage_dir, name))
+    server.reset()
+    tes = MockTES(latency=options.latency, queue_time=options.queue_time,
+                  run_time=options.run_time,
+                  failure_rate=options.failure_rate,
+                  ftp_root=server.root, s3_root=server.root)
+    try:
+        tes_url = tes.start()
+        workflow, job, args = make(workdir, size)
+        job_path = os.path.join(workdir, "job.json")
+        with open(job_path, "w") as handle:
+            json.dump(job, handle)
+        metrics_path = os.path.join(workdir, "metrics.json")
+        cmd = [sys.executable, "-m", "cwl_tes.main", "--tes", tes_url,
+               "--remote-storage-url", "{}/{}".format(storage_url, name),
+               "--insecure", "--quiet",
+               "--outdir", os.path.join(workdir, "out"),
+               "--metrics-summary", metrics_path] \
+            + storage_args + args + options.cwl_tes_args \
+            + [workflow, job_path]
+        python_path = [REPO_ROOT] + [
+            path for path in [(env or os.environ).get("PYTHONPATH")] if path]
+        env = dict(env or os.environ,
+                   PYTHONPATH=os.pathsep.join(python_path))
+        start = time.time()
+        with open(os.path.join(workdir, "cwl-tes.log"), "w") as log:
+            returncode = subprocess.call(
+                cmd, stdout=log, stderr=subprocess.STDOUT, cwd=workdir,
+                env=env)
+        wall = time.time() - start
+        result = {"scenario": name, "size": size, "returncode": returncode,
+                  "wall_seconds": wall, "tes": tes.stats(),
+                  "storage": server.stats()}
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as handle:
+                metrics = json.load(handle)
+            result["phases"] = metrics["phases"]
+            upload = metrics["phases"].get("upload", {}).get("seconds")
+            if upload:
+                result["staging_mb_per_second"] = \
+                    result["storage"]["bytes_received"] / upload / 1e6
+        tasks = result["tes"]["tasks"]
+        if tasks:
+            requests = result["tes"]["requests"]
+            result["polls_per_task"] = (
+                requests.get("get", 0) + requests.get("list", 0)) / tasks
+        if returncode != 0:
+            with open(os.path.join(workdir, "cwl-tes.log")) as log:
+                result["log_tail"] = log.read()[-2000:]
+        return result
+    finally:
+        tes.stop()
+        if not options.keep:
+            shutil.rmtree(workdir, True)
+            shutil.rmtree(os.path.join(storage_dir, name), True)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="Scenario to run; may be given more than once, "
+                        "default all.")
+    parser.add_argument("--size", type=int, default=None,
+                        help="Number of jobs, steps or files, overriding the "
+                        "default of each scenario.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the TES server takes per request.")
+    parser.add_argument("--queue-time", type=float, default=0.0,
+                        help="Seconds each task spends QUEUED.")
+    parser.add_argument("--run-time", type=float, default=0.1,
+                        help="Seconds each task spends RUNNING.")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Fraction of tasks that end in EXECUTOR_ERROR.")
+    parser.add_argument("--storage", choices=["ftp", "s3"], default="ftp",
+                        help="Remote storage to stage files through, a local "
+                        "FTP server or S3 stand-in, default ftp.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this file instead of "
+                        "standard output.")
+    parser.add_argument("--keep", action="store_true",
+                        help="Keep the working directories.")
+    parser.add_argument("cwl_tes_args", nargs=argparse.REMAINDER,
+                        help="Extra cwl-tes arguments, after --.")
+    options = parser.parse_args(args)
+    options.cwl_tes_args = [arg for arg in options.cwl_tes_args
+                            if arg != "--"]
+    # keeps pyftpdlib from logging every command
+    logging.basicConfig(level=logging.WARNING)
+    # one storage server for all scenarios, each uses its own directory
+    root = tempfile.mkdtemp(prefix="cwl-tes-bench-%s-" % options.storage)
+    storage = start_storage(options.storage, root)
+    results = []
+    try:
+        for name in options.scenario or sorted(SCENARIOS):
+            print("running %s" % name, file=sys.stderr)
+            results.append(run_scenario(name, options.size, options, storage))
+            print("  %.1fs" % results[-1]["wall_seconds"], file=sys.stderr)
+    finally:
+        storage[0].stop()
+        if not options.keep:
+            shutil.rmtree(root, True)
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "time": time.time(),
+              "options": {key: value for key, value in vars(options).items()
+                          if key != "scenario"},
+              "results": results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+    return 0 if all(r["returncode"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
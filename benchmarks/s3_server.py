@@ -0,0 +1,381 @@
+"""
+In-process stand-in for an S3 compatible server such as MinIO.
+
+Objects are plain files below root/<bucket>/, so that the stand-in TES
+server can write task outputs directly. It implements the requests
+cwl-tes makes: PUT, ranged GET, HEAD and DELETE of objects, server-side
+copies, ListObjectsV2, multipart uploads and batched deletes. Requests are
+not authenticated.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves import urllib
+
+XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def _xml(root, body):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<{0} xmlns="{1}">{2}'
+            '</{0}>').format(root, XMLNS, body).encode("utf-8")
+
+
+def _etag(path):
+    checksum = hashlib.md5()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return '"{}"'.format(checksum.hexdigest())
+
+
+def _decode_aws_chunked(data):
+    """Payload of an aws-chunked request body, without signatures."""
+    result = []
+    while data:
+        header, _, data = data.partition(b"\r\n")
+        size = int(header.split(b";")[0], 16)
+        if not size:
+            break
+        result.append(data[:size])
+        data = data[size + 2:]
+    return b"".join(result)
+
+
+class S3Server(object):
+    """S3 stand-in on a free local port, storing the objects under root."""
+
+    def __init__(self, root):
+        self.root = root
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.files_received = 0
+        self.requests = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        """Start serving and return the endpoint URL."""
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                server.handle(self, "GET")
+
+            def do_HEAD(self):  # pylint: disable=invalid-name
+                server.handle(self, "HEAD")
+
+            def do_PUT(self):  # pylint: disable=invalid-name
+                server.handle(self, "PUT")
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                server.handle(self, "POST")
+
+            def do_DELETE(self):  # pylint: disable=invalid-name
+                server.handle(self, "DELETE")
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:%d" % self._server.server_address[1]
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset(self):
+        """Zero the transfer counters."""
+        with self._lock:
+            self.files_received = self.bytes_received = self.bytes_sent = 0
+            self.requests = {}
+
+    def stats(self):
+        with self._lock:
+            return {"files_received": self.files_received,
+                    "bytes_received": self.bytes_received,
+                    "bytes_sent": self.bytes_sent,
+                    "requests": dict(self.requests)}
+
+    def _count(self, operation, received=0, sent=0, files=0):
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+            self.files_received += files
+
+    def _path(self, bucket, key=""):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _keys(self, bucket, prefix):
+        """Sorted (key, size) of the objects in bucket starting with prefix;
+        every directory is a "dir/" marker object."""
+        top = self._path(bucket)
+        keys = []
+        for root, _dirs, files in os.walk(top):
+            rel = os.path.relpath(root, top).replace(os.sep, "/")
+            base = "" if rel == "." else rel + "/"
+            if base:
+                keys.append((base, 0))
+            for name in files:
+                keys.append(
+                    (base + name, os.path.getsize(os.path.join(root, name))))
+        return sorted(key for key in keys if key[0].startswith(prefix))
+
+    def handle(self, request, method):
+        parse = urllib.parse.urlsplit(request.path)
+        query = urllib.parse.parse_qs(parse.query, keep_blank_values=True)
+        bucket, _, key = urllib.parse.unquote(
+            parse.path).lstrip("/").partition("/")
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        if "aws-chunked" in (request.headers.get("Content-Encoding") or "") \
+                or request.headers.get("x-amz-decoded-content-length"):
+            body = _decode_aws_chunked(body)
+        if not bucket or not os.path.isdir(self._path(bucket)):
+            return self._error(request, method, 404, "NoSuchBucket")
+        if not key:
+            if method == "GET" and query.get("list-type") == ["2"]:
+                return self._list(request, bucket, query)
+            if method == "POST" and "delete" in query:
+                return self._delete_objects(request, bucket, body)
+            if method == "HEAD":
+                self._count("head_bucket")
+                return self._send(request, method, b"")
+            return self._error(request, method, 400, "NotImplemented")
+        if method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self._lock:
+                self._uploads[upload_id] = {}
+            self._count("create_multipart_upload")
+            return self._send(request, method, _xml(
+                "InitiateMultipartUploadResult",
+                "<Bucket>{}</Bucket><Key>{}</Key><UploadId>{}</UploadId>"
+                .format(bucket, escape(key), upload_id)))
+        if method == "PUT" and "uploadId" in query:
+            parts = self._uploads.get(query["uploadId"][0])
+            if parts is None:
+                return self._error(request, method, 404, "NoSuchUpload")
+            source = request.headers.get("x-amz-copy-source")
+            if source:
+                data = self._read_source(
+                    source, request.headers.get("x-amz-copy-source-range"))
+                if data is None:
+                    return self._error(request, method, 404, "NoSuchKey")
+                self._count("upload_part_copy")
+            else:
+                data = body
+                self._count("upload_part", received=len(data))
+            parts[int(query["partNumber"][0])] = data
+            etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+            if source:
+                return self._send(request, method, _xml(
+                    "CopyPartResult", "<ETag>{}</ETag>".format(escape(etag))))
+            return self._send(request, method, b"", {"ETag": etag})
+        if method == "POST" and "uploadId" in query:
+            with self._lock:
+                parts = self._uploads.pop(query["uploadId"][0], None)
+            if parts is None:
+                return self._error(request, method, 404, "NoSuchUpload")
+            etag = self._write(bucket, key, b"".join(
+                parts[number] for number in sorted(parts)))
+            self._count("complete_multipart_upload", files=1)
+            return self._send(request, method, _xml(
+                "CompleteMultipartUploadResult",
+                "<Bucket>{}</Bucket><Key>{}</Key><ETag>{}</ETag>".format(
+                    bucket, escape(key), escape(etag))))
+        if method == "DELETE" and "uploadId" in query:
+            with self._lock:
+                self._uploads.pop(query["uploadId"][0], None)
+            self._count("abort_multipart_upload")
+            return self._send(request, method, b"", status=204)
+        if method == "PUT":
+            source = request.headers.get("x-amz-copy-source")
+            if source:
+                data = self._read_source(source, None)
+                if data is None:
+                    return self._error(request, method, 404, "NoSuchKey")
+                etag = self._write(bucket, key, data)
+                self._count("copy_object")
+                return self._send(request, method, _xml(
+                    "CopyObjectResult", "<ETag>{}</ETag>".format(
+                        escape(etag))))
+            etag = self._write(bucket, key, body)
+            self._count("put_object", received=len(body),
+                        files=0 if key.endswith("/") else 1)
+            return self._send(request, method, b"", {"ETag": etag})
+        if method == "DELETE":
+            self._delete(bucket, key)
+            self._count("delete_object")
+            return self._send(request, method, b"", status=204)
+        if method in ("GET", "HEAD"):
+            return self._get(request, method, bucket, key)
+        return self._error(request, method, 400, "NotImplemented")
+
+    def _write(self, bucket, key, data):
+        """Store data as key and return its ETag."""
+        path = self._path(bucket, key)
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        if key.endswith("/"):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            return etag
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        part = "{}.{}.part".format(path, uuid.uuid4().hex)
+        with open(part, "wb") as handle:
+            handle.write(data)
+        os.rename(part, path)
+        return etag
+
+    def _delete(self, bucket, key):
+        path = self._path(bucket, key)
+        if key.endswith("/"):
+            if os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    def _read_source(self, source, byte_range):
+        bucket, _, key = urllib.parse.unquote(
+            source.split("?")[0]).lstrip("/").partition("/")
+        path = self._path(bucket, key)
+        if key.endswith("/"):
+            return b"" if os.path.isdir(path) else None
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as handle:
+            if not byte_range:
+                return handle.read()
+            start, end = re.match(
+                r"bytes=(\d+)-(\d+)", byte_range).groups()
+            handle.seek(int(start))
+            return handle.read(int(end) - int(start) + 1)
+
+    def _get(self, request, method, bucket, key):
+        path = self._path(bucket, key)
+        if key.endswith("/") and os.path.isdir(path):
+            size, data = 0, b""
+        elif os.path.isfile(path):
+            size = os.path.getsize(path)
+            data = None
+        else:
+            self._count(method.lower() + "_object")
+            return self._error(request, method, 404, "NoSuchKey")
+        headers = {"ETag": _etag(path) if data is None else '""',
+                   "Last-Modified": time.strftime(
+                       "%a, %d %b %Y %H:%M:%S GMT", time.gmtime()),
+                   "Accept-Ranges": "bytes"}
+        status = 200
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)",
+                         request.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), size - 1)
+            if start >= size:
+                self._count(method.lower() + "_object")
+                return self._error(request, method, 416, "InvalidRange")
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(
+                start, end, size)
+        if method == "HEAD":
+            self._count("head_object")
+            return self._send(request, method, b"", headers, status,
+                              length=size)
+        if data is None:
+            with open(path, "rb") as handle:
+                handle.seek(start)
+                data = handle.read(end - start + 1)
+        self._count("get_object", sent=len(data))
+        return self._send(request, method, data, headers, status)
+
+    def _list(self, request, bucket, query):
+        self._count("list_objects")
+        prefix = query.get("prefix", [""])[0]
+        delimiter = query.get("delimiter", [""])[0]
+        max_keys = int(query.get("max-keys", ["1000"])[0])
+        start = query.get("continuation-token",
+                          query.get("start-after", [""]))[0]
+        entries = []
+        for key, size in self._keys(bucket, prefix):
+            if delimiter and delimiter in key[len(prefix):]:
+                common = key[:key.index(delimiter, len(prefix)) + 1]
+                if not entries or entries[-1] != (common, None):
+                    entries.append((common, None))
+            else:
+                entries.append((key, size))
+        entries = [entry for entry in entries if entry[0] > start]
+        page, rest = entries[:max_keys], entries[max_keys:]
+        body = ["<Name>{}</Name><Prefix>{}</Prefix><KeyCount>{}</KeyCount>"
+                "<MaxKeys>{}</MaxKeys><IsTruncated>{}</IsTruncated>".format(
+                    bucket, escape(prefix), len(page), max_keys,
+                    "true" if rest else "false")]
+        if delimiter:
+            body.append("<Delimiter>{}</Delimiter>".format(escape(delimiter)))
+        if rest:
+            body.append("<NextContinuationToken>{}</NextContinuationToken>"
+                        .format(escape(page[-1][0])))
+        for key, size in page:
+            if size is None:
+                body.append("<CommonPrefixes><Prefix>{}</Prefix>"
+                            "</CommonPrefixes>".format(escape(key)))
+            else:
+                body.append(
+                    "<Contents><Key>{}</Key><Size>{}</Size>"
+                    "<LastModified>2020-01-01T00:00:00.000Z</LastModified>"
+                    "<ETag>\"\"</ETag><StorageClass>STANDARD</StorageClass>"
+                    "</Contents>".format(escape(key), size))
+        return self._send(request, "GET",
+                          _xml("ListBucketResult", "".join(body)))
+
+    def _delete_objects(self, request, bucket, body):
+        tree = ElementTree.fromstring(body)
+        keys = [element.text for element in tree.iter()
+                if element.tag.split("}")[-1] == "Key"]
+        # files first, so that the directory markers are empty when deleted
+        for key in sorted(keys, key=lambda key: (key.endswith("/"),
+                                                 -key.count("/"))):
+            self._delete(bucket, key)
+        self._count("delete_objects")
+        return self._send(request, "POST", _xml("DeleteResult", ""))
+
+    def _error(self, request, method, status, code):
+        return self._send(request, method, _xml(
+            "Error", "<Code>{}</Code><Message>{}</Message>".format(
+                code, code)).replace(' xmlns="{}"'.format(XMLNS).encode(
+                    "utf-8"), b""), status=status)
+
+    def _send(self, request, method, data, headers=None, status=200,
+              length=None):
+        request.send_response(status)
+        if data:
+            request.send_header("Content-Type", "application/xml")
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.send_header("Content-Length", str(
+            len(data) if length is None else length))
+        request.end_headers()
+        if method != "HEAD" and status != 204:
+            request.wfile.write(data)
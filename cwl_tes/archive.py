@@ -0,0 +1,115 @@
+"""Staging of large input directories as single archives."""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Set, Text, Tuple  # noqa F401 # pylint: disable=unused-import
+
+import tes
+from six.moves import shlex_quote
+
+COMPRESSION = {"gzip": ("gz", ".tar.gz", "-xzf"), "none": ("", ".tar", "-xf")}
+
+
+class DirectoryArchiver(object):
+    """
+    Upload directories with many files as one tar archive.
+
+    A directory with at least ``threshold`` files is packed into an archive
+    that is uploaded in place of its files, and the Directory object points
+    at the archive. Its listing is filled in from the local copy, so cwltool
+    never lists the remote side. In the TES task the archive is an input
+    file next to the directory path, and a first executor running
+    ``helper_image`` unpacks it into a volume at that path.
+    """
+
+    def __init__(self, threshold, compression="gzip", helper_image="alpine"):
+        # type: (int, Text, Text) -> None
+        self.threshold = threshold
+        self.mode, self.suffix, self.tar_flag = COMPRESSION[compression]
+        self.helper_image = helper_image
+        self._archives = set()  # type: Set[Text]
+        self._tmpdir = None  # type: Optional[Text]
+        self._lock = threading.Lock()
+
+    def __contains__(self, url):  # type: (Text) -> bool
+        return url in self._archives
+
+    def should_pack(self, path):  # type: (Text) -> bool
+        """Whether the directory at path has at least threshold files."""
+        count = 0
+        for _root, _subdirs, files in os.walk(path, followlinks=True):
+            count += len(files)
+            if count >= self.threshold:
+                return True
+        return False
+
+    def pack(self, path):  # type: (Text) -> Text
+        """Archive the directory at path into a temporary file."""
+        with self._lock:
+            if self._tmpdir is None:
+                self._tmpdir = tempfile.mkdtemp(prefix="cwl-tes-archives-")
+        handle, archive = tempfile.mkstemp(
+            suffix=self.suffix, dir=self._tmpdir)
+        os.close(handle)
+        with tarfile.open(archive, "w:" + self.mode) as tar:
+            tar.add(path, arcname=".")
+        return archive
+
+    def register(self, url, path):
+        # type: (Text, Text) -> List[Dict[Text, Any]]
+        """Remember url as an archive of path; return the CWL listing."""
+        with self._lock:
+            self._archives.add(url)
+        return _listing(path, url)
+
+    def cleanup(self):  # type: () -> None
+        """Remove the local archives once they have been uploaded."""
+        with self._lock:
+            tmpdir, self._tmpdir = self._tmpdir, None
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, True)
+
+    def stage(self, task_input):
+        # type: (tes.Input) -> Tuple[tes.Input, Text]
+        """
+        Replace a Directory input that is an archive by the archive file.
+
+        Return the new input and the shell command that unpacks it.
+        """
+        archive = task_input.path.rstrip("/") + self.suffix
+        staged = tes.Input(
+            name=task_input.name,
+            description=task_input.description,
+            url=task_input.url,
+            path=archive,
+            type="FILE")
+        command = "mkdir -p {0} && tar {1} {2} -C {0}".format(
+            shlex_quote(task_input.path), self.tar_flag,
+            shlex_quote(archive))
+        return staged, command
+
+    def executor(self, commands):  # type: (List[Text]) -> tes.Executor
+        """Executor running the given unpack commands."""
+        return tes.Executor(
+            image=self.helper_image,
+            command=["sh", "-c", " && ".join(commands)])
+
+
+def _listing(path, url):  # type: (Text, Text) -> List[Dict[Text, Any]]
+    listing = []  # type: List[Dict[Text, Any]]
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        location = url + "/" + name
+        if os.path.isdir(full_path):
+            listing.append({"class": "Directory", "location": location,
+                            "basename": name,
+                            "listing": _listing(full_path, location)})
+        else:
+            listing.append({"class": "File", "location": location,
+                            "basename": name,
+                            "size": os.path.getsize(full_path)})
+    return listing
@@ -0,0 +1,90 @@
+"""Reuse of the outputs of earlier TES tasks."""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from typing import Any, Dict, Optional, Text  # noqa F401 # pylint: disable=unused-import
+
+import tes  # noqa F401 # pylint: disable=unused-import
+from cwltool.stdfsaccess import StdFsAccess  # noqa F401 # pylint: disable=unused-import
+from cwltool.utils import visit_class
+
+log = logging.getLogger("tes-backend")
+
+# cwltool stages each input in its own stg<uuid4> directory
+STAGING_DIR = re.compile(r"\$\(stagedir\)/stg[0-9a-f-]{36}")
+
+
+def task_key(task,         # type: tes.Task
+             directories,  # type: Dict[Text, Text]
+             checksums     # type: Dict[Text, Text]
+             ):  # type: (...) -> Text
+    """
+    Digest of the content of a TES task, stable across runs.
+
+    The task message is hashed with the per-job directories replaced by
+    placeholders (directories maps paths to placeholders), without the
+    name, description, tags and output URLs, and with each input URL
+    replaced by the checksum of the input where one is known.
+    """
+    msg = json.loads(task.as_json())
+    for field in ("name", "description", "tags"):
+        msg.pop(field, None)
+    for output in msg.get("outputs", []):
+        output.pop("url", None)
+    for task_input in msg.get("inputs", []):
+        task_input.pop("description", None)
+        if task_input.get("url") in checksums:
+            task_input["url"] = checksums[task_input["url"]]
+    text = json.dumps(msg, sort_keys=True, separators=(",", ":"))
+    for path in sorted(directories, key=len, reverse=True):
+        if path:
+            text = text.replace(path.rstrip("/"), directories[path])
+    text = STAGING_DIR.sub("$(stagedir)/stg", text)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TESJobCache(object):
+    """Outputs of successful TES tasks, keyed on task_key()."""
+
+    def __init__(self, directory):  # type: (Text) -> None
+        self.directory = directory
+
+    def _path(self, key):  # type: (Text) -> Text
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key, fs_access):
+        # type: (Text, StdFsAccess) -> Optional[Dict[Text, Any]]
+        """Cached outputs for key, if all of them still exist."""
+        try:
+            with open(self._path(key)) as handle:
+                outputs = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return None
+        missing = []
+
+        def check(obj):  # type: (Dict[Text, Any]) -> None
+            if not fs_access.exists(obj["location"]):
+                missing.append(obj["location"])
+        visit_class(outputs, ("File", "Directory"), check)
+        if missing:
+            log.info("Cached outputs %s are gone, not reusing them", missing)
+            return None
+        return outputs
+
+    def put(self, key, outputs):  # type: (Text, Dict[Text, Any]) -> None
+        """Remember the outputs of the task with the given key."""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+        partial = "{}.{}.partial".format(path, uuid.uuid4())
+        with open(partial, "w") as handle:
+            json.dump(outputs, handle)
+        os.rename(partial, path)
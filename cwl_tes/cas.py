@@ -0,0 +1,130 @@
+"""Content-addressed layout for inputs uploaded to remote storage."""
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import List, Optional, Text, Tuple  # noqa F401 # pylint: disable=unused-import
+
+from six.moves import urllib
+
+from .storage import RemoteFsAccess  # noqa F401 # pylint: disable=unused-import
+
+log = logging.getLogger("tes-backend")
+
+DEFAULT_INDEX = os.path.join(
+    os.path.expanduser("~"), ".cache", "cwl-tes", "uploads.sqlite")
+
+
+def strip_credentials(url):  # type: (Text) -> Text
+    """Drop any user:password@ part from a URL."""
+    parse = urllib.parse.urlsplit(url)
+    if "@" not in parse.netloc:
+        return url
+    return urllib.parse.urlunsplit(
+        parse._replace(netloc=parse.netloc.rsplit("@", 1)[1]))
+
+
+class ContentStore(object):
+    """
+    Store uploaded inputs under <root>/cas/<sha256>/<basename>.
+
+    A local SQLite index maps (path, size, mtime) to the digest of a local
+    file, so unchanged files are not hashed again, and remembers which
+    remote URLs have been fully uploaded, so that they are not uploaded
+    again while they are still there. Uploads only count once commit() is
+    called.
+    """
+
+    def __init__(self, root_url, index_path=DEFAULT_INDEX):
+        # type: (Text, Text) -> None
+        self.root_url = root_url.rstrip("/")
+        index_dir = os.path.dirname(index_path)
+        if index_dir and not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        self.db = sqlite3.connect(index_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, "
+            "size INTEGER, mtime REAL, digest TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads (url TEXT PRIMARY KEY, "
+            "digest TEXT, uploaded REAL)")
+        self.db.commit()
+        self._pending = []  # type: List[Tuple[Text, Text]]
+
+    def url(self, digest, basename):  # type: (Text, Text) -> Text
+        """Remote URL for content with the given digest."""
+        return "/".join((self.root_url, "cas", digest, basename))
+
+    def digest_file(self, path):  # type: (Text) -> Text
+        """SHA-256 of a local file, reusing the index if it is unchanged."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        row = self.db.execute(
+            "SELECT digest FROM digests WHERE path = ? AND size = ? "
+            "AND mtime = ?", (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row:
+            return row[0]
+        checksum = hashlib.sha256()
+        with open(path, mode="rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                checksum.update(chunk)
+        digest = checksum.hexdigest()
+        self.db.execute(
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, digest))
+        self.db.commit()
+        return digest
+
+    def digest_tree(self, path):  # type: (Text) -> Text
+        """SHA-256 over the relative paths and digests of a directory."""
+        checksum = hashlib.sha256()
+        for root, subdirs, files in os.walk(path, followlinks=True):
+            subdirs.sort()
+            for name in sorted(files):
+                full_path = os.path.join(root, name)
+                checksum.update("{}\0{}\n".format(
+                    os.path.relpath(full_path, path),
+                    self.digest_file(full_path)).encode("utf-8"))
+        return checksum.hexdigest()
+
+    def contains(self, url, fs_access, size=None):
+        # type: (Text, RemoteFsAccess, Optional[int]) -> bool
+        """
+        Whether url has been uploaded completely by an earlier commit.
+
+        The index is only trusted if url still exists in remote storage,
+        with the given size if any; otherwise it is dropped from the index.
+        """
+        key = strip_credentials(url)
+        if self.db.execute("SELECT 1 FROM uploads WHERE url = ?",
+                           (key,)).fetchone() is None:
+            return False
+        try:
+            if size is None:
+                present = fs_access.exists(url)
+            else:
+                present = fs_access.size(url) == size
+        except fs_access.errors:
+            present = False
+        if not present:
+            log.info("%s is gone from remote storage, uploading it again",
+                     key)
+            self.db.execute("DELETE FROM uploads WHERE url = ?", (key,))
+            self.db.commit()
+        return present
+
+    def add(self, url, digest):  # type: (Text, Text) -> None
+        """Record an upload of url, to be committed once it has finished."""
+        self._pending.append((strip_credentials(url), digest))
+
+    def commit(self):  # type: () -> None
+        """Mark all uploads added since the last commit as complete."""
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)",
+            [(url, digest, now) for url, digest in self._pending])
+        self.db.commit()
+        self._pending = []
@@ -0,0 +1,27 @@
+"""cwl-tes specific runtime context."""
+from __future__ import absolute_import
+
+from typing import Any, Dict, Optional  # noqa: F401
+
+from cwltool.context import RuntimeContext
+
+
+class TESRuntimeContext(RuntimeContext):
+    """RuntimeContext carrying the services shared by all TES jobs."""
+
+    def __init__(self, kwargs=None):
+        # type: (Optional[Dict[str, Any]]) -> None
+        self.tes_poller = None  # type: Optional[Any]
+        self.tes_submitter = None  # type: Optional[Any]
+        self.tes_max_connections = 10  # type: int
+        self.stream_remote_inputs = False  # type: bool
+        self.download_cache = None  # type: Optional[Any]
+        self.tes_job_cache = None  # type: Optional[Any]
+        self.tes_journal = None  # type: Optional[Any]
+        self.tes_batcher = None  # type: Optional[Any]
+        self.directory_archiver = None  # type: Optional[Any]
+        self.max_inline_content = None  # type: Optional[int]
+        self.tes_metrics = None  # type: Optional[Any]
+        self.tes_output_manifest = None  # type: Optional[Any]
+        self.tes_worker_checksums = None  # type: Optional[Any]
+        super(TESRuntimeContext, self).__init__(kwargs)
@@ -0,0 +1,120 @@
+"""cwl-tes specific job executors."""
+from __future__ import absolute_import
+
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set, Union  # noqa: F401
+from typing_extensions import Text
+
+from cwltool.context import RuntimeContext  # noqa: F401
+from cwltool.errors import WorkflowException
+from cwltool.executors import MultithreadedJobExecutor
+from cwltool.job import JobBase
+from cwltool.process import Process  # noqa: F401
+from cwltool.workflow import WorkflowJob  # noqa: F401
+
+from .tes import TESTask
+
+log = logging.getLogger("tes-backend")
+
+
+class TESJobExecutor(MultithreadedJobExecutor):
+    """
+    Run TES tasks without holding a thread while they are remote.
+
+    A TESTask is submitted from a small worker pool and then parked until the
+    poller reports that the remote task has stopped; output collection is
+    then queued on the same pool. All other jobs run in their own thread as
+    with MultithreadedJobExecutor.
+    """
+
+    def __init__(self, max_workers=None):  # type: (Optional[int]) -> None
+        super(TESJobExecutor, self).__init__()
+        self.workers = ThreadPoolExecutor(max_workers=max_workers)
+        self.remote_jobs = set()  # type: Set[TESTask]
+
+    def run_job(self,
+                job,             # type: Union[JobBase, WorkflowJob, None]
+                runtime_context  # type: RuntimeContext
+                ):  # type: (...) -> None
+        """Park TESTask jobs, run anything else in a thread."""
+        if isinstance(job, TESTask):
+            self.remote_jobs.add(job)
+            self.workers.submit(
+                self._call, job.submit, job, runtime_context,
+                functools.partial(self.workers.submit, self._call, job.finish,
+                                  job, runtime_context, None))
+            job = None
+        super(TESJobExecutor, self).run_job(job, runtime_context)
+
+    def _call(self,
+              method,           # type: Callable[..., None]
+              job,              # type: TESTask
+              runtime_context,  # type: RuntimeContext
+              on_final          # type: Optional[Callable[[], Any]]
+              ):  # type: (...) -> None
+        """
+        Run one phase of a TESTask on a worker thread.
+
+        The job is released once collection has finished (on_final is None)
+        or as soon as any phase fails.
+        """
+        release = on_final is None
+        try:
+            if release:
+                method(runtime_context)
+            else:
+                method(runtime_context, on_final)
+        except WorkflowException as err:
+            log.exception("Got workflow error")
+            self.exceptions.append(err)
+            release = True
+        except Exception as err:  # pylint: disable=broad-except
+            log.exception("Got workflow error")
+            self.exceptions.append(WorkflowException(Text(err)))
+            release = True
+        if release:
+            with runtime_context.workflow_eval_lock:
+                self.remote_jobs.discard(job)
+                runtime_context.workflow_eval_lock.notifyAll()
+
+    def run_jobs(self,
+                 process,           # type: Process
+                 job_order_object,  # type: Dict[Text, Any]
+                 logger,            # type: logging.Logger
+                 runtime_context    # type: RuntimeContext
+                 ):  # type: (...) -> None
+        """
+        Same as MultithreadedJobExecutor.run_jobs, also waiting on remote jobs.
+        """
+        jobiter = process.job(job_order_object, self.output_callback,
+                              runtime_context)
+
+        if runtime_context.workflow_eval_lock is None:
+            raise WorkflowException(
+                "runtimeContext.workflow_eval_lock must not be None")
+
+        runtime_context.workflow_eval_lock.acquire()
+        for job in jobiter:
+            if job is not None:
+                if isinstance(job, JobBase):
+                    job.builder = runtime_context.builder or job.builder
+                    if job.outdir is not None:
+                        self.output_dirs.add(job.outdir)
+
+            self.run_job(job, runtime_context)
+
+            if job is None:
+                if self.threads or self.remote_jobs:
+                    self.wait_for_next_completion(runtime_context)
+                else:
+                    logger.error("Workflow cannot make any more progress.")
+                    break
+
+        self.run_job(None, runtime_context)
+        while self.threads or self.remote_jobs:
+            self.wait_for_next_completion(runtime_context)
+            self.run_job(None, runtime_context)
+
+        runtime_context.workflow_eval_lock.release()
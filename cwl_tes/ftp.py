@@ -1,23 +1,25 @@
 """FTP support"""
 from __future__ import absolute_import
 
-import contextlib
-import fnmatch
 import ftplib
+import functools
+import hashlib
 import logging
 import netrc
-import glob
 import os
-from typing import List, Text  # noqa F401 # pylint: disable=unused-import
+import threading
+import time
+from typing import (Any, Callable, Dict, List,  # noqa F401 # pylint: disable=unused-import
+                    Text)
 
-from six import PY2
 from six.moves import urllib
 from schema_salad.ref_resolver import uri_file_path
 from typing import Tuple, Optional
 
-from cwltool.stdfsaccess import StdFsAccess
 from cwltool.loghandler import _logger
 
+from .storage import RemoteFsAccess
+
 
 def abspath(src, basedir):  # type: (Text, Text) -> Text
     """http(s):, file:, ftp:, and plain path aware absolute path"""
@@ -34,12 +36,227 @@ def abspath(src, basedir):  # type: (Text, Text) -> Text
     return apath
 
 
-class FtpFsAccess(StdFsAccess):
-    """FTP access with upload."""
+def _is_ftp(url):  # type: (Text) -> bool
+    return urllib.parse.urlparse(url).scheme == 'ftp'
+
+
+class FtpConnectionPool(object):
+    """
+    Thread-safe pool of logged in FTP connections.
+
+    Connections are checked out for the duration of one operation, so
+    threads never share a control channel. An idle connection is only
+    checked with a NOOP when it has not been used for idle_timeout seconds;
+    one that fails during an operation is dropped and the operation is
+    retried once on a fresh connection. Operations that must not run twice,
+    such as RNFR/RNTO, are not retried; instead the connection is checked
+    with a NOOP before they start. At most max_per_host connections are open
+    to any one host.
+    """
+
+    def __init__(self, max_per_host=8, idle_timeout=15):
+        # type: (int, float) -> None
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.credentials = {}  # type: Dict[Text, Tuple[Text, Text]]
+        self._idle = {}  # type: Dict[Tuple[Any, ...], List[Tuple[ftplib.FTP, float]]]  # noqa: E501
+        self._open = {}  # type: Dict[Text, int]
+        self._cond = threading.Condition()
+
+    def run(self,
+            host,            # type: Text
+            user,            # type: Text
+            passwd,          # type: Text
+            operation,       # type: Callable[[ftplib.FTP], Any]
+            secure=True,     # type: bool
+            idempotent=True  # type: bool
+            ):  # type: (...) -> Any
+        """Call operation with a connection to host, retrying once if safe."""
+        key = (host, user, passwd, secure)
+        for attempt in range(2):
+            ftp = self.checkout(key, verify=not idempotent)
+            try:
+                result = operation(ftp)
+            except ftplib.error_perm:
+                self.checkin(key, ftp)
+                raise
+            except ftplib.all_errors as err:
+                self.discard(key, ftp)
+                if attempt or not idempotent:
+                    raise
+                _logger.debug("Reconnecting to %s: %s", host, err)
+            else:
+                self.checkin(key, ftp)
+                return result
+        return None
+
+    def checkout(self, key, verify=False):
+        # type: (Tuple[Any, ...], bool) -> ftplib.FTP
+        """
+        Take a connection for key = (host, user, passwd, secure).
+
+        An idle connection is checked with a NOOP first if verify is set or
+        it has not been used for idle_timeout seconds.
+        """
+        host = key[0]
+        with self._cond:
+            while True:
+                if self._idle.get(key):
+                    ftp, last_used = self._idle[key].pop()
+                    break
+                if self._open.get(host, 0) < self.max_per_host:
+                    self._open[host] = self._open.get(host, 0) + 1
+                    ftp, last_used = None, None
+                    break
+                other = [k for k, idle in self._idle.items()
+                         if k[0] == host and idle]
+                if other:
+                    _close(self._idle[other[0]].pop()[0])
+                    ftp, last_used = None, None
+                    break
+                self._cond.wait()
+        if ftp is not None and (
+                verify or time.time() - last_used > self.idle_timeout):
+            try:
+                ftp.voidcmd("NOOP")
+            except ftplib.all_errors:
+                _close(ftp)
+                ftp = None
+        if ftp is None:
+            try:
+                ftp = self._connect(*key)
+            except BaseException:
+                self.discard(key, None)
+                raise
+        return ftp
+
+    def _connect(self, host, user, passwd, secure):
+        # type: (Text, Text, Text, bool) -> ftplib.FTP
+        ftp = ftplib.FTP_TLS()
+        ftp.set_debuglevel(1 if _logger.isEnabledFor(logging.DEBUG) else 0)
+        hostname, _, port = host.partition(":")
+        ftp.connect(hostname, int(port) if port else 0)
+        ftp.login(user, passwd, secure=secure)
+        with self._cond:
+            self.credentials.setdefault(host, (user, passwd))
+        return ftp
+
+    def checkin(self, key, ftp):
+        # type: (Tuple[Any, ...], ftplib.FTP) -> None
+        """Return a healthy connection to the pool."""
+        with self._cond:
+            self._idle.setdefault(key, []).append((ftp, time.time()))
+            self._cond.notify()
+
+    def discard(self, key, ftp):
+        # type: (Tuple[Any, ...], Optional[ftplib.FTP]) -> None
+        """Close a connection that is no longer usable and free its slot."""
+        if ftp is not None:
+            _close(ftp)
+        with self._cond:
+            self._open[key[0]] -= 1
+            self._cond.notify()
+
+
+def _close(ftp):  # type: (ftplib.FTP) -> None
+    try:
+        ftp.close()
+    except ftplib.all_errors:
+        pass
+
+
+class FtpReader(object):
+    """
+    Stream a remote file over a pooled connection.
+
+    Only the bytes actually read are transferred; closing the reader before
+    the end of the file drops the data connection and with it the control
+    connection, which cannot be reused reliably after an aborted RETR.
+    """
+
+    def __init__(self, pool, key, path, offset=0):
+        # type: (FtpConnectionPool, Tuple[Any, ...], Text, int) -> None
+        self.pool = pool
+        self.key = key
+        self.ftp = pool.checkout(key)
+        try:
+            self.ftp.voidcmd("TYPE I")
+            self.conn = self.ftp.transfercmd(
+                "RETR {}".format(path), rest=offset or None)
+        except ftplib.error_perm:
+            pool.checkin(key, self.ftp)
+            raise
+        except BaseException:
+            pool.discard(key, self.ftp)
+            raise
+        self.handle = self.conn.makefile("rb")
+        self.eof = False
+
+    def read(self, size=-1):  # type: (int) -> bytes
+        """Read up to size bytes, or the rest of the file."""
+        data = self.handle.read(size) if size >= 0 else self.handle.read()
+        if not data or size < 0:
+            self.eof = True
+        return data
+
+    def close(self):  # type: () -> None
+        """Release the connection, returning it to the pool if possible."""
+        if self.ftp is None:
+            return
+        self.handle.close()
+        self.conn.close()
+        ftp, self.ftp = self.ftp, None
+        if not self.eof:
+            self.pool.discard(self.key, ftp)
+            return
+        try:
+            ftp.voidresp()
+        except ftplib.all_errors:
+            self.pool.discard(self.key, ftp)
+        else:
+            self.pool.checkin(self.key, ftp)
+
+    def __enter__(self):  # type: () -> FtpReader
+        return self
+
+    def __exit__(self, *args):  # type: (*Any) -> None
+        self.close()
+
+
+def _parse_list_line(line):  # type: (Text) -> Optional[Tuple[Text, Dict]]
+    """Name and MLSD style facts from a Unix style LIST line."""
+    parts = line.split(None, 8)
+    if len(parts) < 9:
+        return None
+    kind = {"d": "dir", "-": "file"}.get(parts[0][0], "other")
+    facts = {"type": kind}
+    if parts[4].isdigit():
+        facts["size"] = parts[4]
+    return parts[8], facts
+
+
+class FtpFsAccess(RemoteFsAccess):
+    """
+    FTP access with upload.
+
+    Directory listings are fetched once per directory, with MLSD or else
+    LIST, when a directory is listed or globbed. Cached listings answer
+    exists/isfile/isdir/size for their entries for the lifetime of this
+    object; lookups in other directories use SIZE and CWD instead of
+    listing them. upload, mkdir and rename invalidate the listings they
+    change.
+    """
+
+    scheme = "ftp"
+    errors = ftplib.all_errors
+
     def __init__(
-            self, basedir, cache=None, insecure=False):  # type: (Text) -> None
+            self, basedir, pool=None, insecure=False):  # type: (Text) -> None
         super(FtpFsAccess, self).__init__(basedir)
-        self.cache = cache or {}
+        self.pool = pool or FtpConnectionPool()
+        self._listings = {}  # type: Dict[Tuple[Text, Text], Optional[Dict[Text, Dict]]]  # noqa: E501
+        self._listings_lock = threading.Lock()
+        self._mlsd = True
         self.netrc = None
         self.insecure = insecure
         try:
@@ -52,16 +269,31 @@ class FtpFsAccess(StdFsAccess):
         except netrc.NetrcParseError as err:
             _logger.debug(err)
 
+    @classmethod
+    def factory(cls, options):
+        # type: (Any) -> Callable[[Text], RemoteFsAccess]
+        return functools.partial(
+            cls, pool=FtpConnectionPool(
+                max_per_host=options.ftp_max_connections),
+            insecure=options.insecure)
+
+    @classmethod
+    def server(cls, url):  # type: (Text) -> Tuple[Any, ...]
+        parse = urllib.parse.urlparse(url)
+        return parse.scheme, parse.hostname, parse.port or ftplib.FTP_PORT
+
     def _parse_url(self, url):
         # type: (Text) -> Tuple[Optional[Text], Optional[Text]]
         parse = urllib.parse.urlparse(url)
         user = parse.username
         passwd = parse.password
         host = parse.hostname
+        if parse.port is not None:
+            host = "{}:{}".format(host, parse.port)
         path = parse.path
         if parse.scheme == 'ftp':
             if not user and self.netrc:
-                creds = self.netrc.authenticators(host)
+                creds = self.netrc.authenticators(parse.hostname)
                 if creds:
                     user, _, passwd = creds
         if not user:
@@ -73,88 +305,98 @@ class FtpFsAccess(StdFsAccess):
 
         return host, user, passwd, path
 
-    def _connect(self, url):  # type: (Text) -> Optional[ftplib.FTP]
-        parse = urllib.parse.urlparse(url)
-        if parse.scheme == 'ftp':
-            host, user, passwd, _ = self._parse_url(url)
-            if (host, user, passwd) in self.cache:
-                if self.cache[(host, user, passwd)].pwd():
-                    return self.cache[(host, user, passwd)]
-            ftp = ftplib.FTP_TLS()
-            ftp.set_debuglevel(1 if _logger.isEnabledFor(logging.DEBUG) else 0)
-            ftp.connect(host)
-            ftp.login(user, passwd, secure=not self.insecure)
-            self.cache[(host, user, passwd)] = ftp
-            return ftp
-        return None
+    def _run(self, url, operation, idempotent=True):
+        # type: (Text, Callable[[ftplib.FTP], Any], bool) -> Any
+        """Call operation with a pooled connection to the host of url."""
+        host, user, passwd, _ = self._parse_url(url)
+        return self.pool.run(host, user, passwd, operation,
+                             secure=not self.insecure, idempotent=idempotent)
+
+    def _key(self, url):  # type: (Text) -> Tuple[Text, Text]
+        host, _, _, path = self._parse_url(url)
+        return host, path.rstrip("/") or "/"
+
+    def _listing(self, url):
+        # type: (Text) -> Optional[Dict[Text, Dict[Text, Text]]]
+        """Entries of the remote directory url, None if it does not exist."""
+        key = self._key(url)
+        with self._listings_lock:
+            if key in self._listings:
+                return self._listings[key]
+
+        def list_dir(ftp):  # type: (ftplib.FTP) -> Dict[Text, Dict]
+            if self._mlsd and hasattr(ftp, "mlsd"):
+                try:
+                    return dict(ftp.mlsd(key[1], facts=["type", "size"]))
+                except ftplib.error_perm as err:
+                    if str(err)[:3] not in ("500", "502"):
+                        raise
+                    self._mlsd = False
+            lines = []  # type: List[Text]
+            ftp.retrlines("LIST {}".format(key[1]), lines.append)
+            return dict(entry for entry in map(_parse_list_line, lines)
+                        if entry)
+        try:
+            listing = self._run(url, list_dir)
+        except ftplib.error_perm:
+            listing = None
+        if listing is not None:
+            listing = {name: facts for name, facts in listing.items()
+                       if name not in (".", "..")
+                       and facts.get("type") not in ("cdir", "pdir")}
+        with self._listings_lock:
+            self._listings[key] = listing
+        return listing
+
+    def _facts(self, url):  # type: (Text) -> Optional[Dict[Text, Text]]
+        """MLSD facts of url from its parent's cached listing, if any."""
+        parent, _, name = url.rstrip("/").rpartition("/")
+        if not name or not urllib.parse.urlparse(parent).path:
+            return None
+        with self._listings_lock:
+            key = self._key(parent)
+            if key not in self._listings:
+                return None
+            listing = self._listings[key]
+        if listing is None:
+            return {"type": "missing"}
+        return listing.get(name, {"type": "missing"})
+
+    def invalidate(self, url=None):  # type: (Optional[Text]) -> None
+        """
+        Forget the cached listings of url's directory and of url and the
+        directories below it, or all listings.
+        """
+        with self._listings_lock:
+            if url is None:
+                self._listings.clear()
+                return
+            host, path = self._key(url)
+            parent = path.rpartition("/")[0] or "/"
+            for key in list(self._listings):
+                if key[0] == host and (
+                        key[1] in (parent, path)
+                        or key[1].startswith(path.rstrip("/") + "/")):
+                    del self._listings[key]
 
     def _abs(self, p):  # type: (Text) -> Text
         return abspath(p, self.basedir)
 
     def _recall_credentials(self, desired_host):
-        for host, user, passwd in self.cache:
-            if desired_host == host:
-                return user, passwd
-        return None, None
+        return self.pool.credentials.get(desired_host, (None, None))
 
     def glob(self, pattern):  # type: (Text) -> List[Text]
         if not self.basedir.startswith("ftp:"):
             return super(FtpFsAccess, self).glob(pattern)
         return self._glob(pattern)
 
-    def _glob0(self, basename, basepath):
-        if basename == '':
-            if self.isdir(basepath):
-                return [basename]
-        else:
-            if self.isfile(self.join(basepath, basename)):
-                return [basename]
-        return []
-
-    def _glob1(self, pattern, basepath=None):
-        try:
-            names = self.listdir(basepath)
-        except ftplib.all_errors:
-            return []
-        if pattern[0] != '.':
-            names = filter(lambda x: x[0] != '.', names)
-        return fnmatch.filter(names, pattern)
-
-    def _glob(self, pattern):  # type: (Text) -> List[Text]
-        if pattern.endswith("/."):
-            pattern = pattern[:-1]
-        dirname, basename = pattern.rsplit('/', 1)
-        if not glob.has_magic(pattern):
-            if basename:
-                if self.exists(pattern):
-                    return [pattern]
-            else:  # Patterns ending in slash should match only directories
-                if self.isdir(dirname):
-                    return [pattern]
-            return []
-        if not dirname:
-            return self._glob1(basename)
-
-        dirs = self._glob(dirname)
-        if glob.has_magic(basename):
-            glob_in_dir = self._glob1
-        else:
-            glob_in_dir = self._glob0
-        results = []
-        for dirname in dirs:
-            results.extend(glob_in_dir(basename, dirname))
-        return results
-
     def open(self, fn, mode):
         if not fn.startswith("ftp:"):
             return super(FtpFsAccess, self).open(fn, mode)
         if 'r' in mode:
             host, user, passwd, path = self._parse_url(fn)
-            handle = urllib.request.urlopen(
-                "ftp://{}:{}@{}/{}".format(user, passwd, host, path))
-            if PY2:
-                return contextlib.closing(handle)
-            return handle
+            return FtpReader(
+                self.pool, (host, user, passwd, not self.insecure), path)
         raise Exception('Write mode FTP not implemented')
 
     def exists(self, fn):  # type: (Text) -> bool
@@ -163,8 +405,10 @@ class FtpFsAccess(StdFsAccess):
         return self.isfile(fn) or self.isdir(fn)
 
     def isfile(self, fn):  # type: (Text) -> bool
-        ftp = self._connect(fn)
-        if ftp:
+        if _is_ftp(fn):
+            facts = self._facts(fn)
+            if facts and facts["type"] in ("file", "dir", "missing"):
+                return facts["type"] == "file"
             try:
                 if not self.size(fn) is None:
                     return True
@@ -175,65 +419,84 @@ class FtpFsAccess(StdFsAccess):
         return super(FtpFsAccess, self).isfile(fn)
 
     def isdir(self, fn):  # type: (Text) -> bool
-        ftp = self._connect(fn)
-        if ftp:
-            try:
+        if _is_ftp(fn):
+            facts = self._facts(fn)
+            if facts and facts["type"] in ("file", "dir", "missing"):
+                return facts["type"] == "dir"
+
+            def change_dir(ftp):  # type: (ftplib.FTP) -> None
                 cwd = ftp.pwd()
                 ftp.cwd(urllib.parse.urlparse(fn).path)
                 ftp.cwd(cwd)
+            try:
+                self._run(fn, change_dir)
                 return True
             except ftplib.all_errors:
                 return False
         return super(FtpFsAccess, self).isdir(fn)
 
     def mkdir(self, url, recursive=True):
-        """Make the directory specified in the URL."""
-        ftp = self._connect(url)
         path = urllib.parse.urlparse(url).path
+        host, key = self._key(url)
+        # only the listings of url and of directories above it that do not
+        # already hold the next directory down change
+        parts = key.split("/")
+        with self._listings_lock:
+            for index in range(1, len(parts) + 1):
+                parent = (host, "/".join(parts[:index]) or "/")
+                listing = self._listings.get(parent)
+                if index < len(parts) and listing and listing.get(
+                        parts[index], {}).get("type") == "dir":
+                    continue
+                self._listings.pop(parent, None)
         if not recursive:
-            return ftp.mkd(path)
-        dirs = [d for d in path.split('/') if d != '']
-        for index, _ in enumerate(dirs):
-            try:
-                ftp.mkd("/".join(dirs[:index+1])+'/')
-            except ftplib.all_errors:
-                pass
+            return self._run(url, lambda ftp: ftp.mkd(path),
+                             idempotent=False)
+
+        def make_dirs(ftp):  # type: (ftplib.FTP) -> None
+            dirs = [d for d in path.split('/') if d != '']
+            for index, _ in enumerate(dirs):
+                try:
+                    ftp.mkd("/".join(dirs[:index+1])+'/')
+                except ftplib.error_perm:
+                    pass
+        self._run(url, make_dirs)
         return None
 
+    def rename(self, src, dst):  # type: (Text, Text) -> None
+        src_path = self._parse_url(src)[3]
+        dst_path = self._parse_url(dst)[3]
+        self._run(src, lambda ftp: ftp.rename(src_path, dst_path),
+                  idempotent=False)
+        self.invalidate(src)
+        self.invalidate(dst)
+
     def listdir(self, fn):  # type: (Text) -> List[Text]
-        ftp = self._connect(fn)
-        if ftp:
+        if _is_ftp(fn):
             host, username, passwd, path = self._parse_url(fn)
             if username != "anonymous":
                 template = "ftp://{un}:{pw}@{0}{1}/{2}"
             else:
                 template = "ftp://{0}{1}/{2}"
+            listing = self._listing(fn)
+            if listing is None:
+                raise ftplib.error_perm(
+                    "550 {} is not a directory".format(path))
             return [template.format(host, path, item, un=username, pw=passwd)
-                    for item in ftp.nlst(path)]
+                    for item in listing]
         return super(FtpFsAccess, self).listdir(fn)
 
-    def join(self, path, *paths):  # type: (Text, *Text) -> Text
-        if path.startswith('ftp:'):
-            result = path
-            for extra_path in paths:
-                if extra_path.startswith('ftp:/'):
-                    result = extra_path
-                else:
-                    result = result + "/" + extra_path
-            return result
-        return super(FtpFsAccess, self).join(path, *paths)
-
-    def realpath(self, path):  # type: (Text) -> Text
-        if path.startswith('ftp:'):
-            return path
-        return os.path.realpath(path)
-
     def size(self, fn):
-        ftp = self._connect(fn)
-        if ftp:
+        if _is_ftp(fn):
+            facts = self._facts(fn)
+            if facts and "size" in facts:
+                return int(facts["size"])
             host, user, passwd, path = self._parse_url(fn)
             try:
-                return ftp.size(path)
+                def binary_size(ftp):  # type: (ftplib.FTP) -> int
+                    ftp.voidcmd("TYPE I")
+                    return ftp.size(path)
+                return self._run(fn, binary_size)
             except ftplib.all_errors:
                 handle = urllib.request.urlopen(
                     "ftp://{}:{}@{}/{}".format(user, passwd, host, path))
@@ -245,7 +508,31 @@ class FtpFsAccess(StdFsAccess):
 
         return super(FtpFsAccess, self).size(fn)
 
-    def upload(self, file_handle, url):
-        """FtpFsAccess specific method to upload a file to the given URL."""
-        ftp = self._connect(url)
-        ftp.storbinary("STOR {}".format(self._parse_url(url)[3]), file_handle)
+    def version(self, url):  # type: (Text) -> Optional[Text]
+        if not _is_ftp(url):
+            return super(FtpFsAccess, self).version(url)
+        path = self._parse_url(url)[3]
+
+        def modified(ftp):  # type: (ftplib.FTP) -> Text
+            ftp.voidcmd("TYPE I")
+            return "{} {}".format(
+                ftp.sendcmd("MDTM {}".format(path)).split()[-1],
+                ftp.size(path))
+        try:
+            return self._run(url, modified)
+        except ftplib.all_errors:
+            # MDTM is an extension that not every server implements
+            return None
+
+    def upload(self, file_handle, url):  # type: (Any, Text) -> Text
+        checksums = []  # type: List[Any]
+
+        def store(ftp):  # type: (ftplib.FTP) -> None
+            file_handle.seek(0)
+            checksums.append(hashlib.sha1())
+            ftp.storbinary(
+                "STOR {}".format(self._parse_url(url)[3]), file_handle,
+                callback=checksums[-1].update)
+        self._run(url, store)
+        self.invalidate(url)
+        return "sha1$" + checksums[-1].hexdigest()
@@ -0,0 +1,63 @@
+"""Journal of submitted TES tasks, for resuming after a crash."""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Text  # noqa F401 # pylint: disable=unused-import
+
+log = logging.getLogger("tes-backend")
+
+
+class TaskJournal(object):
+    """
+    Append-only JSON lines record of TES task submissions and states.
+
+    Every line holds the task key (see cache.task_key), the task ID and
+    whatever changed: the job name, remote storage URL and output directory
+    on submission, the state on each transition. With resume=True the
+    records of earlier runs are loaded, so find() can return the task last
+    submitted for a key by one of them; tasks of the current run are only
+    written out.
+    """
+
+    def __init__(self, path, resume=False):  # type: (Text, bool) -> None
+        self.path = path
+        self._lock = threading.Lock()
+        self._tasks = {}  # type: Dict[Text, Dict[Text, Any]]
+        if resume and os.path.exists(path):
+            with open(path) as handle:
+                for number, line in enumerate(handle, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line may be cut short by a crash
+                        log.warning("Ignoring malformed line %d of %s",
+                                    number, path)
+                        continue
+                    self._update(record)
+            log.info("Loaded %d task(s) from journal %s",
+                     len(self._tasks), path)
+        self._handle = open(path, "a")
+
+    def _update(self, record):  # type: (Dict[Text, Any]) -> None
+        previous = self._tasks.get(record["key"])
+        if previous is None or previous["task_id"] != record["task_id"]:
+            previous = self._tasks[record["key"]] = {}
+        previous.update(record)
+
+    def record(self, key, task_id, **fields):
+        # type: (Text, Text, **Any) -> None
+        """Append a record for the task and flush it to disk."""
+        record = dict(fields, key=key, task_id=task_id, time=time.time())
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            self._handle.write(line + "\n")
+            self._handle.flush()
+
+    def find(self, key):  # type: (Text) -> Optional[Dict[Text, Any]]
+        """Everything an earlier run recorded about its task for key."""
+        with self._lock:
+            return dict(self._tasks[key]) if key in self._tasks else None
@@ -0,0 +1,105 @@
+"""Deferred formatting of large log messages and JSON lines log output."""
+from __future__ import absolute_import
+
+import json
+import logging
+import threading
+from pprint import pformat
+from typing import Any, Text  # noqa F401 # pylint: disable=unused-import
+
+import tes
+
+# containers longer than this are cut short when logged
+MAX_ITEMS = 20
+# formatted messages are cut to this many characters
+MAX_CHARS = 4096
+
+
+def _truncate(obj, max_items, depth=0):  # type: (Any, int, int) -> Any
+    if depth > 8:
+        return "..."
+    if isinstance(obj, tes.models.Base):
+        obj = obj.as_dict()
+    if isinstance(obj, dict):
+        items = sorted(obj.items(), key=lambda item: str(item[0]))
+        truncated = dict((k, _truncate(v, max_items, depth + 1))
+                         for k, v in items[:max_items])
+        if len(items) > max_items:
+            truncated["..."] = "{} more".format(len(items) - max_items)
+        return truncated
+    if isinstance(obj, (list, tuple)):
+        truncated = [_truncate(v, max_items, depth + 1)
+                     for v in obj[:max_items]]
+        if len(obj) > max_items:
+            truncated.append("... {} more".format(len(obj) - max_items))
+        return truncated
+    return obj
+
+
+class LazyPformat(object):
+    """
+    Pretty-print obj only if the log record is emitted.
+
+    Containers are cut to max_items entries and the text to max_chars
+    characters, so the cost does not grow with the size of obj.
+    """
+
+    def __init__(self, obj, max_items=MAX_ITEMS, max_chars=MAX_CHARS):
+        # type: (Any, int, int) -> None
+        self.obj = obj
+        self.max_items = max_items
+        self.max_chars = max_chars
+
+    def __str__(self):  # type: () -> str
+        text = pformat(_truncate(self.obj, self.max_items))
+        if len(text) > self.max_chars:
+            text = "{}... ({} more characters)".format(
+                text[:self.max_chars], len(text) - self.max_chars)
+        return text
+
+
+class TaskSummary(object):
+    """One line description of a tes.Task, formatted on demand."""
+
+    def __init__(self, task):  # type: (tes.Task) -> None
+        self.task = task
+
+    def __str__(self):  # type: () -> str
+        task = self.task
+        return "{} executor(s) [{}], {} input(s), {} output(s)".format(
+            len(task.executors or []),
+            ", ".join(executor.image for executor in task.executors or []),
+            len(task.inputs or []), len(task.outputs or []))
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Write log records to a file as JSON lines.
+
+    Every line holds the time, level, logger and message, plus the job and
+    task_id of the record if it was logged with those as extra fields.
+    """
+
+    def __init__(self, path):  # type: (Text) -> None
+        super(JsonLinesHandler, self).__init__()
+        self._handle = open(path, "a")
+        self._write_lock = threading.Lock()
+
+    def emit(self, record):  # type: (logging.LogRecord) -> None
+        try:
+            entry = {"time": record.created, "level": record.levelname,
+                     "logger": record.name, "message": record.getMessage()}
+            for field in ("job", "task_id", "state"):
+                if hasattr(record, field):
+                    entry[field] = getattr(record, field)
+            line = json.dumps(entry, default=str)
+            with self._write_lock:
+                self._handle.write(line + "\n")
+                self._handle.flush()
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def close(self):  # type: () -> None
+        with self._write_lock:
+            self._handle.close()
+        super(JsonLinesHandler, self).close()
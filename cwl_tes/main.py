@@ -7,7 +7,9 @@ import functools
 import signal
 import sys
 import logging
+import time
 import ftplib
+import io
 import jwt
 import uuid
 from typing import MutableMapping, MutableSequence
@@ -19,20 +21,34 @@ from six import itervalues, StringIO
 
 from ruamel import yaml
 from schema_salad.sourceline import cmap
-from typing import Any, Dict, Tuple, Optional
+from typing import (Any, Dict, List,  # noqa F401 # pylint: disable=unused-import
+                    Set, Tuple, Optional)
 import cwltool.main
 from cwltool.builder import substitute
 from cwltool.context import LoadingContext, RuntimeContext
 from cwltool.process import scandeps, shortname
-from cwltool.executors import (MultithreadedJobExecutor, SingleJobExecutor,
-                               JobExecutor)
+from cwltool.executors import SingleJobExecutor, JobExecutor
 from cwltool.resolver import ga4gh_tool_registries
 from cwltool.pathmapper import visit_class
 from cwltool.process import Process
 
-from .tes import make_tes_tool, TESPathMapper
+from .tes import (make_tes_tool, get_client, DownloadCache, TESPathMapper,
+                  TESTaskPoller, TaskSubmitter, TaskBatcher, PollSchedule)
+from .context import TESRuntimeContext
+from .executors import TESJobExecutor
 from .__init__ import __version__
+from .cache import TESJobCache
+from .archive import COMPRESSION, DirectoryArchiver
+from .cas import ContentStore, DEFAULT_INDEX
+from .journal import TaskJournal
+from .logging_utils import JsonLinesHandler
+from .manifest import OutputManifest, WorkerChecksums
+from .metrics import Metrics
+from .payload import TaskEncoder
+from .profiling import MODES as PROFILE_MODES, Profiler
 from .ftp import FtpFsAccess
+from .storage import Uploader, get_backend
+from .storage import RemoteFsAccess  # noqa F401 # pylint: disable=unused-import
 
 log = logging.getLogger("tes-backend")
 log.setLevel(logging.INFO)
@@ -55,12 +71,21 @@ def versionstring():
     return "%s %s with cwltool %s" % (sys.argv[0], __version__, cwltool_ver)
 
 
-def ftp_upload(base_url, fs_access, cwl_obj):
-    # type: (Text, FtpFsAccess, Dict[Text, Any]) -> None
+def ftp_upload(base_url,       # type: Text
+               fs_access,      # type: RemoteFsAccess
+               cwl_obj,        # type: Dict[Text, Any]
+               uploader=None,  # type: Optional[Uploader]
+               store=None,     # type: Optional[ContentStore]
+               archiver=None   # type: Optional[DirectoryArchiver]
+               ):  # type: (...) -> None
     """
-    Upload a File or Directory to the given FTP URL;
+    Upload a File or Directory to the given remote storage URL;
 
-    Update the location URL to match.
+    Update the location URL to match. File transfers are queued on the
+    uploader, if given, instead of being made in the calling thread. With a
+    content store the object is placed in its content-addressed location
+    instead, and skipped if an earlier run already uploaded it. Directories
+    that the archiver, if given, chooses to pack are uploaded as one archive.
     """
     if "path" not in cwl_obj and not (
             "location" in cwl_obj and cwl_obj["location"].startswith(
@@ -74,6 +99,37 @@ def ftp_upload(base_url, fs_access, cwl_obj):
         raise ValueError("Passed a directory but Class is not Directory")
     if not is_dir and cwl_obj["class"] != "File":
         raise ValueError("Passed a file but Class is not File")
+    if is_dir and archiver is not None and archiver.should_pack(path):
+        _upload_archive(base_url, fs_access, cwl_obj, path, uploader, store,
+                        archiver)
+        return
+    if store is not None:
+        digest = store.digest_tree(path) if is_dir \
+            else store.digest_file(path)
+        target = store.url(digest, basename)
+        cwl_obj["location"] = target
+        cwl_obj.pop("path", None)
+        if is_dir:
+            cwl_obj.pop("listing", None)
+        if store.contains(target, fs_access,
+                          None if is_dir else os.path.getsize(path)) or (
+                uploader is not None and target in uploader):
+            return
+        if is_dir:
+            for root, _subdirs, files in os.walk(path, followlinks=True):
+                relative = os.path.relpath(root, path)
+                root_path = target if relative == os.curdir \
+                    else fs_access.join(target, relative)
+                fs_access.mkdir(root_path)
+                for each_file in files:
+                    _upload_file(fs_access, uploader,
+                                 os.path.join(root, each_file),
+                                 root_path + '/' + each_file)
+        else:
+            fs_access.mkdir(target.rsplit("/", 1)[0])
+            _upload_file(fs_access, uploader, path, target, cwl_obj)
+        store.add(target, digest)
+        return
     try:
         fs_access.mkdir(base_url)
     except ftplib.all_errors:
@@ -85,22 +141,78 @@ def ftp_upload(base_url, fs_access, cwl_obj):
     cwl_obj.pop("path", None)
     if is_dir:
         if fs_access.isdir(fs_access.join(base_url, basename)):
-            log.warning("FTP upload, Directory %s already exists", basename)
+            log.warning("Upload, Directory %s already exists", basename)
         else:
             for root, _subdirs, files in os.walk(path, followlinks=True):
                 root_path = base_url + '/' + root[len(dirname):]
                 fs_access.mkdir(root_path)
                 for each_file in files:
-                    with open(os.path.join(root,
-                                           each_file), mode="rb") as source:
-                        fs_access.upload(source, root_path + '/' + each_file)
+                    _upload_file(fs_access, uploader,
+                                 os.path.join(root, each_file),
+                                 root_path + '/' + each_file)
         cwl_obj.pop("listing", None)
     else:
-        if fs_access.isfile(fs_access.join(base_url, basename)):
-            log.warning("FTP upload, file %s already exists", basename)
+        if fs_access.isfile(fs_access.join(base_url, basename)) or (
+                uploader is not None and cwl_obj["location"] in uploader):
+            log.warning("Upload, file %s already exists", basename)
         else:
-            with open(path, mode="rb") as source:
-                fs_access.upload(source, cwl_obj["location"])
+            _upload_file(fs_access, uploader, path, cwl_obj["location"],
+                         cwl_obj)
+
+
+def _upload_archive(base_url,  # type: Text
+                    fs_access,  # type: RemoteFsAccess
+                    cwl_obj,   # type: Dict[Text, Any]
+                    path,      # type: Text
+                    uploader,  # type: Optional[Uploader]
+                    store,     # type: Optional[ContentStore]
+                    archiver   # type: DirectoryArchiver
+                    ):  # type: (...) -> None
+    """Upload the directory at path as one archive, unless already there."""
+    basename = os.path.basename(path) + archiver.suffix
+    if store is not None:
+        digest = store.digest_tree(path)
+        target = store.url(digest, basename)
+        exists = store.contains(target, fs_access)
+        remote_dir = target.rsplit("/", 1)[0]
+    else:
+        remote_dir = base_url
+        target = base_url + '/' + basename
+        exists = fs_access.isfile(target)
+    cwl_obj["location"] = target
+    cwl_obj.pop("path", None)
+    cwl_obj["listing"] = archiver.register(target, path)
+    if exists or (uploader is not None and target in uploader):
+        if store is None:
+            log.warning("Upload, archive %s already exists", basename)
+        return
+    log.info("Uploading directory %s as archive %s", path, basename)
+    try:
+        fs_access.mkdir(remote_dir)
+    except ftplib.all_errors:
+        pass
+    _upload_file(fs_access, uploader, archiver.pack(path), target)
+    if store is not None:
+        store.add(target, digest)
+
+
+def _upload_file(fs_access,    # type: RemoteFsAccess
+                 uploader,     # type: Optional[Uploader]
+                 path,         # type: Text
+                 url,          # type: Text
+                 cwl_obj=None  # type: Optional[Dict[Text, Any]]
+                 ):  # type: (...) -> None
+    """Upload path to url, recording its checksum in cwl_obj if given."""
+    on_checksum = None
+    if cwl_obj is not None:
+        on_checksum = functools.partial(cwl_obj.__setitem__, "checksum")
+    if uploader is not None:
+        uploader.upload(path, url, on_checksum)
+        return
+    with open(path, mode="rb") as source:
+        checksum = fs_access.upload(source, url)
+    if on_checksum is not None:
+        on_checksum(checksum)
 
 
 def main(args=None):
@@ -132,64 +244,156 @@ def main(args=None):
         except Exception:
             raise Exception('Token is not valid')
 
+    if parsed_args.resume and not parsed_args.journal:
+        parser.print_usage()
+        print("cwl-tes: error: argument --resume requires --journal")
+        return 1
+
+    storage = FtpFsAccess
+    try:
+        if parsed_args.remote_storage_url:
+            storage = get_backend(parsed_args.remote_storage_url)
+        make_fs_access = storage.factory(parsed_args)
+    except (ValueError, ImportError) as err:
+        parser.print_usage()
+        print("cwl-tes: error: argument --remote-storage-url: {}".format(err))
+        return 1
+
+    if parsed_args.remote_output_url and (
+            not parsed_args.remote_storage_url
+            or storage.server(parsed_args.remote_output_url)
+            != storage.server(parsed_args.remote_storage_url)):
+        parser.print_usage()
+        print("cwl-tes: error: argument --remote-output-url must be on the "
+              "storage server of --remote-storage-url")
+        return 1
+
     if parsed_args.quiet:
         log.setLevel(logging.WARN)
     if parsed_args.debug:
         log.setLevel(logging.DEBUG)
+    if parsed_args.log_json:
+        log.addHandler(JsonLinesHandler(parsed_args.log_json))
 
-    def signal_handler(*args):  # pylint: disable=unused-argument
+    interrupted = []
+
+    signal_names = {signal.SIGINT: "SIGINT", signal.SIGTERM: "SIGTERM"}
+
+    def signal_handler(signum, frame):  # pylint: disable=unused-argument
         """setup signal handler"""
+        if interrupted:
+            log.warning("interrupted while canceling, remote TES task(s) "
+                        "may keep running")
+            sys.exit(1)
+        interrupted.append(True)
         log.info(
-            "recieved control-c signal"
+            "received %s signal", signal_names.get(signum, signum)
         )
         log.info(
             "terminating thread(s)..."
         )
-        log.warning(
-            "remote TES task(s) will keep running"
-        )
+        task_ids = runtime_context.tes_poller.task_ids()
+        canceled = runtime_context.tes_poller.cancel_all()
+        if canceled < len(task_ids):
+            log.warning(
+                "%d remote TES task(s) will keep running",
+                len(task_ids) - canceled
+            )
         sys.exit(1)
-    signal.signal(signal.SIGINT, signal_handler)
-
-    ftp_cache = {}
 
-    class CachingFtpFsAccess(FtpFsAccess):
-        """Ensures that the FTP connection cache is shared."""
-        def __init__(self, basedir, insecure=False):
-            super(CachingFtpFsAccess, self).__init__(
-                basedir, ftp_cache, insecure=insecure)
-
-    ftp_fs_access = CachingFtpFsAccess(
-        os.curdir, insecure=parsed_args.insecure)
+    # instances made by make_fs_access share their connections
+    storage_access = make_fs_access(os.curdir)
+    content_store = None
+    if parsed_args.remote_storage_url and parsed_args.remote_storage_cas:
+        content_store = ContentStore(
+            parsed_args.remote_storage_url, parsed_args.cas_index)
     if parsed_args.remote_storage_url:
-        parsed_args.remote_storage_url = ftp_fs_access.join(
+        parsed_args.remote_storage_url = storage_access.join(
             parsed_args.remote_storage_url, str(uuid.uuid4()))
     loading_context = cwltool.main.LoadingContext(vars(parsed_args))
     loading_context.construct_tool_object = functools.partial(
         make_tes_tool, url=parsed_args.tes,
         remote_storage_url=parsed_args.remote_storage_url,
         token=parsed_args.token,user=parsed_args.user,password=parsed_args.password)
-    runtime_context = cwltool.main.RuntimeContext(vars(parsed_args))
-    runtime_context.make_fs_access = functools.partial(
-        CachingFtpFsAccess, insecure=parsed_args.insecure)
+    runtime_context = TESRuntimeContext(vars(parsed_args))
+    runtime_context.tes_metrics = Metrics()
+    if parsed_args.metrics_port is not None:
+        runtime_context.tes_metrics.serve(parsed_args.metrics_port)
+    tes_client = get_client(
+        parsed_args.tes, token=parsed_args.token, user=parsed_args.user,
+        password=parsed_args.password,
+        max_connections=parsed_args.tes_max_connections,
+        encoder=TaskEncoder(max_size=parsed_args.max_task_size,
+                            compress=parsed_args.compress_requests))
+    runtime_context.tes_poller = TESTaskPoller(tes_client, PollSchedule(
+        min_interval=parsed_args.poll_interval,
+        max_interval=parsed_args.max_poll_interval))
+    runtime_context.tes_submitter = TaskSubmitter(
+        tes_client, max_rate=parsed_args.max_submit_rate,
+        max_inflight=parsed_args.max_inflight_tasks)
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    if parsed_args.cachedir:
+        runtime_context.tes_job_cache = TESJobCache(
+            os.path.abspath(parsed_args.cachedir))
+    if parsed_args.journal:
+        runtime_context.tes_journal = TaskJournal(
+            parsed_args.journal, resume=parsed_args.resume)
+    if parsed_args.tes_batch_size > 1:
+        runtime_context.tes_batcher = TaskBatcher(
+            runtime_context.tes_submitter, runtime_context.tes_poller,
+            parsed_args.tes_batch_size, linger=parsed_args.tes_batch_linger)
+    if parsed_args.archive_directories:
+        runtime_context.directory_archiver = DirectoryArchiver(
+            parsed_args.archive_directories,
+            compression=parsed_args.archive_compression,
+            helper_image=parsed_args.helper_image)
+    if parsed_args.output_manifest:
+        runtime_context.tes_output_manifest = OutputManifest(
+            helper_image=parsed_args.helper_image)
+    if parsed_args.worker_checksums or parsed_args.output_manifest:
+        runtime_context.tes_worker_checksums = WorkerChecksums(
+            helper_image=parsed_args.helper_image,
+            jobs=parsed_args.worker_checksum_jobs)
+    runtime_context.download_cache = DownloadCache(
+        parsed_args.download_cache_dir,
+        max_bytes=int(parsed_args.download_cache_size * 2**30))
+    runtime_context.make_fs_access = make_fs_access
     runtime_context.path_mapper = functools.partial(
-        TESPathMapper, fs_access=ftp_fs_access)
-    job_executor = MultithreadedJobExecutor() if parsed_args.parallel \
+        TESPathMapper, fs_access=storage_access)
+    job_executor = TESJobExecutor() if parsed_args.parallel \
         else SingleJobExecutor()
     job_executor.max_ram = job_executor.max_cores = float("inf")
+    uploader = Uploader(
+        storage_access, workers=parsed_args.ftp_upload_workers)
     executor = functools.partial(
         tes_execute, job_executor=job_executor,
         loading_context=loading_context,
         remote_storage_url=parsed_args.remote_storage_url,
-        ftp_access=ftp_fs_access)
-    return cwltool.main.main(
-        args=parsed_args,
-        executor=executor,
-        loadingContext=loading_context,
-        runtimeContext=runtime_context,
-        versionfunc=versionstring,
-        logger_handler=console
-    )
+        ftp_access=storage_access, ftp_uploader=uploader,
+        content_store=content_store,
+        archiver=runtime_context.directory_archiver,
+        remote_output_url=parsed_args.remote_output_url)
+    if parsed_args.profile:
+        executor = Profiler(
+            parsed_args.profile_output or "cwl-tes.{}".format(
+                "pstats" if parsed_args.profile == "cprofile" else "folded"),
+            mode=parsed_args.profile).wrap(executor)
+    try:
+        return cwltool.main.main(
+            args=parsed_args,
+            executor=executor,
+            loadingContext=loading_context,
+            runtimeContext=runtime_context,
+            versionfunc=versionstring,
+            logger_handler=console
+        )
+    finally:
+        if parsed_args.profile:
+            runtime_context.tes_metrics.log_totals()
+        if parsed_args.metrics_summary:
+            runtime_context.tes_metrics.write_summary(
+                parsed_args.metrics_summary)
 
 
 def tes_execute(process,           # type: Process
@@ -199,16 +403,26 @@ def tes_execute(process,           # type: Process
                 loading_context,   # type: LoadingContext
                 remote_storage_url,
                 ftp_access,
+                ftp_uploader=None,  # type: Optional[Uploader]
+                content_store=None,  # type: Optional[ContentStore]
+                archiver=None,  # type: Optional[DirectoryArchiver]
+                remote_output_url=None,  # type: Optional[Text]
                 logger=log
                 ):  # type: (...) -> Tuple[Optional[Dict[Text, Any]], Text]
     """
     Upload to the remote_storage_url (if needed) and execute.
 
+    With remote_output_url, the final outputs are moved there instead of
+    into the output directory.
+
     Adapted from:
     https://github.com/curoverse/arvados/blob/2b0b06579199967eca3d44d955ad64195d2db3c3/sdk/cwl/arvados_cwl/__init__.py#L407
     """
+    metrics = getattr(runtime_context, "tes_metrics", None) or Metrics()
     if remote_storage_url:
-        upload_workflow_deps_ftp(process, remote_storage_url, ftp_access)
+        upload_start = time.time()
+        upload_workflow_deps_ftp(process, remote_storage_url, ftp_access,
+                                 ftp_uploader, content_store, archiver)
         # Reload tool object which may have been updated by
         # upload_workflow_deps
         # Don't validate this time because it will just print redundant errors.
@@ -220,14 +434,34 @@ def tes_execute(process,           # type: Process
         process = loading_context.construct_tool_object(
             process.doc_loader.idx[process.tool["id"]], loading_context)
         job_order = upload_job_order_ftp(
-            process, job_order, remote_storage_url, ftp_access)
+            process, job_order, remote_storage_url, ftp_access, ftp_uploader,
+            content_store, archiver)
+        if ftp_uploader is not None:
+            ftp_uploader.wait()
+        if content_store is not None:
+            content_store.commit()
+        if archiver is not None:
+            archiver.cleanup()
+        metrics.observe("upload", time.time() - upload_start)
 
     if not job_executor:
-        job_executor = MultithreadedJobExecutor()
-    return job_executor(process, job_order, runtime_context, logger)
-
-
-def upload_workflow_deps_ftp(process, remote_storage_url, ftp_access):
+        job_executor = TESJobExecutor()
+    if not remote_output_url:
+        return job_executor(process, job_order, runtime_context, logger)
+    # keep cwltool from relocating the outputs to the output directory
+    runtime_context = runtime_context.copy()
+    runtime_context.outdir = None
+    outputs, status = job_executor(
+        process, job_order, runtime_context, logger)
+    if outputs is not None:
+        with metrics.timer("relocate"):
+            relocate_outputs_ftp(outputs, remote_storage_url,
+                                 remote_output_url, ftp_access)
+    return outputs, status
+
+
+def upload_workflow_deps_ftp(process, remote_storage_url, ftp_access,
+                             uploader=None, store=None, archiver=None):
     """
     Ensure that all default files in this workflow are uploaded.
 
@@ -239,13 +473,15 @@ def upload_workflow_deps_ftp(process, remote_storage_url, ftp_access):
     def upload_tool_deps(deptool):
         if "id" in deptool:
             upload_dependencies_ftp(document_loader, deptool, deptool["id"],
-                                    True, remote_storage_url, ftp_access)
+                                    True, remote_storage_url, ftp_access,
+                                    uploader, store, archiver)
             document_loader.idx[deptool["id"]] = deptool
     process.visit(upload_tool_deps)
 
 
 def upload_dependencies_ftp(document_loader, workflowobj, uri, loadref_run,
-                            remote_storage_url, ftp_access):
+                            remote_storage_url, ftp_access, uploader=None,
+                            store=None, archiver=None):
     """
     Upload the dependencies of the workflowobj document to an FTP location.
 
@@ -320,14 +556,13 @@ def upload_dependencies_ftp(document_loader, workflowobj, uri, loadref_run,
         # files that need to be uploaded.
         if not entry.startswith("file:"):
             del discovered[entry]
-    visit_class(workflowobj, ("Directory"), functools.partial(
-        ftp_upload, remote_storage_url, ftp_access))
-    visit_class(workflowobj, ("File"), functools.partial(
-        ftp_upload, remote_storage_url, ftp_access))
-    visit_class(discovered, ("Directory"), functools.partial(
-        ftp_upload, remote_storage_url, ftp_access))
-    visit_class(discovered, ("File"), functools.partial(
-        ftp_upload, remote_storage_url, ftp_access))
+    upload = functools.partial(
+        ftp_upload, remote_storage_url, ftp_access, uploader=uploader,
+        store=store, archiver=archiver)
+    visit_class(workflowobj, ("Directory"), upload)
+    visit_class(workflowobj, ("File"), upload)
+    visit_class(discovered, ("Directory"), upload)
+    visit_class(discovered, ("File"), upload)
 
 
 def find_defaults(item, operation):
@@ -381,7 +616,8 @@ def set_secondary(typedef, fileobj, discovered):
             set_secondary(typedef, entry, discovered)
 
 
-def upload_job_order_ftp(process, job_order, remote_storage_url, ftp_access):
+def upload_job_order_ftp(process, job_order, remote_storage_url, ftp_access,
+                         uploader=None, store=None, archiver=None):
     """
     Upload local files referenced in the input object and return updated input
     object with 'location' updated to new URIs.
@@ -392,7 +628,8 @@ def upload_job_order_ftp(process, job_order, remote_storage_url, ftp_access):
     discover_secondary_files(process.tool["inputs"], job_order)
     upload_dependencies_ftp(process.doc_loader, job_order,
                             job_order.get("id", "#"), False,
-                            remote_storage_url, ftp_access)
+                            remote_storage_url, ftp_access, uploader, store,
+                            archiver)
     if "id" in job_order:
         del job_order["id"]
     # Need to filter this out, gets added by cwltool when providing
@@ -402,6 +639,115 @@ def upload_job_order_ftp(process, job_order, remote_storage_url, ftp_access):
     return job_order
 
 
+def relocate_outputs_ftp(outputs, remote_storage_url, remote_output_url,
+                         ftp_access):
+    # type: (Dict[Text, Any], Text, Text, RemoteFsAccess) -> Dict[Text, Any]
+    """
+    Move the final outputs to remote_output_url with server-side renames.
+
+    Files and directories written by the TES tasks of this run are renamed
+    on the storage server, literal files are uploaded and anything else, such
+    as an input passed through, keeps its location. A name that is taken
+    gets a _2, _3, ... suffix, and the secondaryFiles of a file get the
+    same one. Updates the locations in outputs in place.
+    """
+    task_outputs = ftp_access.join(remote_storage_url, "output_")
+    entries = []  # type: List[Dict[Text, Any]]
+    secondary = set()  # type: Set[int]
+
+    def collect(obj):  # type: (Any) -> None
+        if isinstance(obj, MutableMapping):
+            if obj.get("class") in ("File", "Directory"):
+                entries.append(obj)
+                children = obj.get("secondaryFiles", [])
+                secondary.update(id(child) for child in children)
+                if obj["location"].startswith("_:"):
+                    children = children + obj.get("listing", [])
+                for child in children:
+                    collect(child)
+            else:
+                for value in itervalues(obj):
+                    collect(value)
+        elif isinstance(obj, MutableSequence):
+            for value in obj:
+                collect(value)
+    collect(outputs)
+
+    moved = {}  # type: Dict[Text, Text]
+
+    def new_location(location):  # type: (Text) -> Optional[Text]
+        for src, dst in moved.items():
+            if location == src or location.startswith(src + "/"):
+                return dst + location[len(src):]
+        return None
+
+    def with_secondary_files(obj):
+        # type: (Dict[Text, Any]) -> List[Dict[Text, Any]]
+        group = [obj]
+        for child in obj.get("secondaryFiles", []):
+            group.extend(with_secondary_files(child))
+        return group
+
+    def suffixed(basename, primary, index):  # type: (Text, Text, int) -> Text
+        """basename with the suffix index, renamed along with primary."""
+        if index == 1:
+            return basename
+        root, ext = os.path.splitext(primary)
+        if not basename.startswith(root):
+            root, ext = os.path.splitext(basename)
+            return "{}_{}{}".format(root, index, ext)
+        # keep secondaryFiles patterns such as ".bai" and "^.bai" working
+        return "{}_{}{}".format(root, index, basename[len(root):])
+
+    taken = set()  # type: Set[Text]
+
+    def destinations(basenames):  # type: (List[Text]) -> List[Text]
+        """Free URLs for basenames, all with the same suffix."""
+        index = 1
+        while True:
+            urls = [ftp_access.join(
+                remote_output_url, suffixed(basename, basenames[0], index))
+                    for basename in basenames]
+            if not any(url in taken or ftp_access.isfile(url)
+                       or ftp_access.isdir(url) for url in urls):
+                taken.update(urls)
+                return urls
+            index += 1
+
+    def movable(obj):  # type: (Dict[Text, Any]) -> bool
+        location = obj["location"]
+        return new_location(location) is None and (
+            location.startswith(task_outputs)
+            or (location.startswith("_:") and "contents" in obj))
+
+    ftp_access.mkdir(remote_output_url)
+    # directories first, so that the files in them move along
+    for entry in sorted(entries, key=lambda obj: obj["class"] != "Directory"):
+        if id(entry) in secondary:
+            continue
+        group = [obj for obj in with_secondary_files(entry) if movable(obj)]
+        if not group:
+            continue
+        urls = destinations([obj["basename"] for obj in group])
+        for obj, url in zip(group, urls):
+            location = obj["location"]
+            if location.startswith(task_outputs):
+                log.debug("Moving %s to %s", location, url)
+                ftp_access.rename(location, url)
+            else:
+                ftp_access.upload(
+                    io.BytesIO(obj["contents"].encode("utf-8")), url)
+                del obj["contents"]
+            moved[location] = url
+
+    def relocate(obj):  # type: (Dict[Text, Any]) -> None
+        location = new_location(obj["location"])
+        if location is not None:
+            obj["location"] = location
+    visit_class(outputs, ("File", "Directory"), relocate)
+    return outputs
+
+
 def arg_parser():  # type: () -> argparse.ArgumentParser
     parser = argparse.ArgumentParser(
         description='GA4GH TES executor for Common Workflow Language.')
@@ -410,13 +756,139 @@ def arg_parser():  # type: () -> argparse.ArgumentParser
     parser.add_argument("--outdir",
                         type=Text, default=os.path.abspath('.'),
                         help="Output directory, default current directory")
-    parser.add_argument("--remote-storage-url", type=str)
+    parser.add_argument("--remote-storage-url", type=str,
+                        help="Upload inputs to and collect outputs from this "
+                        "ftp://, s3:// or file:// URL; a file:// URL must be "
+                        "on a file system shared with the TES workers.")
     parser.add_argument("--insecure", action="store_true",
                         help=("Connect securely to FTP server (ignored when "
                               "--remote-storage-url is not set)"))
+    parser.add_argument("--remote-storage-cas", action="store_true",
+                        help="Upload inputs to content-addressed locations "
+                        "under --remote-storage-url and skip those already "
+                        "uploaded by an earlier run.")
+    parser.add_argument("--cas-index", type=str, default=DEFAULT_INDEX,
+                        help="Local index of digests and uploads used by "
+                        "--remote-storage-cas, default %s" % DEFAULT_INDEX)
+    parser.add_argument("--remote-output-url", type=str, default=None,
+                        help="Leave the final outputs in remote storage: "
+                        "move them to this URL on the --remote-storage-url "
+                        "server with server-side renames and report their "
+                        "URLs, instead of downloading them to --outdir.")
+    parser.add_argument("--journal", type=str,
+                        help="Record submitted TES tasks in this file, so "
+                        "that a later run can --resume them.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Re-attach to the tasks recorded in --journal "
+                        "that have not failed instead of submitting them "
+                        "again.")
+    parser.add_argument("--archive-directories", type=int, default=0,
+                        metavar="FILES",
+                        help="Upload input directories with at least this "
+                        "many files as one archive that the TES task "
+                        "unpacks, default 0 (never).")
+    parser.add_argument("--archive-compression", choices=sorted(COMPRESSION),
+                        default="gzip",
+                        help="Compression of --archive-directories archives, "
+                        "default gzip.")
+    parser.add_argument("--helper-image", type=str, default="alpine",
+                        help="Image with sh, tar and sha1sum used to unpack "
+                        "--archive-directories archives and by "
+                        "--output-manifest and --worker-checksums, default "
+                        "alpine.")
+    parser.add_argument("--output-manifest", action="store_true",
+                        help="Have every TES task write a manifest of its "
+                        "output directory with sizes and checksums, and "
+                        "collect outputs from it instead of listing and "
+                        "reading --remote-storage-url. Implies "
+                        "--worker-checksums.")
+    parser.add_argument("--worker-checksums", action="store_true",
+                        help="Have every TES task compute the checksums of "
+                        "its output files, instead of reading them back "
+                        "after the task.")
+    parser.add_argument("--worker-checksum-jobs", type=int, default=4,
+                        help="Number of files --worker-checksums hashes in "
+                        "parallel, default 4.")
+    parser.add_argument("--stream-remote-inputs", action="store_true",
+                        help="Pass http(s)://, ftp:// and s3:// inputs to TES "
+                        "as URLs instead of downloading them first.")
+    parser.add_argument("--download-cache-dir", type=str,
+                        help="Where remote inputs that are needed locally "
+                        "are cached, default ~/.cache/cwl-tes/downloads")
+    parser.add_argument("--download-cache-size", type=float, default=10,
+                        help="Maximum size of --download-cache-dir in GiB, "
+                        "default 10.")
+    parser.add_argument("--ftp-upload-workers", type=int, default=4,
+                        help="Number of files uploaded to "
+                        "--remote-storage-url in parallel, default 4.")
+    parser.add_argument("--ftp-max-connections", type=int, default=8,
+                        help="Maximum number of FTP connections kept open "
+                        "to any one host, default 8.")
+    parser.add_argument("--s3-endpoint-url", type=str, default=None,
+                        help="Endpoint of an S3 compatible server, such as "
+                        "MinIO, for s3:// URLs; default AWS. Credentials are "
+                        "those of the AWS command line tools.")
+    parser.add_argument("--s3-part-size", type=int, default=8,
+                        help="Size in MiB of the parts of S3 multipart "
+                        "uploads and of ranged S3 reads, default 8.")
+    parser.add_argument("--s3-transfer-threads", type=int, default=4,
+                        help="Number of parts of one file transferred to or "
+                        "copied on S3 in parallel, default 4.")
     parser.add_argument("--user", type=str, help="Funnel basic auth user.")
     parser.add_argument("--password", type=str, help="Funnel basic auth password.")
     parser.add_argument("--token", type=str)
+    parser.add_argument("--tes-max-connections", type=int, default=10,
+                        help="Maximum number of concurrent keep-alive "
+                        "connections to the TES server, default 10.")
+    parser.add_argument("--max-submit-rate", type=float, default=None,
+                        help="Maximum number of tasks submitted to the TES "
+                        "server per second, default unlimited.")
+    parser.add_argument("--poll-interval", type=float, default=1,
+                        help="Seconds between polls of a TES task that is "
+                        "queued or about to finish, default 1.")
+    parser.add_argument("--max-poll-interval", type=float, default=60,
+                        help="Upper bound on the seconds between polls of a "
+                        "long running TES task, default 60.")
+    parser.add_argument("--max-inflight-tasks", type=int, default=None,
+                        help="Maximum number of submitted TES tasks that may "
+                        "be unfinished at once, default unlimited.")
+    parser.add_argument("--tes-batch-size", type=int, default=1,
+                        help="Pack up to this many jobs with the same images "
+                        "and resources into one TES task, default 1 (no "
+                        "batching).")
+    parser.add_argument("--tes-batch-linger", type=float, default=2.0,
+                        help="Seconds to wait for more jobs before a partial "
+                        "batch is submitted, default 2.")
+    parser.add_argument("--max-task-size", type=int, default=None,
+                        metavar="BYTES",
+                        help="Refuse to submit TES tasks whose CreateTask "
+                        "body is larger than this, default unlimited.")
+    parser.add_argument("--compress-requests", action="store_true",
+                        help="Send large CreateTask bodies gzipped, unless "
+                        "the TES server refuses them.")
+    parser.add_argument("--max-inline-content", type=int, default=None,
+                        metavar="BYTES",
+                        help="Upload literal file contents of this size or "
+                        "more to --remote-storage-url instead of sending "
+                        "them in the task, e.g. 16384; by default all "
+                        "contents are sent in the task.")
+    parser.add_argument("--log-json", type=str, default=None,
+                        help="Also write the cwl-tes log to this file as "
+                        "JSON lines.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve job phase timings in the Prometheus "
+                        "text format on this port.")
+    parser.add_argument("--metrics-summary", type=str, default=None,
+                        help="Write job phase timings to this file as JSON "
+                        "at the end of the run.")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="Profile cwl-tes while the workflow runs, with "
+                        "cProfile (pstats output) or by sampling the stacks "
+                        "of all threads (folded stacks for flame graphs), "
+                        "and log the time spent in each job phase.")
+    parser.add_argument("--profile-output", type=str, default=None,
+                        help="Where --profile writes its results, default "
+                        "cwl-tes.pstats or cwl-tes.folded.")
     parser.add_argument("--token-public-key", type=str,
                         default=DEFAULT_TOKEN_PUBLIC_KEY)
     envgroup = parser.add_mutually_exclusive_group()
@@ -453,8 +925,8 @@ def arg_parser():  # type: () -> argparse.ArgumentParser
         "--cachedir",
         type=Text,
         default="",
-        help="Directory to cache intermediate workflow outputs to avoid "
-        "recomputing steps."
+        help="Directory in which to remember the outputs of TES tasks, so "
+        "that identical tasks are not run again."
     )
 
     exgroup = parser.add_mutually_exclusive_group()
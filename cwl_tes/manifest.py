@@ -0,0 +1,255 @@
+"""Output collection from a manifest written by the TES task."""
+from __future__ import absolute_import
+
+import fnmatch
+import logging
+from typing import Any, Dict, List, Optional, Text, Tuple  # noqa F401 # pylint: disable=unused-import
+
+import tes
+from cwltool.stdfsaccess import StdFsAccess
+from schema_salad.ref_resolver import uri_file_path
+
+log = logging.getLogger("tes-backend")
+
+MANIFEST_NAME = ".cwl_tes_manifest"
+CHECKSUMS_NAME = ".cwl_tes_sha1"
+
+# one "<type> <size> <path>" line per entry below the working directory,
+# type "f" or "d", leaving out the files written by cwl-tes itself; $1 is
+# the manifest file name
+MANIFEST_SCRIPT = (
+    'find . -mindepth 1 ! -name ".cwl_tes_*" | '
+    'while IFS= read -r p; do '
+    'if [ -d "$p" ]; then printf "d 0 %s\\n" "${p#./}"; '
+    'elif [ -f "$p" ]; then printf "f %s %s\\n" '
+    '"$(($(wc -c < "$p")))" "${p#./}"; '
+    'fi; done > "$1.part" && mv "$1.part" "$1"')
+
+# sha1sum output for every file below the working directory, hashing
+# batches of files in $2 parallel processes that each append to their own
+# file in $1.d; $1 is the checksum file name
+CHECKSUM_SCRIPT = (
+    'mkdir -p "$1.d" && '
+    'find . -path "./$1.d" -prune -o -type f ! -name ".cwl_tes_*" -print0 | '
+    'xargs -0 -r -n 64 -P "$2" sh -c \'sha1sum "$@" >> "$0/$$"\' "$1.d" && '
+    'find "$1.d" -type f -exec cat {} + > "$1.part" && '
+    'rm -r "$1.d" && mv "$1.part" "$1"')
+
+Entry = Tuple[Text, int]
+
+
+def _read(fs_access, url, name):
+    # type: (StdFsAccess, Text, Text) -> Optional[Text]
+    """Text of the file name in the directory url, None if missing."""
+    try:
+        with fs_access.open(fs_access.join(url, name), "rb") as handle:
+            return handle.read().decode("utf-8")
+    except Exception as err:  # pylint: disable=broad-except
+        log.debug("No %s in %s: %s", name, url, err)
+        return None
+
+
+def relative_path(location, root):  # type: (Text, Text) -> Optional[Text]
+    """Path of location below the directory root, None if outside."""
+    if location.startswith("file://"):
+        location = uri_file_path(location)
+    root = root.rstrip("/")
+    if location.rstrip("/") == root:
+        return ""
+    if not location.startswith(root + "/"):
+        return None
+    return "/".join(part for part in location[len(root) + 1:].split("/")
+                    if part not in ("", "."))
+
+
+class OutputManifest(object):
+    """
+    Describe the output directory of a TES task in one small file.
+
+    A last executor running ``helper_image`` writes MANIFEST_NAME into the
+    output directory, with the type, size and relative path of every file
+    and directory in it. Output collection downloads only that file and
+    answers globs, listings and sizes from it instead of making remote
+    calls; checksums come from WorkerChecksums.
+    """
+
+    def __init__(self, helper_image="alpine"):  # type: (Text) -> None
+        self.helper_image = helper_image
+
+    def executor(self, outdir):  # type: (Text) -> tes.Executor
+        """Executor writing the manifest of outdir."""
+        return tes.Executor(
+            image=self.helper_image,
+            command=["sh", "-c", MANIFEST_SCRIPT, "sh", MANIFEST_NAME],
+            workdir=outdir)
+
+    @staticmethod
+    def load(fs_access, url):
+        # type: (StdFsAccess, Text) -> Optional[Dict[Text, Entry]]
+        """Entries of the manifest in the directory url, None if missing."""
+        text = _read(fs_access, url, MANIFEST_NAME)
+        return parse_manifest(text) if text is not None else None
+
+
+def parse_manifest(text):  # type: (Text) -> Dict[Text, Entry]
+    """Map the relative paths in a manifest to (type, size)."""
+    entries = {}  # type: Dict[Text, Entry]
+    for line in text.splitlines():
+        parts = line.split(" ", 2)
+        if len(parts) != 3 or parts[0] not in ("f", "d"):
+            continue
+        kind, size, path = parts
+        entries[path] = (kind, int(size))
+    return entries
+
+
+class WorkerChecksums(object):
+    """
+    Checksum the outputs of a TES task where they were written.
+
+    An executor running ``helper_image`` after the tool hashes the files
+    in the output directory with ``jobs`` parallel sha1sum processes and
+    writes the result to CHECKSUMS_NAME next to them. Output collection
+    trusts these checksums instead of reading every output file back.
+    """
+
+    def __init__(self, helper_image="alpine", jobs=4):
+        # type: (Text, int) -> None
+        self.helper_image = helper_image
+        self.jobs = jobs
+
+    def executor(self, outdir):  # type: (Text) -> tes.Executor
+        """Executor writing the checksums of the files in outdir."""
+        return tes.Executor(
+            image=self.helper_image,
+            command=["sh", "-c", CHECKSUM_SCRIPT, "sh", CHECKSUMS_NAME,
+                     str(self.jobs)],
+            workdir=outdir)
+
+    @staticmethod
+    def load(fs_access, url):
+        # type: (StdFsAccess, Text) -> Optional[Dict[Text, Text]]
+        """Checksums of the files below the directory url, None if missing."""
+        text = _read(fs_access, url, CHECKSUMS_NAME)
+        return parse_checksums(text) if text is not None else None
+
+
+def parse_checksums(text):  # type: (Text) -> Dict[Text, Text]
+    """Map the relative paths in sha1sum output to CWL checksums."""
+    checksums = {}  # type: Dict[Text, Text]
+    for line in text.splitlines():
+        # sha1sum escapes names with a backslash or newline, skip those
+        if len(line) < 43 or line.startswith("\\") \
+                or line[40:42] not in ("  ", " *"):
+            continue
+        path = line[42:]
+        if path.startswith("./"):
+            path = path[2:]
+        checksums[path] = "sha1$" + line[:40]
+    return checksums
+
+
+def is_sidecar(url):  # type: (Text) -> bool
+    """Whether url is one of the files cwl-tes writes next to outputs."""
+    return url.rstrip("/").rsplit("/", 1)[-1].startswith(".cwl_tes_")
+
+
+class OutputFsAccess(object):
+    """
+    fs_access without the files that cwl-tes writes next to the outputs.
+
+    The manifest and checksums written into the output directory are left
+    out of globs and listings; everything else goes to fs_access.
+    """
+
+    def __init__(self, fs_access):  # type: (StdFsAccess) -> None
+        self.fs_access = fs_access
+
+    def __getattr__(self, name):  # type: (Text) -> Any
+        return getattr(self.fs_access, name)
+
+    def glob(self, pattern):  # type: (Text) -> List[Text]
+        return [url for url in self.fs_access.glob(pattern)
+                if not is_sidecar(url)]
+
+    def listdir(self, fn):  # type: (Text) -> List[Text]
+        return [url for url in self.fs_access.listdir(fn)
+                if not is_sidecar(url)]
+
+
+class ManifestFsAccess(StdFsAccess):
+    """
+    Read-only view of a remote output directory described by a manifest.
+
+    Paths below root are answered from the manifest entries; anything
+    that has to be read is opened with fs_access.
+    """
+
+    def __init__(self, basedir, entries, root, fs_access):
+        # type: (Text, Dict[Text, Entry], Text, StdFsAccess) -> None
+        super(ManifestFsAccess, self).__init__(basedir)
+        self.entries = entries
+        self.root = root.rstrip("/")
+        self.fs_access = fs_access
+        self._children = {}  # type: Dict[Text, List[Text]]
+        for path in entries:
+            parent, _, name = path.rpartition("/")
+            self._children.setdefault(parent, []).append(name)
+
+    def _entry(self, url):  # type: (Text) -> Optional[Entry]
+        path = relative_path(url, self.root)
+        if path == "":
+            return ("d", 0)
+        if path is None:
+            return None
+        return self.entries.get(path)
+
+    def glob(self, pattern):  # type: (Text) -> List[Text]
+        path = relative_path(pattern, self.root)
+        if path is None:
+            return []
+        if path == "":
+            return [self.root]
+        # like glob.glob, "*" matches within one path component and only
+        # matches names starting with "." if the pattern does
+        matches = [""]
+        for part in path.split("/"):
+            matches = [
+                parent + "/" + child if parent else child
+                for parent in matches
+                for child in self._children.get(parent, [])
+                if fnmatch.fnmatchcase(child, part)
+                and (part.startswith(".") or not child.startswith("."))]
+        return [self.join(self.root, match) for match in matches]
+
+    def open(self, fn, mode):  # type: (Text, Text) -> Any
+        return self.fs_access.open(fn, mode)
+
+    def exists(self, fn):  # type: (Text) -> bool
+        return self._entry(fn) is not None
+
+    def isfile(self, fn):  # type: (Text) -> bool
+        entry = self._entry(fn)
+        return entry is not None and entry[0] == "f"
+
+    def isdir(self, fn):  # type: (Text) -> bool
+        entry = self._entry(fn)
+        return entry is not None and entry[0] == "d"
+
+    def listdir(self, fn):  # type: (Text) -> List[Text]
+        path = relative_path(fn, self.root)
+        if not self.isdir(fn) or path is None:
+            raise OSError("{} is not a directory".format(fn))
+        return [self.join(fn, name) for name in self._children.get(path, [])]
+
+    def join(self, path, *paths):  # type: (Text, *Text) -> Text
+        return self.fs_access.join(path, *paths)
+
+    def realpath(self, path):  # type: (Text) -> Text
+        return path
+
+    def size(self, fn):  # type: (Text) -> int
+        entry = self._entry(fn)
+        if entry is None:
+            raise OSError("{} is not in the output manifest".format(fn))
+        return entry[1]
@@ -0,0 +1,135 @@
+"""Timing of the phases of TES jobs."""
+from __future__ import absolute_import
+
+import contextlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Text  # noqa F401 # pylint: disable=unused-import
+
+from six.moves import BaseHTTPServer, socketserver
+
+log = logging.getLogger("tes-backend")
+
+
+class Metrics(object):
+    """
+    Durations of the phases of each job, and totals per phase.
+
+    The phases are upload, path_mapping, build, submit, queue, run and
+    collect. Durations that do not belong to a single job, such as the
+    upload of the inputs, are recorded with job=None.
+    """
+
+    def __init__(self):  # type: () -> None
+        self._lock = threading.Lock()
+        self._jobs = {}  # type: Dict[Text, Dict[Text, float]]
+        self._totals = {}  # type: Dict[Text, List[float]]
+        self._counts = {}  # type: Dict[Text, int]
+        self.started = time.time()
+
+    def observe(self, phase, seconds, job=None):
+        # type: (Text, float, Optional[Text]) -> None
+        """Record that phase took seconds, for job if given."""
+        with self._lock:
+            total = self._totals.setdefault(phase, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            total[2] = max(total[2], seconds)
+            if job is not None:
+                phases = self._jobs.setdefault(job, {})
+                phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def count(self, name, amount=1):  # type: (Text, int) -> None
+        """Add amount to the counter name, such as a task state."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, phase, job=None):
+        # type: (Text, Optional[Text]) -> Iterator[None]
+        """Time the body of a with statement as phase."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.time() - start, job)
+
+    def summary(self):  # type: () -> Dict[Text, Any]
+        """Everything recorded so far, for the end-of-run report."""
+        with self._lock:
+            return {
+                "wall_seconds": time.time() - self.started,
+                "phases": {
+                    phase: {"count": total[0], "seconds": total[1],
+                            "max_seconds": total[2]}
+                    for phase, total in self._totals.items()},
+                "counts": dict(self._counts),
+                "jobs": {job: dict(phases)
+                         for job, phases in self._jobs.items()}}
+
+    def prometheus(self):  # type: () -> Text
+        """The totals in the Prometheus text exposition format."""
+        lines = [
+            "# HELP cwl_tes_phase_seconds Time spent in each job phase.",
+            "# TYPE cwl_tes_phase_seconds summary"]
+        with self._lock:
+            for phase in sorted(self._totals):
+                count, seconds, _ = self._totals[phase]
+                lines.append('cwl_tes_phase_seconds_count{phase="%s"} %d'
+                             % (phase, count))
+                lines.append('cwl_tes_phase_seconds_sum{phase="%s"} %f'
+                             % (phase, seconds))
+            lines.append("# HELP cwl_tes_phase_seconds_max Longest single "
+                         "duration of each job phase.")
+            lines.append("# TYPE cwl_tes_phase_seconds_max gauge")
+            for phase in sorted(self._totals):
+                lines.append('cwl_tes_phase_seconds_max{phase="%s"} %f'
+                             % (phase, self._totals[phase][2]))
+            lines.append("# HELP cwl_tes_events_total Tasks by event.")
+            lines.append("# TYPE cwl_tes_events_total counter")
+            for name in sorted(self._counts):
+                lines.append('cwl_tes_events_total{event="%s"} %d'
+                             % (name, self._counts[name]))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host=""):  # type: (int, Text) -> None
+        """Serve prometheus() over HTTP on port from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        server = Server((host, port), Handler)
+        thread = threading.Thread(
+            target=server.serve_forever, name="metrics-server")
+        thread.daemon = True
+        thread.start()
+        log.info("Serving metrics on port %d", server.server_address[1])
+
+    def log_totals(self):  # type: () -> None
+        """Log the total time spent in each phase."""
+        phases = self.summary()["phases"]
+        for phase in sorted(phases, key=lambda p: -phases[p]["seconds"]):
+            log.info("%-12s %6d x %10.3fs (max %.3fs)", phase,
+                     phases[phase]["count"], phases[phase]["seconds"],
+                     phases[phase]["max_seconds"])
+
+    def write_summary(self, path):  # type: (Text) -> None
+        """Write summary() to path as JSON."""
+        with open(path, "w") as handle:
+            json.dump(self.summary(), handle, indent=2, sort_keys=True)
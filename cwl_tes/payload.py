@@ -0,0 +1,89 @@
+"""Compact encoding of CreateTask request bodies."""
+from __future__ import absolute_import
+
+import json
+import logging
+import zlib
+from typing import Any, Optional, Text  # noqa F401 # pylint: disable=unused-import
+
+import tes  # noqa F401 # pylint: disable=unused-import
+
+log = logging.getLogger("tes-backend")
+
+DESCRIPTION_LIMIT = 1024
+GZIP_MIN_SIZE = 8 * 1024
+
+# maps whose entries are kept even when empty
+_LITERAL_MAPS = ("env", "tags")
+
+
+def _compact(obj, literal=False):  # type: (Any, bool) -> Any
+    if isinstance(obj, dict):
+        if literal:
+            return dict((k, v) for k, v in obj.items() if v is not None)
+        compact = {}
+        for key, value in obj.items():
+            value = _compact(value, key in _LITERAL_MAPS)
+            # empty strings stay, an empty literal input has content ""
+            if value is not None and value != [] and value != {}:
+                compact[key] = value
+        return compact
+    if isinstance(obj, list):
+        return [_compact(item) for item in obj if item is not None]
+    return obj
+
+
+def compact_task(task, description_limit=DESCRIPTION_LIMIT):
+    # type: (tes.Task, Optional[int]) -> Any
+    """
+    The task as a dict without unset fields, empty lists and maps or FILE
+    types, the TES default, and with descriptions cut to description_limit
+    characters.
+    """
+    msg = _compact(task.as_dict())
+    for parameter in msg.get("inputs", []) + msg.get("outputs", []):
+        if parameter.get("type") == "FILE":
+            del parameter["type"]
+    if description_limit is not None:
+        for item in [msg] + msg.get("inputs", []) + msg.get("outputs", []):
+            if len(item.get("description", "")) > description_limit:
+                item["description"] = \
+                    item["description"][:description_limit - 3] + "..."
+    return msg
+
+
+class TaskEncoder(object):
+    """
+    Serialize tes.Task messages for CreateTask requests.
+
+    Messages are compacted (see compact_task) and written without
+    whitespace. Bodies larger than max_size bytes are refused. With
+    compress=True, bodies of at least GZIP_MIN_SIZE bytes are gzipped,
+    until the server rejects one.
+    """
+
+    def __init__(self, max_size=None, compress=False,
+                 description_limit=DESCRIPTION_LIMIT):
+        # type: (Optional[int], bool, Optional[int]) -> None
+        self.max_size = max_size
+        self.compress = compress
+        self.description_limit = description_limit
+
+    def encode(self, task):  # type: (tes.Task) -> bytes
+        """The JSON body for a CreateTask request."""
+        body = json.dumps(
+            compact_task(task, self.description_limit),
+            separators=(",", ":")).encode("utf-8")
+        log.debug("CreateTask body for %s: %d bytes", task.name, len(body))
+        if self.max_size is not None and len(body) > self.max_size:
+            raise ValueError(
+                "CreateTask body for {} is {} bytes, more than the limit of "
+                "{} bytes".format(task.name, len(body), self.max_size))
+        return body
+
+    def gzip(self, body):  # type: (bytes) -> Optional[bytes]
+        """The gzipped body, or None if it should be sent as it is."""
+        if not self.compress or len(body) < GZIP_MIN_SIZE:
+            return None
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
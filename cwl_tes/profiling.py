@@ -0,0 +1,123 @@
+"""Profiling of the cwl-tes process itself."""
+from __future__ import absolute_import
+
+import cProfile
+import collections
+import functools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Text  # noqa F401 # pylint: disable=unused-import
+
+log = logging.getLogger("tes-backend")
+
+MODES = ("cprofile", "sample")
+
+
+class Profiler(object):
+    """
+    Profile all threads of the process while a wrapped function runs.
+
+    In "cprofile" mode every thread gets its own cProfile.Profile and the
+    merged statistics are written to path in pstats format. In "sample"
+    mode the stacks of all threads are sampled every interval seconds and
+    written to path as folded stacks, the input format of flamegraph.pl
+    and speedscope.
+    """
+
+    def __init__(self, path, mode="cprofile", interval=0.01):
+        # type: (Text, Text, float) -> None
+        if mode not in MODES:
+            raise ValueError("Unknown profiling mode: {}".format(mode))
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self._profiles = []  # type: List[cProfile.Profile]
+        self._samples = collections.Counter()  # type: Dict[Text, int]
+        self._stop = threading.Event()
+        self._sampler = None  # type: Optional[threading.Thread]
+        self._lock = threading.Lock()
+
+    def wrap(self, func):  # type: (Callable[..., Any]) -> Callable[..., Any]
+        """func, profiled from the moment it is called until it returns."""
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):  # type: (*Any, **Any) -> Any
+            self.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stop()
+        return profiled
+
+    def start(self):  # type: () -> None
+        """Start profiling this thread and any thread started from now on."""
+        if self.mode == "cprofile":
+            threading.setprofile(self._profile_thread)
+            self._profile_thread()
+        else:
+            self._stop.clear()
+            self._sampler = threading.Thread(
+                target=self._sample, name="profiler")
+            self._sampler.daemon = True
+            self._sampler.start()
+
+    def _profile_thread(self, *args):  # type: (*Any) -> None
+        # called from sys.setprofile() in new threads, replaces itself
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _sample(self):  # type: () -> None
+        own = threading.current_thread().ident
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name
+                     for thread in threading.enumerate()}
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []  # type: List[Text]
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{} ({}:{})".format(
+                        code.co_name, os.path.basename(code.co_filename),
+                        code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[";".join(reversed(stack))] += 1
+
+    def stop(self):  # type: () -> None
+        """Stop profiling and write the results to path."""
+        start = time.time()
+        if self.mode == "cprofile":
+            threading.setprofile(None)
+            with self._lock:
+                profiles, self._profiles = self._profiles, []
+            stats = None  # type: Optional[pstats.Stats]
+            for profile in profiles:
+                profile.disable()
+                profile.create_stats()
+                if not profile.stats:  # type: ignore
+                    continue
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            if stats is not None:
+                stats.dump_stats(self.path)
+                log.info("Wrote profile of %d thread(s) to %s",
+                         len(profiles), self.path)
+        else:
+            self._stop.set()
+            if self._sampler is not None:
+                self._sampler.join()
+            with open(self.path, "w") as handle:
+                for stack, count in sorted(self._samples.items()):
+                    handle.write("{} {}\n".format(stack, count))
+            log.info("Wrote %d samples to %s",
+                     sum(self._samples.values()), self.path)
+        log.debug("Saving the profile took %.1fs", time.time() - start)
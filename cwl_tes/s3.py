@@ -0,0 +1,372 @@
+"""S3 support"""
+from __future__ import absolute_import
+
+import functools
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, Callable, Dict, List,  # noqa F401 # pylint: disable=unused-import
+                    Optional, Text, Tuple)
+
+from six.moves import urllib
+
+from cwltool.loghandler import _logger
+from cwltool.pathmapper import CONTENT_LIMIT
+
+from .storage import RemoteFsAccess
+
+try:
+    import boto3
+    import botocore.config
+    import botocore.exceptions
+    from boto3.s3.transfer import TransferConfig
+except ImportError:
+    boto3 = None
+
+MIB = 1024 * 1024
+
+
+def make_client(endpoint_url=None, max_connections=10):
+    # type: (Optional[Text], int) -> Any
+    """
+    S3 client for the default AWS credentials.
+
+    With endpoint_url, such as that of a MinIO server, buckets are
+    addressed in the path of the URL instead of the host name.
+    """
+    if boto3 is None:
+        raise ImportError(
+            "s3:// remote storage needs boto3, pip install cwl-tes[s3]")
+    config = botocore.config.Config(
+        max_pool_connections=max_connections,
+        retries={"max_attempts": 5},
+        s3={"addressing_style": "path"} if endpoint_url else None)
+    return boto3.session.Session().client(
+        "s3", endpoint_url=endpoint_url, config=config)
+
+
+def _split(url):  # type: (Text) -> Tuple[Text, Text]
+    """Bucket and key of an s3:// URL."""
+    parse = urllib.parse.urlparse(url)
+    return parse.netloc, parse.path.lstrip("/")
+
+
+def _not_found(err):  # type: (Exception) -> bool
+    return isinstance(err, botocore.exceptions.ClientError) and \
+        err.response.get("Error", {}).get("Code") in (
+            "404", "NoSuchKey", "NoSuchBucket", "NotFound")
+
+
+class _HashingReader(object):
+    """
+    Hash the data of a file handle as it is read.
+
+    Having no seek, it makes boto3 read the parts of a multipart upload
+    in order, while still sending them in parallel.
+    """
+
+    def __init__(self, handle):  # type: (Any) -> None
+        self.handle = handle
+        self.checksum = hashlib.sha1()
+
+    def read(self, size=-1):  # type: (int) -> bytes
+        data = self.handle.read(size)
+        self.checksum.update(data)
+        return data
+
+
+class S3Reader(object):
+    """
+    Stream an S3 object with ranged GET requests.
+
+    Reads fetch ahead of the current position, starting with CONTENT_LIMIT
+    bytes and doubling up to chunk_size, so that loadContents of a large
+    object transfers no more than it reads, and seek() moves without any
+    request.
+    """
+
+    def __init__(self, client, bucket, key, chunk_size=8 * MIB):
+        # type: (Any, Text, Text, int) -> None
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.size = None  # type: Optional[int]
+        self._ahead = min(CONTENT_LIMIT, chunk_size)
+        self._buffer = b""
+
+    def _fetch(self, start, length):
+        # type: (int, Optional[int]) -> bytes
+        if self.size is not None and start >= self.size:
+            return b""
+        end = "" if length is None else start + length - 1
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.key,
+                Range="bytes={}-{}".format(start, end))
+        except botocore.exceptions.ClientError as err:
+            if err.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            # ranges of an empty object, or past its end, are invalid
+            self.size = start
+            return b""
+        content_range = response.get("ContentRange")
+        data = response["Body"].read()
+        if content_range:
+            self.size = int(content_range.rsplit("/", 1)[1])
+        else:
+            self.size = start + len(data)
+        return data
+
+    def read(self, size=-1):  # type: (int) -> bytes
+        """Read up to size bytes, or the rest of the object."""
+        start = self.position + len(self._buffer)
+        if size < 0:
+            data = self._buffer + self._fetch(start, None)
+            self._buffer = b""
+        else:
+            if len(self._buffer) < size:
+                self._buffer += self._fetch(
+                    start, max(size - len(self._buffer), self._ahead))
+                self._ahead = min(self._ahead * 2, self.chunk_size)
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):  # type: (int, int) -> int
+        """Move to offset, relative to the end of the object if whence=2."""
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            if self.size is None:
+                self.size = self.client.head_object(
+                    Bucket=self.bucket, Key=self.key)["ContentLength"]
+            offset += self.size
+        self.position = offset
+        self._buffer = b""
+        return offset
+
+    def tell(self):  # type: () -> int
+        return self.position
+
+    def close(self):  # type: () -> None
+        self._buffer = b""
+
+    def __enter__(self):  # type: () -> S3Reader
+        return self
+
+    def __exit__(self, *args):  # type: (*Any) -> None
+        self.close()
+
+
+class S3FsAccess(RemoteFsAccess):
+    """
+    S3 access with upload, for AWS or an S3 compatible server.
+
+    Directories are key prefixes. Each is listed once, up to 1000 keys per
+    request, and the listing answers exists/isfile/isdir/size/listdir for
+    the lifetime of this object instead of a HEAD request per key; upload,
+    mkdir and rename invalidate it. Files are uploaded in parts of
+    transfer_config.multipart_chunksize bytes, several at a time, and read
+    with ranged GETs.
+    """
+
+    scheme = "s3"
+    errors = (OSError, botocore.exceptions.BotoCoreError,
+              botocore.exceptions.ClientError) if boto3 else (OSError,)
+
+    def __init__(self,
+                 basedir,               # type: Text
+                 client=None,           # type: Any
+                 transfer_config=None,  # type: Any
+                 fallback=None          # type: Optional[Callable[[Text], Any]]  # noqa: E501
+                 ):  # type: (...) -> None
+        super(S3FsAccess, self).__init__(basedir, fallback)
+        self.client = client or make_client()
+        self.transfer_config = transfer_config or TransferConfig()
+        self._listings = {}  # type: Dict[Tuple[Text, Text], Optional[Dict[Text, Dict]]]  # noqa: E501
+        self._listings_lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, options):
+        # type: (Any) -> Callable[[Text], RemoteFsAccess]
+        from .ftp import FtpFsAccess
+        threads = options.s3_transfer_threads
+        client = make_client(
+            options.s3_endpoint_url,
+            max_connections=max(10, options.ftp_upload_workers * threads))
+        transfer_config = TransferConfig(
+            multipart_threshold=options.s3_part_size * MIB,
+            multipart_chunksize=options.s3_part_size * MIB,
+            max_concurrency=threads)
+        return functools.partial(
+            cls, client=client, transfer_config=transfer_config,
+            fallback=FtpFsAccess.factory(options))
+
+    @classmethod
+    def server(cls, url):  # type: (Text) -> Tuple[Any, ...]
+        # objects can be copied between the buckets of one endpoint
+        return (urllib.parse.urlparse(url).scheme,)
+
+    def _listing(self, url):
+        # type: (Text) -> Optional[Dict[Text, Dict[Text, Any]]]
+        """Entries below the prefix url, None if there are none."""
+        bucket, key = _split(url)
+        prefix = key.rstrip("/") + "/" if key.rstrip("/") else ""
+        with self._listings_lock:
+            if (bucket, prefix) in self._listings:
+                return self._listings[(bucket, prefix)]
+        listing = {}  # type: Dict[Text, Dict[Text, Any]]
+        found = not prefix
+        paginator = self.client.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(
+                    Bucket=bucket, Prefix=prefix, Delimiter="/"):
+                for common in page.get("CommonPrefixes", []):
+                    found = True
+                    name = common["Prefix"][len(prefix):].rstrip("/")
+                    listing[name] = {"type": "dir"}
+                for obj in page.get("Contents", []):
+                    found = True
+                    name = obj["Key"][len(prefix):]
+                    # "dir/" is the marker object of an empty directory
+                    if name:
+                        listing[name] = {"type": "file", "size": obj["Size"]}
+        except botocore.exceptions.ClientError as err:
+            if not _not_found(err):
+                raise
+            found = False
+        result = listing if found else None
+        with self._listings_lock:
+            self._listings[(bucket, prefix)] = result
+        return result
+
+    def _facts(self, url):  # type: (Text) -> Dict[Text, Any]
+        """Type and size of url from its parent's listing."""
+        bucket, key = _split(url)
+        if not key.rstrip("/"):
+            return {"type": "dir"}
+        parent, _, name = key.rstrip("/").rpartition("/")
+        listing = self._listing("s3://{}/{}".format(bucket, parent))
+        if listing is None:
+            return {"type": "missing"}
+        return listing.get(name, {"type": "missing"})
+
+    def invalidate(self, url=None):  # type: (Optional[Text]) -> None
+        with self._listings_lock:
+            if url is None:
+                self._listings.clear()
+                return
+            bucket, key = _split(url)
+            key = key.rstrip("/")
+            self._listings.pop((bucket, key + "/" if key else ""), None)
+            parent = key.rpartition("/")[0]
+            self._listings.pop((bucket, parent + "/" if parent else ""), None)
+
+    def glob(self, pattern):  # type: (Text) -> List[Text]
+        if not self._handles(pattern):
+            return self.fallback.glob(pattern)
+        return self._glob(pattern)
+
+    def open(self, fn, mode):  # type: (Text, Text) -> Any
+        if not self._handles(fn):
+            return self.fallback.open(fn, mode)
+        if 'r' in mode:
+            bucket, key = _split(fn)
+            return S3Reader(self.client, bucket, key,
+                            self.transfer_config.multipart_chunksize)
+        raise Exception('Write mode S3 not implemented')
+
+    def version(self, url):  # type: (Text) -> Optional[Text]
+        if not self._handles(url):
+            return self.fallback.version(url)
+        bucket, key = _split(url)
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)["ETag"]
+        except botocore.exceptions.ClientError:
+            return None
+
+    def exists(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.exists(fn)
+        return self._facts(fn)["type"] != "missing"
+
+    def isfile(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.isfile(fn)
+        return self._facts(fn)["type"] == "file"
+
+    def isdir(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.isdir(fn)
+        return self._facts(fn)["type"] == "dir"
+
+    def listdir(self, fn):  # type: (Text) -> List[Text]
+        if not self._handles(fn):
+            return self.fallback.listdir(fn)
+        listing = self._listing(fn)
+        if listing is None:
+            raise OSError("{} is not a directory".format(fn))
+        return [self.join(fn.rstrip("/"), name) for name in listing]
+
+    def size(self, fn):  # type: (Text) -> int
+        if not self._handles(fn):
+            return self.fallback.size(fn)
+        facts = self._facts(fn)
+        if "size" in facts:
+            return facts["size"]
+        bucket, key = _split(fn)
+        return self.client.head_object(
+            Bucket=bucket, Key=key)["ContentLength"]
+
+    def mkdir(self, url, recursive=True):  # type: (Text, bool) -> None
+        # prefixes need no parents; the marker makes the directory exist
+        # before anything is uploaded into it
+        bucket, key = _split(url)
+        if key.rstrip("/"):
+            self.client.put_object(
+                Bucket=bucket, Key=key.rstrip("/") + "/", Body=b"")
+        self.invalidate(url)
+
+    def upload(self, file_handle, url):  # type: (Any, Text) -> Text
+        bucket, key = _split(url)
+        file_handle.seek(0)
+        reader = _HashingReader(file_handle)
+        self.client.upload_fileobj(
+            reader, bucket, key, Config=self.transfer_config)
+        self.invalidate(url)
+        return "sha1$" + reader.checksum.hexdigest()
+
+    def rename(self, src, dst):  # type: (Text, Text) -> None
+        # S3 has no rename: copy every object below src on the server, in
+        # parallel, then delete the originals in batches
+        src_bucket, src_key = _split(src)
+        dst_bucket, dst_key = _split(dst)
+        if self.isfile(src):
+            moves = [(src_key, dst_key)]
+        else:
+            prefix = src_key.rstrip("/") + "/"
+            paginator = self.client.get_paginator("list_objects_v2")
+            moves = [
+                (obj["Key"], dst_key.rstrip("/") + "/" + obj["Key"][
+                    len(prefix):])
+                for page in paginator.paginate(
+                    Bucket=src_bucket, Prefix=prefix)
+                for obj in page.get("Contents", [])]
+
+        def copy(move):  # type: (Tuple[Text, Text]) -> None
+            self.client.copy(
+                {"Bucket": src_bucket, "Key": move[0]}, dst_bucket, move[1],
+                Config=self.transfer_config)
+        with ThreadPoolExecutor(
+                max_workers=self.transfer_config.max_concurrency) as pool:
+            list(pool.map(copy, moves))
+        for start in range(0, len(moves), 1000):
+            self.client.delete_objects(Bucket=src_bucket, Delete={
+                "Objects": [{"Key": key} for key, _ in
+                            moves[start:start + 1000]],
+                "Quiet": True})
+        _logger.debug("Moved %d objects from %s to %s", len(moves), src, dst)
+        self.invalidate(src)
+        self.invalidate(dst)
@@ -0,0 +1,353 @@
+"""Remote storage backends, selected by the scheme of the storage URL."""
+from __future__ import absolute_import
+
+import contextlib
+import fnmatch
+import functools
+import glob
+import hashlib
+import importlib
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor  # noqa F401 # pylint: disable=unused-import
+from typing import (Any, Callable, Dict, List,  # noqa F401 # pylint: disable=unused-import
+                    Optional, Text, Tuple)
+
+import requests
+from six.moves import urllib
+from schema_salad.ref_resolver import file_uri, uri_file_path
+
+from cwltool.stdfsaccess import StdFsAccess
+
+log = logging.getLogger("tes-backend")
+
+# scheme of --remote-storage-url -> "module.Class" of its fs access, imported
+# on first use so that optional dependencies are only needed when used
+BACKENDS = {
+    "file": "cwl_tes.storage.SharedFsAccess",
+    "ftp": "cwl_tes.ftp.FtpFsAccess",
+    "s3": "cwl_tes.s3.S3FsAccess",
+}
+
+
+def get_backend(url):  # type: (Text) -> type
+    """The fs access class for remote storage at url."""
+    scheme = urllib.parse.urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ValueError(
+            "Unsupported remote storage URL {}, expected one of {}".format(
+                url, ", ".join(
+                    "{}://".format(name) for name in sorted(BACKENDS))))
+    module, _, name = BACKENDS[scheme].rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def open_http(url):  # type: (Text) -> Any
+    """Stream url, transferring only what is read before closing."""
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return contextlib.closing(response.raw)
+
+
+def http_version(url):  # type: (Text) -> Optional[Text]
+    """ETag or Last-Modified and size of url, None if it has neither."""
+    try:
+        response = requests.head(url, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    headers = response.headers
+    if "ETag" not in headers and "Last-Modified" not in headers:
+        return None
+    return "{} {} {}".format(headers.get("ETag"),
+                             headers.get("Last-Modified"),
+                             headers.get("Content-Length"))
+
+
+class RemoteFsAccess(StdFsAccess):
+    """
+    File access to one kind of remote storage, with upload.
+
+    Subclasses handle the URLs of their scheme and implement mkdir, upload
+    and rename on top of the StdFsAccess methods; other URLs and plain
+    paths are left to fallback, by default local file access.
+    """
+
+    scheme = None  # type: Optional[Text]
+    # exceptions meaning that a remote operation failed
+    errors = (OSError,)  # type: Tuple[type, ...]
+
+    def __init__(self, basedir, fallback=None):
+        # type: (Text, Optional[Callable[[Text], StdFsAccess]]) -> None
+        super(RemoteFsAccess, self).__init__(basedir)
+        self.fallback = (fallback or StdFsAccess)(basedir)
+
+    @classmethod
+    def factory(cls, options):
+        # type: (Any) -> Callable[[Text], RemoteFsAccess]
+        """
+        Make instances for one run from the command line options.
+
+        The instances made by one factory share their connections.
+        """
+        return cls
+
+    @classmethod
+    def server(cls, url):  # type: (Text) -> Tuple[Any, ...]
+        """Identifies the URLs that rename can move url between."""
+        parse = urllib.parse.urlparse(url)
+        return parse.scheme, parse.hostname, parse.port
+
+    def _handles(self, url):  # type: (Text) -> bool
+        return urllib.parse.urlparse(url).scheme == self.scheme
+
+    def _glob0(self, basename, basepath):
+        if basename == '':
+            if self.isdir(basepath):
+                return [basename]
+        else:
+            if self.isfile(self.join(basepath, basename)):
+                return [basename]
+        return []
+
+    def _glob1(self, pattern, basepath=None):
+        try:
+            urls = self.listdir(basepath)
+        except self.errors:
+            return []
+        # listdir returns URLs, match their last path component
+        names = [url.rstrip("/").rsplit("/", 1)[-1] for url in urls]
+        return [url for url, name in zip(urls, names)
+                if fnmatch.fnmatch(name, pattern)
+                and (pattern[0] == '.' or name[0] != '.')]
+
+    def _glob(self, pattern):  # type: (Text) -> List[Text]
+        if pattern.endswith("/."):
+            pattern = pattern[:-1]
+        dirname, basename = pattern.rsplit('/', 1)
+        if not glob.has_magic(pattern):
+            if basename:
+                if self.exists(pattern):
+                    return [pattern]
+            else:  # Patterns ending in slash should match only directories
+                if self.isdir(dirname):
+                    return [pattern]
+            return []
+        if not dirname:
+            return self._glob1(basename)
+
+        dirs = self._glob(dirname)
+        if glob.has_magic(basename):
+            glob_in_dir = self._glob1
+        else:
+            glob_in_dir = self._glob0
+        results = []
+        for dirname in dirs:
+            results.extend(glob_in_dir(basename, dirname))
+        return results
+
+    def join(self, path, *paths):  # type: (Text, *Text) -> Text
+        prefix = "{}:".format(self.scheme)
+        if path.startswith(prefix):
+            result = path
+            for extra_path in paths:
+                if extra_path.startswith(prefix + "/"):
+                    result = extra_path
+                else:
+                    result = result + "/" + extra_path
+            return result
+        return super(RemoteFsAccess, self).join(path, *paths)
+
+    def realpath(self, path):  # type: (Text) -> Text
+        if self._handles(path):
+            return path
+        return os.path.realpath(path)
+
+    def open(self, fn, mode):  # type: (Text, Text) -> Any
+        if urllib.parse.urlparse(fn).scheme in ("http", "https") \
+                and "r" in mode:
+            return open_http(fn)
+        return super(RemoteFsAccess, self).open(fn, mode)
+
+    def version(self, url):  # type: (Text) -> Optional[Text]
+        """
+        A string that changes whenever the contents of url change.
+
+        None if that cannot be told without reading url.
+        """
+        if urllib.parse.urlparse(url).scheme in ("http", "https"):
+            return http_version(url)
+        if not self._handles(url) and isinstance(
+                self.fallback, RemoteFsAccess):
+            return self.fallback.version(url)
+        return None
+
+    def invalidate(self, url=None):  # type: (Optional[Text]) -> None
+        """Forget what is cached about url's directory, or everything."""
+
+    def mkdir(self, url, recursive=True):  # type: (Text, bool) -> None
+        """Make the directory url, and its parents if recursive."""
+        raise NotImplementedError()
+
+    def upload(self, file_handle, url):  # type: (Any, Text) -> Text
+        """
+        Upload the data of file_handle to url.
+
+        Returns the CWL checksum ("sha1$...") of the uploaded data.
+        """
+        raise NotImplementedError()
+
+    def rename(self, src, dst):  # type: (Text, Text) -> None
+        """Move the file or directory src to dst on the same server."""
+        raise NotImplementedError()
+
+
+class SharedFsAccess(RemoteFsAccess):
+    """
+    Remote storage on a file system shared with the TES workers.
+
+    --remote-storage-url is a file:// URL of a directory that the TES
+    server can read and write under the same path; uploads are copies.
+    """
+
+    scheme = "file"
+
+    @classmethod
+    def factory(cls, options):
+        # type: (Any) -> Callable[[Text], RemoteFsAccess]
+        from .ftp import FtpFsAccess
+        return functools.partial(cls, fallback=FtpFsAccess.factory(options))
+
+    def _handles(self, url):  # type: (Text) -> bool
+        return urllib.parse.urlparse(url).scheme in ("", "file")
+
+    def _path(self, url):  # type: (Text) -> Text
+        return uri_file_path(url) if url.startswith("file:") else url
+
+    def glob(self, pattern):  # type: (Text) -> List[Text]
+        if not self._handles(pattern):
+            return self.fallback.glob(pattern)
+        return super(SharedFsAccess, self).glob(pattern)
+
+    def open(self, fn, mode):  # type: (Text, Text) -> Any
+        if not self._handles(fn):
+            return self.fallback.open(fn, mode)
+        return super(SharedFsAccess, self).open(fn, mode)
+
+    def exists(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.exists(fn)
+        return super(SharedFsAccess, self).exists(fn)
+
+    def isfile(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.isfile(fn)
+        return super(SharedFsAccess, self).isfile(fn)
+
+    def isdir(self, fn):  # type: (Text) -> bool
+        if not self._handles(fn):
+            return self.fallback.isdir(fn)
+        return super(SharedFsAccess, self).isdir(fn)
+
+    def listdir(self, fn):  # type: (Text) -> List[Text]
+        if not self._handles(fn):
+            return self.fallback.listdir(fn)
+        return super(SharedFsAccess, self).listdir(fn)
+
+    def size(self, fn):  # type: (Text) -> int
+        if not self._handles(fn):
+            return self.fallback.size(fn)
+        return super(SharedFsAccess, self).size(fn)
+
+    def realpath(self, path):  # type: (Text) -> Text
+        if path.startswith("file:"):
+            return file_uri(os.path.realpath(self._path(path)))
+        return super(SharedFsAccess, self).realpath(path)
+
+    def mkdir(self, url, recursive=True):  # type: (Text, bool) -> None
+        path = self._path(url)
+        if not recursive:
+            os.mkdir(path)
+        elif not os.path.isdir(path):
+            os.makedirs(path)
+
+    def upload(self, file_handle, url):  # type: (Any, Text) -> Text
+        checksum = hashlib.sha1()
+        file_handle.seek(0)
+        with open(self._path(url), mode="wb") as target:
+            for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+                checksum.update(chunk)
+                target.write(chunk)
+        return "sha1$" + checksum.hexdigest()
+
+    def rename(self, src, dst):  # type: (Text, Text) -> None
+        shutil.move(self._path(src), self._path(dst))
+
+
+class Uploader(object):
+    """
+    Upload local files to remote storage in parallel.
+
+    Each transfer runs in one of workers threads and calls the upload
+    method of fs_access, which checks out its own connection where the
+    backend has a connection pool. Callers create directories themselves,
+    so files can be queued as soon as their directory exists while earlier
+    files are still transferring.
+    """
+
+    def __init__(self, fs_access, workers=1):
+        # type: (RemoteFsAccess, int) -> None
+        self.fs_access = fs_access
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures = {}  # type: Dict[Text, Future]
+        self._stats = {}  # type: Dict[Text, List[Any]]
+        self._lock = threading.Lock()
+
+    def __contains__(self, url):  # type: (Text) -> bool
+        """Whether an upload to url has been queued."""
+        return url in self._futures
+
+    def upload(self, path, url, on_checksum=None):
+        # type: (Text, Text, Optional[Callable[[Text], Any]]) -> None
+        """
+        Queue the local file at path for upload to url.
+
+        on_checksum, if given, is called with the checksum of the file
+        before wait() can return.
+        """
+        self._futures[url] = self._pool.submit(
+            self._upload, path, url, on_checksum)
+
+    def _upload(self, path, url, on_checksum):
+        # type: (Text, Text, Optional[Callable[[Text], Any]]) -> None
+        start = time.time()
+        with open(path, mode="rb") as source:
+            checksum = self.fs_access.upload(source, url)
+        if on_checksum is not None:
+            on_checksum(checksum)
+        elapsed = time.time() - start
+        with self._lock:
+            stats = self._stats.setdefault(
+                threading.current_thread().name, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += os.path.getsize(path)
+            stats[2] += elapsed
+
+    def wait(self):  # type: () -> None
+        """Wait for the queued uploads, re-raising the first failure."""
+        futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.result()
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        for name, (files, size, elapsed) in sorted(stats.items()):
+            log.info(
+                "%s upload %s: %d files, %.1f MiB in %.1fs (%.1f MiB/s)",
+                (self.fs_access.scheme or "").upper(), name, files,
+                size / 2.0**20, elapsed,
+                size / 2.0**20 / elapsed if elapsed else 0)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
+import collections
 import logging
 import os
 import random
@@ -9,14 +10,20 @@ import stat
 from builtins import str
 import shutil
 import functools
+import hashlib
+import io
+import json
 import uuid
-from tempfile import NamedTemporaryFile
-from pprint import pformat
-from typing import (Any, Callable, Dict, List, MutableMapping, MutableSequence,
-                    Optional, Union)
+from typing import (Any, Callable, Dict, List,  # noqa F401 # pylint: disable=unused-import
+                    MutableMapping, MutableSequence,
+                    Optional, Set, Tuple, Union)
 from typing_extensions import Text
 
+import concurrent.futures
+import requests
 import tes
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from six.moves import urllib
 
 from schema_salad.ref_resolver import file_uri
@@ -29,15 +36,634 @@ from cwltool.errors import WorkflowException, UnsupportedRequirement
 from cwltool.expression import JSON
 from cwltool.job import JobBase
 from cwltool.stdfsaccess import StdFsAccess
-from cwltool.pathmapper import (PathMapper, uri_file_path, MapperEnt,
-                                downloadHttpFile)
-from cwltool.utils import onWindows, convert_pathsep_to_unix
+from cwltool.pathmapper import PathMapper, uri_file_path, MapperEnt
+from cwltool.process import compute_checksums
+from cwltool.utils import (onWindows, convert_pathsep_to_unix,
+                           random_outdir, visit_class)
 from cwltool.workflow import default_make_tool
 
+from .cache import task_key
+from .context import TESRuntimeContext
 from .ftp import abspath
+from .logging_utils import LazyPformat, TaskSummary
+from .manifest import ManifestFsAccess, OutputFsAccess, relative_path
+from .metrics import Metrics
+from .payload import TaskEncoder
+from .storage import http_version, open_http
 
 log = logging.getLogger("tes-backend")
 
+TERMINAL_STATES = ("COMPLETE", "CANCELED", "EXECUTOR_ERROR", "SYSTEM_ERROR")
+FAILED_STATES = ("CANCELED", "EXECUTOR_ERROR", "SYSTEM_ERROR")
+
+
+DEFAULT_MAX_CONNECTIONS = 10
+
+
+class TESClient(tes.HTTPClient):
+    """
+    tes.HTTPClient sending its requests through a pooled Session.
+
+    CreateTask bodies are written by a TaskEncoder. The API base path below
+    url is discovered on first use by trying the paths in API_PATHS.
+    """
+
+    # GA4GH TES 1.0 servers, older ones like Funnel, url including the path
+    API_PATHS = ("/ga4gh/tes/v1", "/v1", "")
+
+    def __init__(self, url, session, encoder=None, **kwargs):
+        # type: (Text, requests.Session, Optional[TaskEncoder], **Any) -> None
+        super(TESClient, self).__init__(url, **kwargs)
+        self.session = session
+        self.encoder = encoder or TaskEncoder()
+        self._api_path = None  # type: Optional[Text]
+        self._api_path_lock = threading.Lock()
+
+    def api_path(self):  # type: () -> Text
+        """The base path of the TES API below url."""
+        with self._api_path_lock:
+            if self._api_path is None:
+                for path in self.API_PATHS:
+                    try:
+                        response = self.session.get(
+                            "%s%s/tasks" % (self.url, path),
+                            **self._request_params(
+                                params={"view": "MINIMAL", "page_size": 1}))
+                    except requests.RequestException as err:
+                        log.debug("No TES API at %s%s: %s",
+                                  self.url, path, err)
+                        continue
+                    if response.ok:
+                        log.debug("Found TES API at %s%s", self.url, path)
+                        self._api_path = path
+                        break
+                else:
+                    # try again next time, the server may still be starting
+                    return "/v1"
+            return self._api_path
+
+    def _request(self,
+                 method,       # type: Text
+                 path,         # type: Text
+                 data=None,    # type: Any
+                 params=None,  # type: Optional[Dict[Text, Any]]
+                 headers=None  # type: Optional[Dict[Text, Text]]
+                 ):  # type: (...) -> Any
+        kwargs = self._request_params(data=data, params=params)
+        if headers:
+            kwargs["headers"].update(headers)
+        response = self.session.request(
+            method, "%s%s%s" % (self.url, self.api_path(), path),
+            **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def get_service_info(self):  # type: () -> tes.ServiceInfo
+        # TES before 1.0 served it as a task
+        path = "/tasks/service-info" if self.api_path() == "/v1" \
+            else "/service-info"
+        return tes.unmarshal(self._request("GET", path), tes.ServiceInfo)
+
+    def create_task(self, task):  # type: (tes.Task) -> Text
+        if not isinstance(task, tes.Task):
+            raise TypeError("Expected Task instance")
+        body = self.encoder.encode(task)
+        compressed = self.encoder.gzip(body)
+        if compressed is not None:
+            try:
+                return tes.unmarshal(
+                    self._request("POST", "/tasks", data=compressed,
+                                  headers={"Content-Encoding": "gzip"}),
+                    tes.CreateTaskResponse).id
+            except requests.HTTPError as err:
+                if err.response is None or \
+                        err.response.status_code not in (400, 415):
+                    raise
+                log.warning("TES server refused a gzipped CreateTask body "
+                            "(%s), sending plain JSON from now on", err)
+                self.encoder.compress = False
+        return tes.unmarshal(
+            self._request("POST", "/tasks", data=body),
+            tes.CreateTaskResponse).id
+
+    def get_task(self, task_id, view="BASIC"):
+        # type: (Text, Text) -> tes.Task
+        return tes.unmarshal(
+            self._request("GET", "/tasks/" + task_id,
+                          params={"view": view}),
+            tes.Task)
+
+    def cancel_task(self, task_id):  # type: (Text) -> None
+        self._request("POST", "/tasks/%s:cancel" % task_id)
+
+    def list_tasks(self, view="MINIMAL", page_size=None, page_token=None):
+        # type: (Text, Optional[int], Optional[Text]) -> tes.ListTasksResponse
+        params = {"view": view, "page_size": page_size,
+                  "page_token": page_token}
+        return tes.unmarshal(
+            self._request("GET", "/tasks", params=params),
+            tes.ListTasksResponse)
+
+
+_clients = {}  # type: Dict[Tuple[Text, ...], TESClient]
+_clients_lock = threading.Lock()
+
+
+def get_client(url, token=None, user=None, password=None,
+               max_connections=DEFAULT_MAX_CONNECTIONS, encoder=None):
+    # type: (Text, Text, Text, Text, int, Optional[TaskEncoder]) -> TESClient
+    """
+    Return the process-wide client for a TES endpoint and set of credentials.
+
+    Clients share a keep-alive connection pool of at most max_connections
+    connections; max_connections and encoder only apply when the client is
+    created.
+    """
+    key = (url, token, user, password)
+    with _clients_lock:
+        if key not in _clients:
+            adapter = HTTPAdapter(
+                pool_maxsize=max_connections, pool_block=True)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _clients[key] = TESClient(url, session, encoder=encoder,
+                                      token=token, user=user,
+                                      password=password)
+        return _clients[key]
+
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+class TaskSubmitter(object):
+    """
+    Throttle CreateTask calls to a TES server.
+
+    All submissions share one rate limit (max_rate tasks per second) and at
+    most max_inflight submitted tasks may be unfinished at any time: submit()
+    blocks until release() is called for an earlier task. Requests rejected
+    with 429/5xx or failing to connect are retried with jittered exponential
+    backoff.
+    """
+
+    def __init__(self,
+                 client,             # type: tes.HTTPClient
+                 max_rate=None,      # type: Optional[float]
+                 max_inflight=None,  # type: Optional[int]
+                 max_retries=6,      # type: int
+                 backoff=1.0         # type: float
+                 ):  # type: (...) -> None
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._interval = 1.0 / max_rate if max_rate else 0.0
+        self._next_slot = 0.0
+        self._rate_lock = threading.Lock()
+        self._inflight = threading.BoundedSemaphore(max_inflight) \
+            if max_inflight else None
+
+    def submit(self, task):  # type: (tes.Task) -> Text
+        """Create the task once a slot is free and return its ID."""
+        if self._inflight is not None:
+            self._inflight.acquire()
+        try:
+            return self._create(task)
+        except Exception:
+            self.release()
+            raise
+
+    def release(self):  # type: () -> None
+        """Mark a previously submitted task as finished."""
+        if self._inflight is not None:
+            self._inflight.release()
+
+    def _throttle(self):  # type: () -> None
+        if not self._interval:
+            return
+        with self._rate_lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        time.sleep(slot - now)
+
+    def _create(self, task):  # type: (tes.Task) -> Text
+        attempt = 0
+        while True:
+            self._throttle()
+            retry_after = None
+            try:
+                return self.client.create_task(task)
+            except requests.HTTPError as err:
+                if err.response is None or \
+                        err.response.status_code not in RETRY_STATUS_CODES:
+                    raise
+                error = err  # type: Exception
+                retry_after = err.response.headers.get("Retry-After")
+            except requests.ConnectionError as err:
+                error = err
+            attempt += 1
+            if attempt > self.max_retries:
+                raise error
+            delay = random.uniform(0, self.backoff * 2**attempt)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            log.warning("CreateTask failed (%s), retrying in %.1fs",
+                        error, delay)
+            time.sleep(delay)
+
+
+class TaskWatch(object):
+    """
+    A TES task tracked by TESTaskPoller.
+
+    Jobs that share a task, such as the members of a resumed batch, each add
+    their own callback.
+    """
+
+    def __init__(self, task_id, callback, tag=None):
+        # type: (Text, Callable[[TaskWatch], None], Optional[Text]) -> None
+        self.task_id = task_id
+        self.callbacks = [callback]
+        self.tag = tag
+        self.state = "UNKNOWN"
+        self.submitted = time.time()
+        self.started = None  # type: Optional[float]
+        self.next_poll = self.submitted
+
+
+class PollSchedule(object):
+    """
+    Decide how long to wait before polling a task again.
+
+    Tasks that have not started running yet are polled every min_interval
+    seconds. Running tasks back off in proportion to how long they have been
+    running (backoff * elapsed, capped at max_interval), but are polled every
+    min_interval again while their runtime is within ``window`` of the median
+    runtime of earlier tasks with the same tag (the CWLDocumentId).
+    """
+
+    def __init__(self, min_interval=1, max_interval=60, backoff=0.1,
+                 window=0.25, history=100):
+        # type: (float, float, float, float, int) -> None
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.window = window
+        self.history = history
+        self._runtimes = {}  # type: Dict[Optional[Text], List[float]]
+
+    def record(self, watch, now):  # type: (TaskWatch, float) -> None
+        """Remember the runtime of a task that completed successfully."""
+        if watch.tag is None:
+            return
+        runtimes = self._runtimes.setdefault(watch.tag, [])
+        runtimes.append(now - (watch.started or watch.submitted))
+        del runtimes[:-self.history]
+
+    def median(self, tag):  # type: (Optional[Text]) -> Optional[float]
+        runtimes = sorted(self._runtimes.get(tag, []))
+        if not runtimes:
+            return None
+        return runtimes[len(runtimes) // 2]
+
+    def interval(self, watch, now):  # type: (TaskWatch, float) -> float
+        if watch.started is None:
+            return self.min_interval
+        elapsed = now - watch.started
+        interval = min(self.max_interval,
+                       max(self.min_interval, self.backoff * elapsed))
+        median = self.median(watch.tag)
+        if median is not None:
+            window_start = median * (1 - self.window)
+            if window_start <= elapsed <= median * (1 + self.window):
+                return self.min_interval
+            if elapsed < window_start:
+                interval = max(self.min_interval,
+                               min(interval, window_start - elapsed))
+        return interval
+
+
+class TESTaskPoller(object):
+    """
+    Refresh the state of all in-flight TES tasks from a single thread.
+
+    Each task is polled according to a PollSchedule. Due tasks are looked up
+    in batches through ListTasks (MINIMAL view), falling back to GetTask for
+    tasks missing from the listing. Once a task reaches a terminal state its
+    callbacks are run by a pool of workers, so that callbacks which make
+    requests of their own, such as fetching the logs of a failed batch task,
+    do not hold up polling.
+    """
+
+    def __init__(self, client, schedule=None, page_size=256, max_retries=10,
+                 workers=4):
+        # type: (tes.HTTPClient, Optional[PollSchedule], int, int, int) -> None
+        self.client = client
+        self.schedule = schedule or PollSchedule()
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self._watches = {}  # type: Dict[Text, TaskWatch]
+        self._canceled = set()  # type: Set[Text]
+        self._lock = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._workers = ThreadPoolExecutor(max_workers=workers)
+
+    def watch(self, task_id, callback, tag=None):
+        # type: (Text, Callable[[TaskWatch], None], Optional[Text]) -> None
+        """Call ``callback(watch)`` once the task reaches a terminal state."""
+        with self._lock:
+            if task_id in self._watches:
+                self._watches[task_id].callbacks.append(callback)
+                return
+            watch = TaskWatch(task_id, callback, tag)
+            watch.next_poll += self.schedule.min_interval
+            self._watches[task_id] = watch
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="tes-poller")
+                self._thread.daemon = True
+                self._thread.start()
+            self._lock.notify()
+
+    def task_ids(self):  # type: () -> List[Text]
+        """IDs of the tasks that have not reached a terminal state yet."""
+        with self._lock:
+            return list(self._watches)
+
+    def cancel_all(self, max_workers=16, timeout=30):
+        # type: (int, float) -> int
+        """Cancel every watched task that has not been canceled already."""
+        with self._lock:
+            task_ids = [task_id for task_id in self._watches
+                        if task_id not in self._canceled]
+            self._canceled.update(task_ids)
+        return cancel_tasks(self.client, task_ids, max_workers, timeout)
+
+    def _run(self):  # type: () -> None
+        errors = 0
+        while True:
+            with self._lock:
+                while not self._watches:
+                    self._lock.wait()
+                now = time.time()
+                wakeup = min(w.next_poll for w in self._watches.values())
+                if wakeup > now:
+                    # A new watch notifies us, so it is polled on time.
+                    self._lock.wait(wakeup - now)
+                    continue
+                pending = dict(self._watches)
+            due = [w.task_id for w in pending.values() if w.next_poll <= now]
+            finished = []  # type: List[TaskWatch]
+            try:
+                states = self._refresh(due, pending)
+            except Exception as err:  # pylint: disable=broad-except
+                log.error("POLLING ERROR %s", err)
+                errors += 1
+                if errors > self.max_retries:
+                    log.error("MAX POLLING RETRIES EXCEEDED")
+                    finished = [pending[task_id] for task_id in due]
+                    errors = 0
+                delay = 1.5 * errors**2
+                for task_id in due:
+                    pending[task_id].next_poll = now + random.uniform(
+                        0.5 * delay, 1.5 * delay)
+            else:
+                errors = 0
+                now = time.time()
+                for task_id, state in states.items():
+                    watch = pending[task_id]
+                    if state != watch.state:
+                        log.debug("POLLING %s, result: %s", task_id, state)
+                    watch.state = state
+                    if state == "RUNNING" and watch.started is None:
+                        watch.started = now
+                    if state in TERMINAL_STATES:
+                        if state == "COMPLETE":
+                            self.schedule.record(watch, now)
+                        finished.append(watch)
+                    else:
+                        watch.next_poll = now + random.uniform(
+                            0.9, 1.1) * self.schedule.interval(watch, now)
+            with self._lock:
+                for watch in finished:
+                    self._watches.pop(watch.task_id, None)
+            for watch in finished:
+                for callback in watch.callbacks:
+                    self._workers.submit(self._call, callback, watch)
+
+    @staticmethod
+    def _call(callback, watch):
+        # type: (Callable[[TaskWatch], None], TaskWatch) -> None
+        try:
+            callback(watch)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Callback for task %s failed", watch.task_id)
+
+    def _refresh(self, task_ids, watched):
+        # type: (List[Text], Dict[Text, TaskWatch]) -> Dict[Text, Text]
+        """
+        Fetch the current state of the given tasks.
+
+        Other watched tasks that show up in a ListTasks page are included
+        in the result as well.
+        """
+        remaining = set(task_ids)
+        states = {}  # type: Dict[Text, Text]
+        page_token = None
+        pages = 0
+        # Stop paging once a GetTask per remaining task would be cheaper.
+        while len(remaining) > pages + 1:
+            response = self.client.list_tasks(
+                view="MINIMAL", page_size=self.page_size,
+                page_token=page_token)
+            pages += 1
+            for task in response.tasks or []:
+                if task.id in watched:
+                    states[task.id] = task.state
+                    remaining.discard(task.id)
+            page_token = response.next_page_token
+            if not page_token:
+                break
+        for task_id in remaining:
+            states[task_id] = self.client.get_task(task_id, "MINIMAL").state
+        return states
+
+
+class TaskBatcher(object):
+    """
+    Pack TES tasks with the same image and resources into one task.
+
+    Tasks are held for up to ``linger`` seconds, or until ``batch_size``
+    compatible tasks are waiting, and then submitted as one task that runs
+    their executors one after another. When the batch task stops, every
+    member job gets the outcome of its own executor. Members whose executor
+    never ran, because an earlier one failed or the task hit a system
+    error, are submitted again on their own.
+    """
+
+    def __init__(self, submitter, poller, batch_size, linger=2.0):
+        # type: (TaskSubmitter, TESTaskPoller, int, float) -> None
+        self.submitter = submitter
+        self.poller = poller
+        self.batch_size = batch_size
+        self.linger = linger
+        self._pending = {}  # type: Dict[Text, List[Tuple[Any, ...]]]
+        self._lock = threading.Lock()
+        self._workers = ThreadPoolExecutor(max_workers=4)
+
+    def add(self, job, task, on_final):
+        # type: (TESTask, tes.Task, Callable[[], None]) -> None
+        """Queue the task of job; on_final() is called once it stops."""
+        key = json.dumps([[executor.image for executor in task.executors],
+                          task.resources.as_dict()], sort_keys=True)
+        paths = _container_paths(task)
+        batches = []  # type: List[List[Tuple[Any, ...]]]
+        with self._lock:
+            members = self._pending.get(key, [])
+            if any(paths & _container_paths(other)
+                   for _, other, _ in members):
+                # the tasks would overwrite each other's files
+                batches.append(self._pending.pop(key))
+            members = self._pending.setdefault(key, [])
+            members.append((job, task, on_final))
+            if len(members) >= self.batch_size:
+                batches.append(self._pending.pop(key))
+            elif len(members) == 1:
+                timer = threading.Timer(
+                    self.linger, self._flush, (key, members))
+                timer.daemon = True
+                timer.start()
+        for batch in batches:
+            self._workers.submit(self._submit, batch)
+
+    def _flush(self, key, members):
+        # type: (Text, List[Tuple[Any, ...]]) -> None
+        with self._lock:
+            if self._pending.get(key) is not members:
+                return
+            del self._pending[key]
+        self._workers.submit(self._submit, members)
+
+    def _submit(self, members):  # type: (List[Tuple[Any, ...]]) -> None
+        if len(members) == 1:
+            self._submit_alone(*members[0])
+            return
+        tasks = [task for _, task, _ in members]
+        batch = tes.Task(
+            name="batch of {}: {}".format(
+                len(members), ", ".join(task.name for task in tasks)),
+            executors=[e for task in tasks for e in task.executors],
+            inputs=[i for task in tasks for i in task.inputs or []],
+            outputs=[o for task in tasks for o in task.outputs or []],
+            volumes=[v for task in tasks for v in task.volumes or []] or None,
+            resources=tes.Resources(
+                cpu_cores=tasks[0].resources.cpu_cores,
+                ram_gb=tasks[0].resources.ram_gb,
+                disk_gb=sum(task.resources.disk_gb or 0 for task in tasks),
+                preemptible=tasks[0].resources.preemptible,
+                zones=tasks[0].resources.zones))
+        start = time.time()
+        try:
+            task_id = self.submitter.submit(batch)
+        except Exception as err:  # pylint: disable=broad-except
+            log.error("Failed to submit batch task to TES service:\n%s", err)
+            for job, _, on_final in members:
+                job.state = "SYSTEM_ERROR"
+                on_final()
+            return
+        log.info("Submitted %d jobs as TES task %s", len(members), task_id)
+        for (job, _, _), (_, last) in zip(members, _executor_ranges(tasks)):
+            job.metrics.observe("submit", time.time() - start, job.name)
+            job.id = task_id
+            job.batch_index = last
+            job.record_submission()
+        self.poller.watch(task_id, functools.partial(self._done, members))
+
+    def _submit_alone(self, job, task, on_final):
+        # type: (TESTask, tes.Task, Callable[[], None]) -> None
+        job.id = job.batch_index = None
+        try:
+            job.submit_task(task, on_final)
+        except WorkflowException:
+            job.state = "SYSTEM_ERROR"
+            on_final()
+
+    def _done(self, members, watch):
+        # type: (List[Tuple[Any, ...]], TaskWatch) -> None
+        self.submitter.release()
+        exit_codes = []  # type: List[Optional[int]]
+        if watch.state == "EXECUTOR_ERROR":
+            try:
+                logs = self.submitter.client.get_task(
+                    watch.task_id, "FULL").logs or []
+                if logs and logs[-1].logs:
+                    exit_codes = [executor_log.exit_code
+                                  for executor_log in logs[-1].logs]
+            except Exception as err:  # pylint: disable=broad-except
+                log.error("Failed to get logs of batch task %s: %s",
+                          watch.task_id, err)
+        ranges = _executor_ranges([task for _, task, _ in members])
+        for (job, task, on_final), (first, last) in zip(members, ranges):
+            job.record_times(watch)
+            if watch.state in ("COMPLETE", "CANCELED"):
+                job.set_state(watch.state)
+            elif first < len(exit_codes):
+                job.set_state(
+                    "COMPLETE" if last < len(exit_codes)
+                    and exit_codes[last] == 0 else watch.state)
+            else:
+                log.info("[job %s] resubmitting on its own", job.name)
+                self._workers.submit(self._submit_alone, job, task, on_final)
+                continue
+            on_final()
+
+
+def _container_paths(task):  # type: (tes.Task) -> Set[Text]
+    """The paths inside the container that task writes to."""
+    paths = set(task.volumes or [])
+    paths.update(executor.workdir for executor in task.executors
+                 if executor.workdir)
+    paths.update(output.path for output in task.outputs or [])
+    return paths
+
+
+def _executor_ranges(tasks):  # type: (List[tes.Task]) -> List[Tuple[int, int]]
+    """Indices of the first and last executor of each task in a batch."""
+    ranges = []  # type: List[Tuple[int, int]]
+    first = 0
+    for task in tasks:
+        ranges.append((first, first + len(task.executors) - 1))
+        first += len(task.executors)
+    return ranges
+
+
+def cancel_tasks(client, task_ids, max_workers=16, timeout=30):
+    # type: (tes.HTTPClient, List[Text], int, float) -> int
+    """
+    Cancel TES tasks in parallel, giving up after timeout seconds.
+
+    Returns the number of tasks that were canceled.
+    """
+    if not task_ids:
+        return 0
+    log.warning("Canceling %d TES task(s)", len(task_ids))
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(task_ids)))
+    futures = {pool.submit(client.cancel_task, task_id): task_id
+               for task_id in task_ids}
+    done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+    pool.shutdown(wait=False)
+    canceled = 0
+    for future in done:
+        if future.exception() is not None:
+            log.error("Failed to cancel task %s: %s",
+                      futures[future], future.exception())
+        else:
+            canceled += 1
+    for future in not_done:
+        log.error("Timed out canceling task %s", futures[future])
+    return canceled
+
 
 def make_tes_tool(spec, loading_context, url, remote_storage_url, token, user, password):
     """cwl-tes specific factory for CWL Process generation."""
@@ -59,16 +685,51 @@ class TESCommandLineTool(CommandLineTool):
         self.user=user
         self.password=password
 
+    def job(self, job_order, output_callbacks, runtimeContext):
+        """Leave --cachedir to TESTask; cwltool's cache needs local outputs."""
+        if runtimeContext.cachedir:
+            runtimeContext = runtimeContext.copy()
+            runtimeContext.cachedir = ""
+            work_reuse, _ = self.get_requirement("WorkReuse")
+            if work_reuse and not work_reuse.get("enableReuse", True):
+                runtimeContext.tes_job_cache = None
+        if getattr(runtimeContext, "tes_batcher", None) is not None \
+                and not runtimeContext.docker_outdir:
+            # cwltool gives every job of a run the same container outdir;
+            # jobs batched into one task need their own
+            runtimeContext = runtimeContext.copy()
+            job_dir = uuid.uuid4().hex[:12]
+            runtimeContext.docker_outdir = "{}/{}".format(
+                random_outdir(), job_dir)
+            runtimeContext.docker_tmpdir = "/tmp/" + job_dir  # nosec
+        return super(TESCommandLineTool, self).job(
+            job_order, output_callbacks, runtimeContext)
+
     def make_path_mapper(self, reffiles, stagedir, runtimeContext,
                          separateDirs):
+        metrics = getattr(runtimeContext, "tes_metrics", None) or Metrics()
+        with metrics.timer("path_mapping"):
+            return self._make_path_mapper(
+                reffiles, stagedir, runtimeContext, separateDirs)
+
+    def _make_path_mapper(self, reffiles, stagedir, runtimeContext,
+                          separateDirs):
         if self.remote_storage_url:
             return TESPathMapper(
                 reffiles, runtimeContext.basedir, stagedir, separateDirs,
-                runtimeContext.make_fs_access(self.remote_storage_url or ""))
+                runtimeContext.make_fs_access(self.remote_storage_url or ""),
+                stream_remote=getattr(
+                    runtimeContext, "stream_remote_inputs", False),
+                download_cache=getattr(
+                    runtimeContext, "download_cache", None),
+                archiver=getattr(
+                    runtimeContext, "directory_archiver", None))
         return super(TESCommandLineTool, self).make_path_mapper(
             reffiles, stagedir, runtimeContext, separateDirs)
 
     def make_job_runner(self, runtimeContext):
+        if not isinstance(runtimeContext, TESRuntimeContext):
+            runtimeContext = TESRuntimeContext(vars(runtimeContext))
         if self.remote_storage_url:
             remote_storage_url = self.remote_storage_url + "/output_{}".format(
                 uuid.uuid4())
@@ -80,22 +741,92 @@ class TESCommandLineTool(CommandLineTool):
                                  token=self.token, user=self.user, password=self.password)
 
 
+class DownloadCache(object):
+    """
+    Bounded on-disk cache of remote files that are needed locally.
+
+    Files are stored under a name derived from their URL and version, as
+    told by the storage (ETag, modification time, size), so a changed input
+    is downloaded again; without a version a download is never reused. The
+    least recently used files are removed once the cache grows past
+    max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=10 * 2**30):
+        # type: (Optional[Text], int) -> None
+        self.directory = directory or os.path.join(
+            os.path.expanduser("~"), ".cache", "cwl-tes", "downloads")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def fetch(self, url, opener, version=None):
+        # type: (Text, Callable[[Text], Any], Optional[Text]) -> Text
+        """Local path of url, reading it with opener(url) if not cached."""
+        if version is None:
+            name = uuid.uuid4().hex
+        else:
+            name = hashlib.sha1("{}\0{}".format(url, version).encode(
+                "utf-8")).hexdigest()
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path, None)
+                return path
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+        partial = "{}.{}.partial".format(path, uuid.uuid4())
+        try:
+            with opener(url) as handle, open(partial, "wb") as dest:
+                shutil.copyfileobj(handle, dest, 1024 * 1024)
+            os.rename(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):  # type: (Text) -> None
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if not name.endswith(".partial"):
+                    stats = os.stat(path)
+                    entries.append((stats.st_mtime, stats.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path != keep:
+                    os.remove(path)
+                    total -= size
+
+
 class TESPathMapper(PathMapper):
 
     def __init__(self, reference_files, basedir, stagedir, separateDirs=True,
-                 fs_access=None):
+                 fs_access=None, stream_remote=False, download_cache=None,
+                 archiver=None):
         self.fs_access = fs_access
+        self.stream_remote = stream_remote
+        self.download_cache = download_cache or DownloadCache()
+        self.archiver = archiver
         super(TESPathMapper, self).__init__(reference_files, basedir, stagedir,
                                             separateDirs)
 
-    def _download_ftp_file(self, path):
-        with NamedTemporaryFile(mode='wb', delete=False) as dest:
-            with self.fs_access.open(path, mode="rb") as handle:
-                chunk = "start"
-                while chunk:
-                    chunk = handle.read(16384)
-                    dest.write(chunk)
-            return dest.name
+    def _download_remote_file(self, path):
+        return self.download_cache.fetch(
+            path, functools.partial(self.fs_access.open, mode="rb"),
+            self.fs_access.version(path))
+
+    def _map_archive_listing(self, listing, stagedir):
+        # type: (List[Dict[Text, Any]], Text) -> None
+        for entry in listing:
+            tgt = convert_pathsep_to_unix(
+                os.path.join(stagedir, entry["basename"]))
+            self._pathmap[entry["location"]] = MapperEnt(
+                entry["location"], tgt, entry["class"], False)
+            self._map_archive_listing(entry.get("listing", []), tgt)
 
     def visit(self, obj, stagedir, basedir, copy=False, staged=False):
         tgt = convert_pathsep_to_unix(
@@ -114,6 +845,10 @@ class TESPathMapper(PathMapper):
                 staged)
             if obj["location"].startswith("file://"):
                 staged = False
+            if self.archiver is not None and obj["location"] in self.archiver:
+                # the task unpacks the archive; nothing to stage here
+                self._map_archive_listing(obj.get("listing", []), tgt)
+                return
             self.visitlisting(
                 obj.get("listing", []), tgt, basedir, copy=copy, staged=staged)
         elif obj["class"] == "File":
@@ -126,13 +861,21 @@ class TESPathMapper(PathMapper):
                 with SourceLine(obj, "location", validate.ValidationException,
                                 log.isEnabledFor(logging.DEBUG)):
                     deref = abpath
-                    if urllib.parse.urlsplit(deref).scheme in [
-                            'http', 'https']:
-                        deref = downloadHttpFile(path)
-                    elif urllib.parse.urlsplit(deref).scheme == 'ftp':
-                        deref = self._download_ftp_file(path)
+                    scheme = urllib.parse.urlsplit(deref).scheme
+                    if self.stream_remote and scheme in [
+                            'http', 'https', 'ftp', 's3']:
+                        # TES fetches the URL itself; nothing to stage here
+                        pass
+                    elif scheme in ['http', 'https']:
+                        deref = self.download_cache.fetch(
+                            path, open_http, http_version(path))
+                    elif scheme in ['ftp', 's3']:
+                        deref = self._download_remote_file(path)
                     else:
-                        log.warning("unprocessed File %s", obj)
+                        # expected with remote storage on a shared file
+                        # system, which the TES workers read directly
+                        if getattr(self.fs_access, "scheme", None) != "file":
+                            log.warning("unprocessed File %s", obj)
                         # Dereference symbolic links
                         st = os.lstat(deref)
                         while stat.S_ISLNK(st.st_mode):
@@ -148,6 +891,45 @@ class TESPathMapper(PathMapper):
                         copy=copy, staged=staged)
 
 
+_uploaded_contents = set()  # type: Set[Text]
+_uploaded_contents_lock = threading.Lock()
+
+InputEntry = collections.namedtuple(
+    "InputEntry", ("name", "location", "path", "cls", "contents"))
+
+
+def collect_inputs(job_order):
+    # type: (Dict[Text, Any]) -> List[InputEntry]
+    """
+    Flat list of the Files and Directories in a job order.
+
+    Entries are named after their key, list elements as key[index] and
+    secondary files after their basename. The job order is walked once,
+    depth first and without recursion; an object staged more than once at
+    the same path is only listed the first time.
+    """
+    entries = []  # type: List[InputEntry]
+    seen = set()  # type: Set[Tuple[Text, Text]]
+    stack = [(k, job_order[k]) for k in reversed(list(job_order))]
+    while stack:
+        name, value = stack.pop()
+        if isinstance(value, MutableMapping):
+            if "location" in value and "path" in value and "class" in value:
+                if (value["location"], value["path"]) not in seen:
+                    seen.add((value["location"], value["path"]))
+                    entries.append(InputEntry(
+                        name, value["location"], value["path"],
+                        value["class"], value.get("contents")))
+                stack.extend((f["basename"], f) for f in reversed(
+                    value.get("secondaryFiles", [])))
+            else:
+                stack.extend((k, value[k]) for k in reversed(list(value)))
+        elif isinstance(value, MutableSequence):
+            stack.extend(("%s[%s]" % (name, i), value[i])
+                         for i in reversed(range(len(value))))
+    return entries
+
+
 class TESTask(JobBase):
     JobOrderType = Dict[Text, Union[Dict[Text, Any], List, Text]]
 
@@ -179,7 +961,25 @@ class TESTask(JobBase):
         self.exit_code = None
         self.poll_interval = 1
         self.poll_retries = 10
-        self.client = tes.HTTPClient(url, token=token, user=user, password=password)
+        self.client = get_client(
+            url, token=token, user=user, password=password,
+            max_connections=runtime_context.tes_max_connections)
+        self.poller = runtime_context.tes_poller or TESTaskPoller(self.client)
+        self.submitter = runtime_context.tes_submitter \
+            or TaskSubmitter(self.client)
+        self.job_cache = getattr(runtime_context, "tes_job_cache", None)
+        self.journal = getattr(runtime_context, "tes_journal", None)
+        self.batcher = getattr(runtime_context, "tes_batcher", None)
+        self.metrics = getattr(runtime_context, "tes_metrics", None) \
+            or Metrics()
+        self.archiver = getattr(runtime_context, "directory_archiver", None)
+        self.output_manifest = getattr(
+            runtime_context, "tes_output_manifest", None)
+        self.worker_checksums = getattr(
+            runtime_context, "tes_worker_checksums", None)
+        self.batch_index = None  # type: Optional[int]
+        self.task_key = None  # type: Optional[Text]
+        self.cached_outputs = None  # type: Optional[Dict[Text, Any]]
         self.remote_storage_url = remote_storage_url
         self.token = token
         self.user = user
@@ -197,50 +997,24 @@ class TESTask(JobBase):
             )
         return container
 
-    def create_input(self, name, d):
-        if "contents" in d:
+    def create_input(self, entry):  # type: (InputEntry) -> tes.Input
+        # loadContents fills in contents of files that have a URL as well
+        if entry.contents is not None and entry.location.startswith("_:"):
             return tes.Input(
-                name=name,
-                description="cwl_input:%s" % (name),
-                path=d["path"],
-                content=d["contents"],
-                type=d["class"].upper()
+                name=entry.name,
+                description="cwl_input:%s" % (entry.name),
+                path=entry.path,
+                content=entry.contents,
+                type=entry.cls.upper()
             )
         return tes.Input(
-            name=name,
-            description="cwl_input:%s" % (name),
-            url=d["location"],
-            path=d["path"],
-            type=d["class"].upper()
+            name=entry.name,
+            description="cwl_input:%s" % (entry.name),
+            url=entry.location,
+            path=entry.path,
+            type=entry.cls.upper()
         )
 
-    def parse_job_order(self, k, v, inputs):
-        if isinstance(v, MutableMapping):
-            if all([i in v for i in ["location", "path", "class"]]):
-                inputs.append(self.create_input(k, v))
-
-                if "secondaryFiles" in v:
-                    for f in v["secondaryFiles"]:
-                        self.parse_job_order(f["basename"], f, inputs)
-
-            else:
-                for sk, sv in v.items():
-                    if isinstance(sv, MutableMapping):
-                        self.parse_job_order(sk, sv, inputs)
-
-                    else:
-                        break
-
-        elif isinstance(v, MutableSequence):
-            for i in range(len(v)):
-                if isinstance(v[i], MutableMapping):
-                    self.parse_job_order("%s[%s]" % (k, i), v[i], inputs)
-
-                else:
-                    break
-
-        return inputs
-
     def parse_listing(self, listing, inputs):
         for item in listing:
 
@@ -275,11 +1049,9 @@ class TESTask(JobBase):
         return inputs
 
     def get_inputs(self):
-        inputs = []
-
         # find all primary and secondary input files
-        for k, v in self.joborder.items():
-            self.parse_job_order(k, v, inputs)
+        inputs = [self.create_input(entry)
+                  for entry in collect_inputs(self.joborder)]
 
         # manage InitialWorkDirRequirement
         self.parse_listing(self.generatefiles["listing"], inputs)
@@ -302,8 +1074,31 @@ class TESTask(JobBase):
             else self.builder.tmpdir
         return env
 
+    def stage_archives(self, inputs):
+        # type: (List[tes.Input]) -> Tuple[List[tes.Executor], List[Text]]
+        """
+        Swap Directory inputs that were uploaded as archives for the archive
+        files; return the executors and volumes that unpack them.
+        """
+        commands = []  # type: List[Text]
+        volumes = []  # type: List[Text]
+        if self.archiver is None:
+            return [], volumes
+        for index, task_input in enumerate(inputs):
+            if task_input.type == "DIRECTORY" \
+                    and task_input.url in self.archiver:
+                inputs[index], command = self.archiver.stage(task_input)
+                commands.append(command)
+                volumes.append(task_input.path)
+        if not commands:
+            return [], volumes
+        return [self.archiver.executor(commands)], volumes
+
     def create_task_msg(self):
         input_parameters = self.get_inputs()
+        unpack_executors, volumes = self.stage_archives(input_parameters)
+        if self.builder.tmpdir != "/tmp":  # nosec
+            volumes.append(self.builder.tmpdir)
         output_parameters = []
 
         if self.stdout is not None:
@@ -349,10 +1144,18 @@ class TESTask(JobBase):
                 )
             )
 
+        output_executors = []
+        if self.worker_checksums is not None:
+            output_executors.append(
+                self.worker_checksums.executor(self.builder.outdir))
+        if self.output_manifest is not None and self.remote_storage_url:
+            output_executors.append(
+                self.output_manifest.executor(self.builder.outdir))
+
         create_body = tes.Task(
             name=self.name,
             description=self.spec.get("doc", ""),
-            executors=[
+            executors=unpack_executors + [
                 tes.Executor(
                     command=self.command_line,
                     image=container,
@@ -362,9 +1165,10 @@ class TESTask(JobBase):
                     stdin=self.stdin,
                     env=self.get_envvars()
                 )
-            ],
+            ] + output_executors,
             inputs=input_parameters,
             outputs=output_parameters,
+            volumes=volumes or None,
             resources=tes.Resources(
                 cpu_cores=cpus,
                 ram_gb=ram,
@@ -379,67 +1183,202 @@ class TESTask(JobBase):
             runtimeContext,   # type: RuntimeContext
             tmpdir_lock=None  # type: Optional[threading.Lock]
             ):  # type: (...) -> None
+        done = threading.Event()
+        self.submit(runtimeContext, done.set)
+        done.wait()
+        self.finish(runtimeContext)
+
+    def submit(self,
+               runtimeContext,  # type: RuntimeContext
+               on_final         # type: Callable[[], None]
+               ):  # type: (...) -> None
+        """Submit the TES task; call on_final() once it stops running."""
         log.debug(
-            "[job %s] self.__dict__ in run() ----------------------",
-            self.name
+            "[job %s] self.__dict__ in run() ----------------------\n%s",
+            self.name, LazyPformat(self.__dict__)
         )
-        log.debug(pformat(self.__dict__))
         if not self.successCodes:
             self.successCodes = [0]
 
-        task = self.create_task_msg()
+        with self.metrics.timer("build", self.name):
+            task = self.create_task_msg()
 
         log.info(
-            "[job %s] CREATED TASK MSG----------------------",
-            self.name
+            "[job %s] CREATED TASK MSG: %s",
+            self.name, TaskSummary(task), extra={"job": self.name}
         )
-        log.info(pformat(task))
+        log.debug("%s", LazyPformat(task))
+
+        if self.job_cache is not None or self.journal is not None:
+            self.task_key = self.get_task_key(task)
+        if self.job_cache is not None:
+            self.cached_outputs = self.job_cache.get(
+                self.task_key, runtimeContext.make_fs_access(
+                    self.remote_storage_url or self.basedir))
+            if self.cached_outputs is not None:
+                log.info("[job %s] reusing the outputs of an earlier task "
+                         "(cache key %s)", self.name, self.task_key)
+                self.metrics.count("cached")
+                self.state = "COMPLETE"
+                on_final()
+                return
 
+        self.externalize_contents(task)
+        previous = self.journal.find(self.task_key) \
+            if self.journal is not None else None
+        if previous is not None and self.resume(previous):
+            self.watch(on_final, release=False)
+        elif self.batcher is not None:
+            self.batcher.add(self, task, on_final)
+        else:
+            self.submit_task(task, on_final)
+
+    def externalize_contents(self, task):  # type: (tes.Task) -> None
+        """
+        Pass literal inputs of max_inline_content bytes or more by URL.
+
+        Each distinct content is uploaded once per run, to the contents
+        directory of the remote storage.
+        """
+        limit = getattr(self.runtime_context, "max_inline_content", None)
+        if not self.remote_storage_url or limit is None:
+            return
+        fs_access = self.runtime_context.make_fs_access(
+            self.remote_storage_url)
+        contents_url = fs_access.join(
+            self.remote_storage_url.rsplit("/", 1)[0], "contents")
+        for task_input in task.inputs or []:
+            if task_input.content is None or len(task_input.content) < limit:
+                continue
+            data = task_input.content.encode("utf-8")
+            url = fs_access.join(
+                contents_url, hashlib.sha256(data).hexdigest())
+            with _uploaded_contents_lock:
+                if url not in _uploaded_contents:
+                    if not fs_access.isfile(url):
+                        fs_access.mkdir(contents_url)
+                        fs_access.upload(io.BytesIO(data), url)
+                    _uploaded_contents.add(url)
+            task_input.content = None
+            task_input.url = url
+
+    def submit_task(self, task, on_final):
+        # type: (tes.Task, Callable[[], None]) -> None
+        """Submit task on its own; call on_final() once it stops running."""
         try:
-            self.id = self.client.create_task(task)
+            with self.metrics.timer("submit", self.name):
+                self.id = self.submitter.submit(task)
             log.info(
                 "[job %s] SUBMITTED TASK ----------------------",
                 self.name
             )
-            log.info("[job %s] task id: %s ", self.name, self.id)
+            log.info("[job %s] task id: %s ", self.name, self.id,
+                     extra={"job": self.name, "task_id": self.id})
         except Exception as e:
             log.error(
                 "[job %s] Failed to submit task to TES service:\n%s",
                 self.name, e
             )
             raise WorkflowException(e)
+        self.record_submission()
+        self.watch(on_final, release=True)
+
+    def watch(self, on_final, release):
+        # type: (Callable[[], None], bool) -> None
+        """Poll the submitted task; release its submitter slot if asked."""
+        def on_poll(watch):  # type: (TaskWatch) -> None
+            self.record_times(watch)
+            self.set_state(self.batch_state(watch))
+            if release:
+                self.submitter.release()
+            on_final()
+
+        self.poller.watch(self.id, on_poll, tag=self.spec.get("id"))
+
+    def batch_state(self, watch):  # type: (TaskWatch) -> Text
+        """
+        The state of this job's part of the watched task.
+
+        A resumed member of a batch task completed if its own last executor
+        exited with 0, even if a later member of the batch failed.
+        """
+        if self.batch_index is None or watch.state != "EXECUTOR_ERROR":
+            return watch.state
+        try:
+            logs = self.client.get_task(self.id, "FULL").logs or []
+        except Exception as err:  # pylint: disable=broad-except
+            log.error("Failed to get logs of batch task %s: %s", self.id, err)
+            return watch.state
+        exit_codes = [executor_log.exit_code for executor_log
+                      in (logs[-1].logs or [] if logs else [])]
+        if self.batch_index < len(exit_codes) \
+                and exit_codes[self.batch_index] == 0:
+            return "COMPLETE"
+        return watch.state
+
+    def record_submission(self):  # type: () -> None
+        """Journal the submitted task, so that it can be resumed."""
+        if self.journal is not None:
+            self.journal.record(
+                self.task_key, self.id, job=self.name, state="QUEUED",
+                remote_storage_url=self.remote_storage_url,
+                outdir=self.builder.outdir, batch_index=self.batch_index)
+
+    def record_times(self, watch):  # type: (TaskWatch) -> None
+        """Record how long the finished task was queued and running."""
+        now = time.time()
+        self.metrics.observe(
+            "queue", (watch.started or now) - watch.submitted, self.name)
+        if watch.started is not None:
+            self.metrics.observe("run", now - watch.started, self.name)
+
+    def set_state(self, state):  # type: (Text) -> None
+        """Set the final state of the task."""
+        self.state = state
+        self.metrics.count(state)
+        if self.journal is not None:
+            self.journal.record(self.task_key, self.id, state=state)
+
+    def resume(self, previous):  # type: (Dict[Text, Any]) -> bool
+        """Re-attach to the task of an earlier run unless it failed."""
+        if previous.get("state") in FAILED_STATES:
+            return False
+        try:
+            state = self.client.get_task(previous["task_id"], "MINIMAL").state
+        except Exception as err:  # pylint: disable=broad-except
+            log.warning("[job %s] cannot resume task %s: %s",
+                        self.name, previous["task_id"], err)
+            return False
+        if state in FAILED_STATES:
+            return False
+        self.id = previous["task_id"]
+        self.batch_index = previous.get("batch_index")
+        self.remote_storage_url = previous["remote_storage_url"]
+        self.builder.outdir = previous["outdir"]
+        log.info("[job %s] resuming task %s (%s) ----------------------",
+                 self.name, self.id, state)
+        return True
+
+    def get_task_key(self, task):  # type: (tes.Task) -> Text
+        """Key of task in the job cache and journal."""
+        checksums = {}  # type: Dict[Text, Text]
 
-        max_tries = 10
-        current_try = 1
+        def record(obj):  # type: (Dict[Text, Any]) -> None
+            if "checksum" in obj:
+                checksums[obj["location"]] = obj["checksum"]
+        visit_class(self.joborder, ("File",), record)
+        return task_key(task, {
+            self.builder.outdir: "$(outdir)",
+            self.builder.tmpdir: "$(tmpdir)",
+            self.builder.stagedir: "$(stagedir)"}, checksums)
+
+    def finish(self,
+               runtimeContext  # type: RuntimeContext
+               ):  # type: (...) -> None
+        """Collect the outputs of the finished TES task."""
         self.exit_code = None
-        while not self.is_done():
-            delay = 1.5 * current_try**2
-            time.sleep(
-                random.randint(
-                    round(
-                        delay -
-                        0.5 *
-                        delay),
-                    round(
-                        delay +
-                        0.5 *
-                        delay)))
-            try:
-                task = self.client.get_task(self.id, "MINIMAL")
-                self.state = task.state
-                log.debug(
-                    "[job %s] POLLING %s, result: %s", self.name,
-                    pformat(self.id), task.state
-                )
-            except Exception as e:
-                log.error("[job %s] POLLING ERROR %s", self.name, e)
-                if current_try <= max_tries:
-                    current_try += 1
-                    continue
-                else:
-                    log.error("[job %s] MAX POLLING RETRIES EXCEEDED",
-                              self.name)
-                    break
+        self.is_done()
+        collect_start = time.time()
 
         try:
             process_status = None
@@ -448,21 +1387,46 @@ class TESTask(JobBase):
                 process_status = "permanentFail"
                 log.error("[job %s] job error:\n%s", self.name, self.state)
             remote_cwl_output_json = False
-            if self.remote_storage_url:
-                remote_fs_access = runtimeContext.make_fs_access(
+            fs_access = OutputFsAccess(self.fs_access)  # type: Any
+            root = self.outdir
+            if self.remote_storage_url and self.cached_outputs is None:
+                fs_access = runtimeContext.make_fs_access(
                     self.remote_storage_url)
-                remote_cwl_output_json = remote_fs_access.exists(
-                    remote_fs_access.join(
-                        self.remote_storage_url, "cwl.output.json"))
-            if self.remote_storage_url:
-                original_outdir = self.builder.outdir
-                if not remote_cwl_output_json:
-                    self.builder.outdir = self.remote_storage_url
-                outputs = self.collect_outputs(self.remote_storage_url,
-                                               self.exit_code)
-                self.builder.outdir = original_outdir
+                root = self.remote_storage_url
+                manifest = None
+                if self.output_manifest is not None \
+                        and process_status is None:
+                    manifest = self.output_manifest.load(fs_access, root)
+                if manifest is not None:
+                    fs_access = ManifestFsAccess(
+                        self.basedir, manifest, root, fs_access)
+                    remote_cwl_output_json = "cwl.output.json" in manifest
+                else:
+                    fs_access = OutputFsAccess(fs_access)
+                    remote_cwl_output_json = fs_access.exists(
+                        fs_access.join(root, "cwl.output.json"))
+            checksums = None
+            if self.worker_checksums is not None \
+                    and self.cached_outputs is None \
+                    and process_status is None:
+                checksums = self.worker_checksums.load(fs_access, root)
+            # checksums are filled in afterwards from the worker's
+            # checksums instead of cwltool reading every file
+            fill = checksums is not None \
+                or isinstance(fs_access, ManifestFsAccess)
+            if self.cached_outputs is not None:
+                outputs = self.cached_outputs
+            elif self.remote_storage_url:
+                outputs = self.collect_remote_outputs(
+                    fs_access, remote_cwl_output_json,
+                    not fill and runtimeContext.compute_checksum)
             else:
-                outputs = self.collect_outputs(self.outdir, self.exit_code)
+                outputs = self.collect_local_outputs(
+                    not fill and runtimeContext.compute_checksum)
+            if fill:
+                self.fill_checksums(
+                    outputs, fs_access, root, checksums or {},
+                    runtimeContext.compute_checksum)
             cleaned_outputs = {}
             for k, v in outputs.items():
                 if isinstance(k, bytes):
@@ -473,45 +1437,120 @@ class TESTask(JobBase):
             self.outputs = cleaned_outputs
             if not process_status:
                 process_status = "success"
+                if self.job_cache is not None \
+                        and self.cached_outputs is None:
+                    self.job_cache.put(self.task_key, self.outputs)
         except (WorkflowException, Exception) as err:
             log.error("[job %s] job error:\n%s", self.name, err)
             if log.isEnabledFor(logging.DEBUG):
                 log.exception(err)
             process_status = "permanentFail"
         finally:
+            self.metrics.observe(
+                "collect", time.time() - collect_start, self.name)
             if self.outputs is None:
                 self.outputs = {}
+            if process_status == "permanentFail" \
+                    and self.runtime_context.on_error == "stop":
+                self.poller.cancel_all()
             with self.runtime_context.workflow_eval_lock:
                 self.output_callback(self.outputs, process_status)
             log.info(
-                "[job %s] OUTPUTS ------------------",
-                self.name
+                "[job %s] OUTPUTS ------------------\n%s",
+                self.name, LazyPformat(self.outputs)
             )
-            log.info(pformat(self.outputs))
             self.cleanup(self.runtime_context.rm_tmpdir)
         return
 
+    def collect_remote_outputs(self,
+                               fs_access,         # type: StdFsAccess
+                               cwl_output_json,   # type: bool
+                               compute_checksum   # type: bool
+                               ):  # type: (...) -> Dict[Text, Any]
+        """
+        Collect the outputs from the remote storage with fs_access.
+
+        With a ManifestFsAccess, globs, listings and sizes need no remote
+        calls.
+        """
+        original_outdir = self.builder.outdir
+        original_make_fs_access = self.builder.make_fs_access
+        if not cwl_output_json:
+            self.builder.outdir = self.remote_storage_url
+        self.builder.make_fs_access = lambda basedir: fs_access
+        try:
+            return self.collect_outputs(
+                self.remote_storage_url, self.exit_code,
+                compute_checksum=compute_checksum)
+        finally:
+            self.builder.outdir = original_outdir
+            self.builder.make_fs_access = original_make_fs_access
+
+    def collect_local_outputs(self, compute_checksum):
+        # type: (bool) -> Dict[Text, Any]
+        """Collect the outputs from the local outdir."""
+        original_make_fs_access = self.builder.make_fs_access
+        self.builder.make_fs_access = \
+            lambda basedir: OutputFsAccess(original_make_fs_access(basedir))
+        try:
+            return self.collect_outputs(
+                self.outdir, self.exit_code,
+                compute_checksum=compute_checksum)
+        finally:
+            self.builder.make_fs_access = original_make_fs_access
+
+    @staticmethod
+    def fill_checksums(outputs,          # type: Dict[Text, Any]
+                       fs_access,        # type: StdFsAccess
+                       root,             # type: Text
+                       checksums,        # type: Dict[Text, Text]
+                       compute_checksum  # type: bool
+                       ):  # type: (...) -> None
+        """
+        Set the size and checksum of the output files.
+
+        Checksums are taken from the checksums written by the worker for
+        the files below root; other files are read to compute them.
+        """
+        def fill(file_obj):  # type: (Dict[Text, Any]) -> None
+            location = file_obj["location"]
+            if "size" not in file_obj:
+                file_obj["size"] = fs_access.size(location)
+            if not compute_checksum or "checksum" in file_obj:
+                return
+            checksum = checksums.get(relative_path(location, root) or "")
+            if checksum is not None:
+                file_obj["checksum"] = checksum
+            else:
+                compute_checksums(fs_access, file_obj)
+        visit_class(outputs, ("File",), fill)
+
     def is_done(self):
-        terminal_states = ["COMPLETE", "CANCELED", "EXECUTOR_ERROR",
-                           "SYSTEM_ERROR"]
-        if self.state in terminal_states:
+        if self.state in TERMINAL_STATES:
             log.info(
                 "[job %s] FINAL JOB STATE: %s ------------------",
-                self.name, self.state
+                self.name, self.state,
+                extra={"job": self.name, "task_id": self.id,
+                       "state": self.state}
             )
-            if self.state != "COMPLETE":
+            if self.state != "COMPLETE" and self.id is not None:
                 log.error(
                     "[job %s] task id: %s", self.name, self.id
                 )
                 logs = self.client.get_task(self.id, "FULL").logs
                 log.error(
                     "[job %s] logs: %s",
-                    self.name, logs
+                    self.name, LazyPformat(logs)
                 )
                 if isinstance(logs, MutableSequence):
                     last_log = logs[-1]
                     if isinstance(last_log, tes.TaskLog) and last_log.logs:
-                        self.exit_code = last_log.logs[-1].exit_code
+                        executor_logs = last_log.logs
+                        if self.batch_index is not None:
+                            executor_logs = \
+                                executor_logs[:self.batch_index + 1]
+                        if executor_logs:
+                            self.exit_code = executor_logs[-1].exit_code
             return True
         return False
 
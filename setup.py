@@ -37,7 +37,7 @@ setup(
     author_email="strucka@ohsu.edu",
     url="https://github.com/common-workflow-language/cwl-tes",
     license="Apache 2.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     python_requires="!=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, !=3.4.*, !=3.5*, <4",
     install_requires=[
         "cwltool==1.0.20191022103248",
@@ -53,6 +53,13 @@ setup(
             "nose>=1.3.7",
             "flake8>=3.7.0",
             "PyYAML>=3.12"
+        ],
+        "bench": [
+            "pyftpdlib>=1.5.0",
+            "boto3>=1.9.0"
+        ],
+        "s3": [
+            "boto3>=1.9.0"
         ]
     },
     entry_points={
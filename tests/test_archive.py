@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+import filecmp
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import tes
+
+from cwl_tes.archive import DirectoryArchiver
+
+
+class TestDirectoryArchiver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, "reads")
+        os.makedirs(os.path.join(self.source, "lane 1"))
+        for name in ("a.fq", "b.fq", os.path.join("lane 1", "c.fq")):
+            with open(os.path.join(self.source, name), "w") as handle:
+                handle.write(name * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def round_trip(self, compression):
+        archiver = DirectoryArchiver(3, compression)
+        archive = archiver.pack(self.source)
+        self.assertTrue(archive.endswith(archiver.suffix))
+        target = os.path.join(self.tmp, "in", "reads")
+        staged, command = archiver.stage(tes.Input(
+            url="ftp://host/reads" + archiver.suffix, path=target,
+            type="DIRECTORY"))
+        self.assertEqual(staged.type, "FILE")
+        self.assertEqual(staged.path, target + archiver.suffix)
+        os.makedirs(os.path.dirname(staged.path))
+        shutil.copy(archive, staged.path)
+        subprocess.check_call(["sh", "-c", command])
+        comparison = filecmp.dircmp(self.source, target)
+        self.assertEqual(comparison.left_only + comparison.right_only, [])
+        self.assertEqual(comparison.diff_files, [])
+        self.assertEqual(
+            filecmp.dircmp(os.path.join(self.source, "lane 1"),
+                           os.path.join(target, "lane 1")).diff_files, [])
+        archiver.cleanup()
+        self.assertFalse(os.path.exists(archive))
+
+    def test_gzip_round_trip(self):
+        self.round_trip("gzip")
+
+    def test_uncompressed_round_trip(self):
+        self.round_trip("none")
+
+    def test_should_pack_counts_files_in_subdirectories(self):
+        self.assertTrue(DirectoryArchiver(3).should_pack(self.source))
+        self.assertFalse(DirectoryArchiver(4).should_pack(self.source))
+
+    def test_register_lists_the_local_copy(self):
+        archiver = DirectoryArchiver(3)
+        url = "ftp://host/reads.tar.gz"
+        listing = archiver.register(url, self.source)
+        self.assertIn(url, archiver)
+        self.assertEqual([entry["basename"] for entry in listing],
+                         ["a.fq", "b.fq", "lane 1"])
+        self.assertEqual(listing[0]["size"], 40)
+        self.assertEqual(listing[2]["listing"][0]["location"],
+                         url + "/lane 1/c.fq")
+
+    def test_executor_runs_all_commands(self):
+        executor = DirectoryArchiver(3, helper_image="busybox").executor(
+            ["tar -xzf /a.tar.gz -C /a", "tar -xzf /b.tgz -C /b"])
+        self.assertEqual(executor.image, "busybox")
+        self.assertEqual(executor.command[-1],
+                         "tar -xzf /a.tar.gz -C /a && tar -xzf /b.tgz -C /b")
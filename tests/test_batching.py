@@ -0,0 +1,279 @@
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+import tes
+
+from cwl_tes.tes import (PollSchedule, TaskBatcher, TaskWatch, TESTaskPoller,
+                         _container_paths, _executor_ranges)
+
+
+class FakeClient(object):
+    """Just enough of tes.HTTPClient for the poller and batcher."""
+
+    def __init__(self, states=None, page_size=2):
+        self.states = dict(states or {})
+        self.page_size = page_size
+        self.created = []
+        self.list_calls = 0
+        self.get_calls = []
+        self.exit_codes = []
+
+    def create_task(self, task):
+        self.created.append(task)
+        task_id = "task-{}".format(len(self.created))
+        self.states[task_id] = "QUEUED"
+        return task_id
+
+    def list_tasks(self, view, page_size, page_token=None):
+        self.list_calls += 1
+        ids = sorted(self.states)
+        start = int(page_token or 0)
+        end = start + self.page_size
+        return tes.ListTasksResponse(
+            tasks=[tes.Task(id=task_id, state=self.states[task_id])
+                   for task_id in ids[start:end]],
+            next_page_token=str(end) if end < len(ids) else None)
+
+    def get_task(self, task_id, view):
+        self.get_calls.append(task_id)
+        logs = [tes.TaskLog(logs=[tes.ExecutorLog(exit_code=code)
+                                  for code in self.exit_codes])]
+        return tes.Task(id=task_id, state=self.states[task_id], logs=logs)
+
+
+class FakeSubmitter(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.released = 0
+
+    def submit(self, task):
+        return self.client.create_task(task)
+
+    def release(self):
+        self.released += 1
+
+
+class FakeMetrics(object):
+
+    def observe(self, *args):
+        pass
+
+
+class FakeJob(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.id = None
+        self.batch_index = None
+        self.state = None
+        self.submitted_alone = None
+        self.metrics = FakeMetrics()
+
+    def submit_task(self, task, on_final):
+        self.submitted_alone = task
+
+    def record_submission(self):
+        pass
+
+    def record_times(self, watch):
+        pass
+
+    def set_state(self, state):
+        self.state = state
+
+
+class FakePoller(object):
+
+    def __init__(self):
+        self.watches = {}
+
+    def watch(self, task_id, callback, tag=None):
+        self.watches[task_id] = callback
+
+
+def make_task(name, outdir, commands=1, image="alpine"):
+    return tes.Task(
+        name=name,
+        executors=[tes.Executor(image=image, command=["true"],
+                                workdir=outdir)
+                   for _ in range(commands)],
+        outputs=[tes.Output(url="ftp://host/" + name, path=outdir,
+                            type="DIRECTORY")],
+        resources=tes.Resources(cpu_cores=1, ram_gb=1.0, disk_gb=1.0))
+
+
+class TestPollSchedule(unittest.TestCase):
+
+    def test_queued_tasks_use_min_interval(self):
+        schedule = PollSchedule(min_interval=2)
+        watch = TaskWatch("a", None)
+        self.assertEqual(schedule.interval(watch, watch.submitted + 100), 2)
+
+    def test_running_tasks_back_off(self):
+        schedule = PollSchedule(min_interval=1, max_interval=60, backoff=0.1)
+        watch = TaskWatch("a", None)
+        watch.started = 0.0
+        self.assertEqual(schedule.interval(watch, 5.0), 1)
+        self.assertAlmostEqual(schedule.interval(watch, 300.0), 30.0)
+        self.assertEqual(schedule.interval(watch, 3000.0), 60)
+
+    def test_polls_often_near_median_runtime(self):
+        schedule = PollSchedule(min_interval=1, max_interval=60, backoff=0.1)
+        for runtime in (90.0, 100.0, 110.0):
+            watch = TaskWatch("done", None, tag="tool")
+            watch.started = 1000.0
+            schedule.record(watch, 1000.0 + runtime)
+        self.assertEqual(schedule.median("tool"), 100.0)
+        watch = TaskWatch("a", None, tag="tool")
+        watch.started = 1000.0
+        self.assertEqual(schedule.interval(watch, 1100.0), 1)
+        # capped so that the window is not overshot
+        self.assertAlmostEqual(schedule.interval(watch, 1070.0), 5.0)
+
+    def test_history_is_bounded(self):
+        schedule = PollSchedule(history=2)
+        for runtime in (1.0, 2.0, 3.0):
+            watch = TaskWatch("done", None, tag="tool")
+            watch.started = 1000.0
+            schedule.record(watch, 1000.0 + runtime)
+        self.assertEqual(schedule.median("tool"), 3.0)
+
+
+class TestTESTaskPoller(unittest.TestCase):
+
+    def test_refresh_pages_through_list_tasks(self):
+        client = FakeClient(
+            {"t{}".format(n): "RUNNING" for n in range(10)}, page_size=4)
+        poller = TESTaskPoller(client)
+        watched = {task_id: TaskWatch(task_id, None)
+                   for task_id in ("t0", "t1", "t5", "t9")}
+        states = poller._refresh(list(watched), watched)
+        self.assertEqual(states, dict.fromkeys(watched, "RUNNING"))
+        # t5 and t9 are not on the first page, and two GetTask calls are
+        # cheaper than paging on
+        self.assertEqual(client.list_calls, 1)
+        self.assertEqual(sorted(client.get_calls), ["t5", "t9"])
+
+    def test_refresh_single_task_uses_get_task(self):
+        client = FakeClient({"t0": "COMPLETE", "t1": "RUNNING"})
+        poller = TESTaskPoller(client)
+        watched = {"t0": TaskWatch("t0", None)}
+        self.assertEqual(poller._refresh(["t0"], watched),
+                         {"t0": "COMPLETE"})
+        self.assertEqual(client.list_calls, 0)
+
+    def test_every_watch_of_a_task_is_called(self):
+        client = FakeClient({"t0": "COMPLETE"})
+        poller = TESTaskPoller(client, PollSchedule(min_interval=0))
+        done = threading.Semaphore(0)
+        results = []
+
+        def callback(watch):
+            results.append(watch.state)
+            done.release()
+        poller.watch("t0", callback)
+        poller.watch("t0", callback)
+        for _ in range(2):
+            self.assertTrue(done.acquire(timeout=10))
+        self.assertEqual(results, ["COMPLETE", "COMPLETE"])
+        self.assertEqual(poller.task_ids(), [])
+
+    def test_slow_callbacks_do_not_hold_up_polling(self):
+        client = FakeClient({"t0": "EXECUTOR_ERROR", "t1": "COMPLETE"})
+        poller = TESTaskPoller(client, PollSchedule(min_interval=0))
+        other_done = threading.Event()
+        waited = []
+
+        def slow(watch):
+            waited.append(other_done.wait(timeout=10))
+        poller.watch("t0", slow)
+        poller.watch("t1", lambda watch: other_done.set())
+        self.assertTrue(other_done.wait(timeout=10))
+        poller._workers.shutdown(wait=True)
+        self.assertEqual(waited, [True])
+
+
+class TestTaskBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.poller = FakePoller()
+        self.batcher = TaskBatcher(
+            FakeSubmitter(self.client), self.poller, batch_size=3,
+            linger=60)
+
+    def add(self, name, outdir, commands=1, image="alpine"):
+        job = FakeJob(name)
+        finished = threading.Event()
+        self.batcher.add(job, make_task(name, outdir, commands, image),
+                         finished.set)
+        return job, finished
+
+    def wait_for_tasks(self, count):
+        self.batcher._workers.shutdown(wait=True)
+        self.assertEqual(len(self.client.created), count)
+
+    def test_full_batch_is_submitted_as_one_task(self):
+        jobs = [self.add(name, "/out/" + name, commands=2)[0]
+                for name in ("a", "b", "c")]
+        self.wait_for_tasks(1)
+        batch = self.client.created[0]
+        self.assertEqual(len(batch.executors), 6)
+        self.assertEqual(batch.resources.disk_gb, 3.0)
+        self.assertEqual([job.batch_index for job in jobs], [1, 3, 5])
+        self.assertEqual({job.id for job in jobs}, {"task-1"})
+
+    def test_different_images_are_not_batched(self):
+        self.add("a", "/out/a")
+        self.add("b", "/out/b", image="ubuntu")
+        self.add("c", "/out/c")
+        self.assertEqual(len(self.batcher._pending), 2)
+
+    def test_colliding_paths_start_a_new_batch(self):
+        first, _ = self.add("a", "/out")
+        self.add("b", "/out")
+        self.wait_for_tasks(0)
+        # the pending batch of a alone is submitted, b waits for others
+        self.assertEqual(first.submitted_alone.name, "a")
+        self.assertEqual(len(self.batcher._pending), 1)
+
+    def test_exit_codes_are_mapped_to_members(self):
+        jobs = [self.add(name, "/out/" + name)
+                for name in ("a", "b", "c")]
+        self.wait_for_tasks(1)
+        self.batcher._workers = _Inline()
+        self.client.exit_codes = [0, 1]
+        self.client.states["task-1"] = "EXECUTOR_ERROR"
+        watch = TaskWatch("task-1", None)
+        watch.state = "EXECUTOR_ERROR"
+        self.poller.watches["task-1"](watch)
+        (a, a_done), (b, b_done), (c, c_done) = jobs
+        self.assertEqual(a.state, "COMPLETE")
+        self.assertEqual(b.state, "EXECUTOR_ERROR")
+        self.assertTrue(a_done.is_set() and b_done.is_set())
+        # c never ran, so it is submitted again on its own
+        self.assertFalse(c_done.is_set())
+        self.assertEqual(c.submitted_alone.name, "c")
+
+
+class _Inline(object):
+
+    def submit(self, function, *args):
+        function(*args)
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_executor_ranges(self):
+        tasks = [make_task("a", "/a", 2), make_task("b", "/b", 1)]
+        self.assertEqual(_executor_ranges(tasks), [(0, 1), (2, 2)])
+
+    def test_container_paths(self):
+        task = make_task("a", "/out")
+        task.volumes = ["/tmp/a"]
+        task.outputs.append(tes.Output(path="/out/stdout.txt"))
+        self.assertEqual(_container_paths(task),
+                         {"/out", "/out/stdout.txt", "/tmp/a"})
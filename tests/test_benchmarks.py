@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from benchmarks.mock_tes import MockTES
+from benchmarks.run import deep_chain
+
+try:
+    import pyftpdlib
+except ImportError:
+    pyftpdlib = None
+
+
+class TestMockTES(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.tes = MockTES(run_time=0.0, ftp_root=self.root)
+        self.url = self.tes.start() + "/v1/tasks"
+
+    def tearDown(self):
+        self.tes.stop()
+        shutil.rmtree(self.root)
+
+    def create(self, task, compress=False):
+        data = json.dumps(task).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if compress:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        return requests.post(self.url, data=data, headers=headers).json()["id"]
+
+    def get(self, task_id, view="MINIMAL"):
+        return requests.get("{}/{}".format(self.url, task_id),
+                            params={"view": view}).json()
+
+    def test_completed_tasks_create_their_outputs(self):
+        task_id = self.create({
+            "name": "cat", "executors": [{"image": "alpine"}],
+            "outputs": [{"url": "ftp://host/out/result.txt",
+                         "path": "/out/result.txt", "type": "FILE"},
+                        {"url": "ftp://host/out/dir", "path": "/out/dir",
+                         "type": "DIRECTORY"}]}, compress=True)
+        self.assertEqual(self.get(task_id)["state"], "COMPLETE")
+        with open(os.path.join(self.root, "out", "result.txt")) as handle:
+            self.assertEqual(handle.read(), "output of cat\n")
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "out", "dir")))
+        self.assertEqual(self.tes.stats()["requests"]["create"], 1)
+
+    def test_failed_tasks_report_exit_codes(self):
+        self.tes.failure_rate = 1.0
+        task_id = self.create({"executors": [{"image": "alpine"}] * 2})
+        task = self.get(task_id, "FULL")
+        self.assertEqual(task["state"], "EXECUTOR_ERROR")
+        self.assertEqual(task["logs"][0]["logs"],
+                         [{"exit_code": 1}, {"exit_code": 1}])
+
+    def test_tasks_queue_and_run(self):
+        self.tes.queue_time = self.tes.run_time = 0.5
+        task_id = self.create({"executors": [{"image": "alpine"}]})
+        self.assertEqual(self.get(task_id)["state"], "QUEUED")
+        time.sleep(0.6)
+        self.assertEqual(self.get(task_id)["state"], "RUNNING")
+        requests.post("{}/{}:cancel".format(self.url, task_id))
+        self.assertEqual(self.get(task_id)["state"], "CANCELED")
+
+
+class TestScenarios(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_deep_chain_passes_each_output_on(self):
+        path, job, args = deep_chain(self.workdir, 3)
+        with open(path) as handle:
+            steps = json.load(handle)["steps"]
+        self.assertEqual(steps["step0"]["in"], {"input": "input"})
+        self.assertEqual(steps["step2"]["in"], {"input": "step1/output"})
+        self.assertTrue(os.path.isfile(job["input"]["location"]))
+        self.assertEqual(args, [])
+
+    @unittest.skipIf(pyftpdlib is None, "needs pyftpdlib")
+    def test_run_reports_each_scenario(self):
+        from benchmarks.run import main
+        output = os.path.join(self.workdir, "results.json")
+        self.assertEqual(main(["--scenario", "deep_chain", "--size", "2",
+                               "--output", output]), 0)
+        with open(output) as handle:
+            result, = json.load(handle)["results"]
+        self.assertEqual(result["returncode"], 0)
+        self.assertEqual(result["tes"]["tasks"], 2)
+        self.assertIn("upload", result["phases"])
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+
+import unittest
+
+import tes
+
+from cwl_tes.cache import task_key
+
+
+class TestTaskKey(unittest.TestCase):
+
+    def make_task(self, outdir, url, name="job"):
+        return tes.Task(
+            name=name,
+            executors=[tes.Executor(image="alpine", command=["cat", "in"],
+                                    workdir=outdir)],
+            inputs=[tes.Input(url=url, path="/var/lib/cwl/in")],
+            outputs=[tes.Output(url="ftp://host/output_" + name,
+                                path=outdir, type="DIRECTORY")])
+
+    def test_stable_across_runs(self):
+        first = task_key(self.make_task("/abc", "ftp://host/in", "a"),
+                         {"/abc": "$(outdir)"}, {})
+        second = task_key(self.make_task("/xyz", "ftp://host/in", "b"),
+                          {"/xyz": "$(outdir)"}, {})
+        self.assertEqual(first, second)
+
+    def test_inputs_are_keyed_on_checksums(self):
+        checksums = {"ftp://host/in1": "sha1$aa", "ftp://host/in2": "sha1$aa"}
+        self.assertEqual(
+            task_key(self.make_task("/o", "ftp://host/in1"), {}, checksums),
+            task_key(self.make_task("/o", "ftp://host/in2"), {}, checksums))
+        self.assertNotEqual(
+            task_key(self.make_task("/o", "ftp://host/in1"), {}, {}),
+            task_key(self.make_task("/o", "ftp://host/in2"), {}, {}))
@@ -0,0 +1,62 @@
+from __future__ import unicode_literals
+
+import unittest
+
+import requests
+
+from cwl_tes.tes import TESClient
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body or {}
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(response=self)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession(object):
+    """Serves the TES API below prefix only."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.urls = []
+
+    def request(self, method, url, **kwargs):
+        self.urls.append(url)
+        if not url.startswith("http://tes" + self.prefix + "/tasks"):
+            return FakeResponse(404)
+        return FakeResponse(200, {"id": "task-1", "state": "RUNNING"})
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+class TestTESClient(unittest.TestCase):
+
+    def test_api_path_is_discovered_once(self):
+        for prefix in TESClient.API_PATHS:
+            session = FakeSession(prefix)
+            client = TESClient("http://tes", session)
+            self.assertEqual(client.get_task("task-1").state, "RUNNING")
+            self.assertEqual(client.get_task("task-1").state, "RUNNING")
+            probes = TESClient.API_PATHS.index(prefix) + 1
+            self.assertEqual(len(session.urls), probes + 2)
+            self.assertTrue(session.urls[-1].startswith(
+                "http://tes%s/tasks/task-1" % prefix))
+
+    def test_falls_back_to_v1_until_a_path_answers(self):
+        session = FakeSession("/other")
+        client = TESClient("http://tes", session)
+        with self.assertRaises(requests.HTTPError):
+            client.get_task("task-1")
+        self.assertEqual(session.urls[-1], "http://tes/v1/tasks/task-1")
+        session.prefix = "/ga4gh/tes/v1"
+        self.assertEqual(client.get_task("task-1").state, "RUNNING")
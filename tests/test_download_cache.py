@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cwl_tes.tes import DownloadCache
+
+
+class TestDownloadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DownloadCache(self.directory, max_bytes=10)
+        self.contents = {"ftp://host/a": b"first"}
+        self.opened = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def opener(self, url):
+        self.opened.append(url)
+        return io.BytesIO(self.contents[url])
+
+    def read(self, path):
+        with open(path, "rb") as handle:
+            return handle.read()
+
+    def test_same_version_is_reused(self):
+        path = self.cache.fetch("ftp://host/a", self.opener, "v1")
+        self.assertEqual(
+            self.cache.fetch("ftp://host/a", self.opener, "v1"), path)
+        self.assertEqual(self.read(path), b"first")
+        self.assertEqual(len(self.opened), 1)
+
+    def test_changed_input_is_downloaded_again(self):
+        self.cache.fetch("ftp://host/a", self.opener, "v1")
+        self.contents["ftp://host/a"] = b"second"
+        path = self.cache.fetch("ftp://host/a", self.opener, "v2")
+        self.assertEqual(self.read(path), b"second")
+        self.assertEqual(len(self.opened), 2)
+
+    def test_unversioned_downloads_are_not_reused(self):
+        first = self.cache.fetch("ftp://host/a", self.opener)
+        second = self.cache.fetch("ftp://host/a", self.opener)
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_least_recently_used_are_evicted(self):
+        self.contents["ftp://host/b"] = b"other"
+        self.contents["ftp://host/c"] = b"third"
+        first = self.cache.fetch("ftp://host/a", self.opener, "v1")
+        os.utime(first, (0, 0))
+        self.cache.fetch("ftp://host/b", self.opener, "v1")
+        self.cache.fetch("ftp://host/c", self.opener, "v1")
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from cwltool.context import RuntimeContext
+from cwltool.errors import WorkflowException
+
+from cwl_tes.executors import TESJobExecutor
+from cwl_tes.tes import TESTask
+
+
+class FakeTask(TESTask):
+    """A TESTask that stops remotely as soon as it is submitted."""
+
+    def __init__(self, fail_in=None):  # pylint: disable=super-init-not-called
+        self.fail_in = fail_in
+        self.phases = []
+
+    def submit(self, runtime_context, on_final):
+        self.phases.append(("submit", threading.current_thread().name))
+        if self.fail_in == "submit":
+            raise WorkflowException("submit failed")
+        on_final()
+
+    def finish(self, runtime_context):
+        self.phases.append(("finish", threading.current_thread().name))
+        if self.fail_in == "finish":
+            raise RuntimeError("collect failed")
+
+
+class TestTESJobExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = TESJobExecutor(max_workers=2)
+        self.runtime_context = RuntimeContext()
+        self.runtime_context.workflow_eval_lock = threading.Condition(
+            threading.RLock())
+
+    def run_task(self, task):
+        lock = self.runtime_context.workflow_eval_lock
+        with lock:
+            self.executor.run_job(task, self.runtime_context)
+            self.assertIn(task, self.executor.remote_jobs)
+            while self.executor.remote_jobs:
+                self.assertTrue(lock.wait(10))
+
+    def test_remote_jobs_do_not_hold_a_thread(self):
+        task = FakeTask()
+        self.run_task(task)
+        self.assertEqual([phase for phase, _ in task.phases],
+                         ["submit", "finish"])
+        self.assertNotIn(threading.current_thread().name,
+                         [thread for _, thread in task.phases])
+        self.assertEqual(self.executor.threads, set())
+        self.assertEqual(self.executor.exceptions, [])
+
+    def test_failed_submit_releases_the_job(self):
+        task = FakeTask(fail_in="submit")
+        self.run_task(task)
+        self.assertEqual([phase for phase, _ in task.phases], ["submit"])
+        self.assertEqual(len(self.executor.exceptions), 1)
+
+    def test_other_errors_become_workflow_errors(self):
+        self.run_task(FakeTask(fail_in="finish"))
+        self.assertIsInstance(self.executor.exceptions[0], WorkflowException)
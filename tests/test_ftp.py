@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+
+import ftplib
+import unittest
+
+from cwl_tes.ftp import FtpConnectionPool, FtpFsAccess
+
+
+class FakeFtp(object):
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.listings = 0
+
+    def mlsd(self, path, facts):
+        self.listings += 1
+        if path not in self.tree:
+            raise ftplib.error_perm("550 No such directory")
+        return iter(self.tree[path].items())
+
+    def voidcmd(self, command):
+        pass
+
+    def size(self, path):
+        parent, _, name = path.rpartition("/")
+        facts = self.tree.get(parent, {}).get(name)
+        if facts is None or facts["type"] != "file":
+            raise ftplib.error_perm("550 No such file")
+        return int(facts["size"])
+
+    def mkd(self, path):
+        path = "/" + path.strip("/")
+        parent, _, name = path.rpartition("/")
+        self.tree.setdefault(path, {})
+        self.tree.setdefault(parent or "/", {})[name] = {"type": "dir"}
+
+
+class FakePool(object):
+    """Runs every operation on one FakeFtp and counts them."""
+
+    def __init__(self, tree):
+        self.ftp = FakeFtp(tree)
+        self.credentials = {}
+        self.calls = 0
+
+    def run(self, host, user, passwd, operation, secure=True,
+            idempotent=True):
+        self.calls += 1
+        return operation(self.ftp)
+
+
+class TestFtpListingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = {"/data": {"a.txt": {"type": "file", "size": "3"},
+                               "sub": {"type": "dir"}},
+                     "/data/sub": {}}
+        self.pool = FakePool(self.tree)
+        self.fs_access = FtpFsAccess("ftp://host/", pool=self.pool)
+
+    def test_listing_answers_repeated_lookups(self):
+        self.assertEqual(len(self.fs_access.listdir("ftp://host/data")), 2)
+        self.assertTrue(self.fs_access.isfile("ftp://host/data/a.txt"))
+        self.assertTrue(self.fs_access.isdir("ftp://host/data/sub"))
+        self.assertEqual(self.fs_access.size("ftp://host/data/a.txt"), 3)
+        self.assertFalse(self.fs_access.exists("ftp://host/data/b.txt"))
+        self.assertEqual(self.pool.calls, 1)
+
+    def test_single_lookups_do_not_list(self):
+        self.assertTrue(self.fs_access.isfile("ftp://host/data/a.txt"))
+        self.assertFalse(self.fs_access.isfile("ftp://host/data/b.txt"))
+        self.assertEqual(self.pool.ftp.listings, 0)
+
+    def test_invalidate_refetches_the_directory(self):
+        self.fs_access.listdir("ftp://host/data")
+        self.tree["/data"]["b.txt"] = {"type": "file", "size": "1"}
+        self.assertFalse(self.fs_access.exists("ftp://host/data/b.txt"))
+        self.fs_access.invalidate("ftp://host/data/b.txt")
+        self.assertEqual(len(self.fs_access.listdir("ftp://host/data")), 3)
+        self.assertEqual(self.pool.ftp.listings, 2)
+
+    def test_invalidate_everything(self):
+        self.fs_access.listdir("ftp://host/data")
+        self.tree["/data"]["c.txt"] = {"type": "file", "size": "1"}
+        self.fs_access.invalidate()
+        self.assertTrue(self.fs_access.exists("ftp://host/data/c.txt"))
+
+    def test_mkdir_keeps_unrelated_listings(self):
+        self.fs_access.listdir("ftp://host/data")
+        self.fs_access.listdir("ftp://host/data/sub")
+        self.fs_access.mkdir("ftp://host/data/sub/new")
+        self.assertEqual(self.fs_access.listdir("ftp://host/data/sub"),
+                         ["ftp://host/data/sub/new"])
+        self.fs_access.listdir("ftp://host/data")
+        # /data/sub was listed again, /data was not
+        self.assertEqual(self.pool.ftp.listings, 3)
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.alive = True
+        self.commands = []
+
+    def voidcmd(self, command):
+        if not self.alive:
+            raise EOFError()
+        self.commands.append(command)
+
+    def close(self):
+        self.alive = False
+
+
+class FakeConnectionPool(FtpConnectionPool):
+
+    def __init__(self):
+        super(FakeConnectionPool, self).__init__()
+        self.connections = []
+
+    def _connect(self, host, user, passwd, secure):
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+
+class TestFtpConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FakeConnectionPool()
+        self.attempts = []
+
+    def run_pool(self, operation, idempotent=True):
+        return self.pool.run("host", "bob", "secret", operation,
+                             idempotent=idempotent)
+
+    def drop_first(self, ftp):
+        self.attempts.append(ftp)
+        if len(self.attempts) == 1:
+            raise EOFError()
+        return "done"
+
+    def test_idempotent_operations_are_retried(self):
+        self.assertEqual(self.run_pool(self.drop_first), "done")
+        self.assertEqual(len(self.pool.connections), 2)
+        self.assertFalse(self.pool.connections[0].alive)
+
+    def test_other_operations_are_not_retried(self):
+        with self.assertRaises(EOFError):
+            self.run_pool(self.drop_first, idempotent=False)
+        self.assertEqual(len(self.attempts), 1)
+
+    def test_dead_connections_are_replaced_before_other_operations(self):
+        self.run_pool(lambda ftp: None)
+        self.pool.connections[0].alive = False
+        self.run_pool(self.attempts.append, idempotent=False)
+        self.assertEqual(self.attempts, [self.pool.connections[1]])
+
+    def test_permanent_errors_keep_the_connection(self):
+        def refuse(ftp):
+            raise ftplib.error_perm("550 No such file")
+        with self.assertRaises(ftplib.error_perm):
+            self.run_pool(refuse)
+        self.run_pool(self.attempts.append)
+        self.assertEqual(len(self.pool.connections), 1)
@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from cwl_tes.tes import collect_inputs
+
+
+def file_obj(name, path, **fields):
+    return dict(fields, location="ftp://host/" + name, path=path,
+                basename=name, **{"class": "File"})
+
+
+class TestCollectInputs(unittest.TestCase):
+
+    def test_names_and_order(self):
+        job_order = {
+            "reads": [file_obj("r1", "/stg/r1"), file_obj("r2", "/stg/r2")],
+            "ref": file_obj("ref.fa", "/stg/ref.fa", secondaryFiles=[
+                file_obj("ref.fa.fai", "/stg/ref.fa.fai")]),
+            "nested": {"inner": file_obj("x", "/stg/x")},
+            "count": 3,
+        }
+        entries = collect_inputs(job_order)
+        self.assertEqual([entry.name for entry in entries],
+                         ["reads[0]", "reads[1]", "ref", "ref.fa.fai",
+                          "inner"])
+        self.assertEqual(entries[2].cls, "File")
+        self.assertEqual(entries[2].path, "/stg/ref.fa")
+
+    def test_same_staging_is_listed_once(self):
+        shared = file_obj("a", "/stg/a")
+        entries = collect_inputs({"x": shared, "y": [dict(shared)]})
+        self.assertEqual([entry.name for entry in entries], ["x"])
@@ -0,0 +1,46 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cwl_tes.journal import TaskJournal
+
+
+class TestTaskJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "journal.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_current_run_is_not_found(self):
+        journal = TaskJournal(self.path, resume=True)
+        journal.record("key", "task-1", state="QUEUED", outdir="/out")
+        self.assertIsNone(journal.find("key"))
+
+    def test_earlier_runs_need_resume(self):
+        TaskJournal(self.path).record("key", "task-1", state="QUEUED")
+        self.assertIsNone(TaskJournal(self.path).find("key"))
+
+    def test_resume_merges_records_of_the_last_task(self):
+        journal = TaskJournal(self.path)
+        journal.record("key", "task-1", state="QUEUED", outdir="/a")
+        journal.record("key", "task-1", state="EXECUTOR_ERROR")
+        journal.record("key", "task-2", state="QUEUED", outdir="/b")
+        journal.record("key", "task-2", state="RUNNING")
+        previous = TaskJournal(self.path, resume=True).find("key")
+        self.assertEqual(previous["task_id"], "task-2")
+        self.assertEqual(previous["outdir"], "/b")
+        self.assertEqual(previous["state"], "RUNNING")
+
+    def test_malformed_last_line_is_ignored(self):
+        TaskJournal(self.path).record("key", "task-1", state="QUEUED")
+        with open(self.path, "a") as handle:
+            handle.write('{"key": "other", "task_')
+        journal = TaskJournal(self.path, resume=True)
+        self.assertEqual(journal.find("key")["task_id"], "task-1")
+        self.assertIsNone(journal.find("other"))
@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import tes
+
+from cwl_tes.logging_utils import JsonLinesHandler, LazyPformat, TaskSummary
+
+
+class Exploding(object):
+
+    def __repr__(self):
+        raise AssertionError("formatted although the record was dropped")
+
+
+class TestLazyPformat(unittest.TestCase):
+
+    def test_not_formatted_unless_emitted(self):
+        logger = logging.getLogger("cwl-tes-test-lazy")
+        logger.setLevel(logging.INFO)
+        logger.debug("%s", LazyPformat(Exploding()))
+
+    def test_containers_are_cut_short(self):
+        text = str(LazyPformat(list(range(100)), max_items=3))
+        self.assertEqual(text, "[0, 1, 2, '... 97 more']")
+        text = str(LazyPformat({"k{}".format(n): n for n in range(5)},
+                               max_items=2))
+        self.assertIn("'...': '3 more'", text)
+
+    def test_text_is_cut_short(self):
+        text = str(LazyPformat("x" * 100, max_chars=10))
+        self.assertEqual(text, "'xxxxxxxxx... (92 more characters)")
+
+    def test_tes_models_are_formatted_as_dicts(self):
+        text = str(LazyPformat(tes.Input(url="ftp://host/a", path="/a")))
+        self.assertIn("'url': 'ftp://host/a'", text)
+
+
+class TestTaskSummary(unittest.TestCase):
+
+    def test_summary(self):
+        task = tes.Task(
+            executors=[tes.Executor(image="alpine", command=["true"]),
+                       tes.Executor(image="ubuntu", command=["true"])],
+            inputs=[tes.Input(url="ftp://host/a", path="/a")])
+        self.assertEqual(
+            str(TaskSummary(task)),
+            "2 executor(s) [alpine, ubuntu], 1 input(s), 0 output(s)")
+
+
+class TestJsonLinesHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "log.jsonl")
+        self.handler = JsonLinesHandler(self.path)
+        self.logger = logging.getLogger("cwl-tes-test-json")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        shutil.rmtree(self.tmp)
+
+    def read(self):
+        with open(self.path) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_records_are_written_as_json_lines(self):
+        self.logger.info("task %s submitted", "t1",
+                         extra={"job": "step_a", "task_id": "t1"})
+        self.logger.warning("plain")
+        first, second = self.read()
+        self.assertEqual(first["message"], "task t1 submitted")
+        self.assertEqual(first["level"], "INFO")
+        self.assertEqual((first["job"], first["task_id"]), ("step_a", "t1"))
+        self.assertNotIn("job", second)
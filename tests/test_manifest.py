@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cwltool.stdfsaccess import StdFsAccess
+from cwltool.pathmapper import get_listing
+from schema_salad.ref_resolver import file_uri
+
+from cwl_tes.manifest import (ManifestFsAccess, OutputFsAccess,
+                              parse_checksums, parse_manifest, relative_path)
+from cwl_tes.tes import TESTask
+
+
+class FakeFsAccess(object):
+
+    def __init__(self, names):
+        self.names = names
+
+    def join(self, path, *paths):
+        return "/".join((path,) + paths)
+
+    def glob(self, pattern):
+        return ["ftp://host/out/" + name for name in self.names]
+
+    def listdir(self, fn):
+        return [fn + "/" + name for name in self.names]
+
+    def size(self, fn):
+        return 1
+
+
+class TestManifest(unittest.TestCase):
+
+    def test_parse_manifest(self):
+        entries = parse_manifest(
+            "f 12 a.txt\nd 0 sub\nf 0 sub/with space.txt\nbogus\n")
+        self.assertEqual(entries, {"a.txt": ("f", 12), "sub": ("d", 0),
+                                   "sub/with space.txt": ("f", 0)})
+
+    def test_parse_checksums(self):
+        sha1 = "a" * 40
+        checksums = parse_checksums(
+            "{0}  ./a.txt\n{0} *b.bin\n\\{0}  ./c\\nd\n".format(sha1))
+        self.assertEqual(checksums, {"a.txt": "sha1$" + sha1,
+                                     "b.bin": "sha1$" + sha1})
+
+    def test_relative_path(self):
+        self.assertEqual(relative_path("ftp://h/out/a/./b", "ftp://h/out/"),
+                         "a/b")
+        self.assertEqual(relative_path("ftp://h/out", "ftp://h/out"), "")
+        self.assertIsNone(relative_path("ftp://h/outer/a", "ftp://h/out"))
+
+    def test_manifest_glob(self):
+        fs_access = ManifestFsAccess(
+            "/", parse_manifest("f 1 a.txt\nf 1 .b.txt\nd 0 sub\n"
+                                "f 1 sub/c.txt\n"),
+            "ftp://h/out", FakeFsAccess([]))
+        self.assertEqual(fs_access.glob("ftp://h/out/*.txt"),
+                         ["ftp://h/out/a.txt"])
+        self.assertEqual(fs_access.glob("ftp://h/out/*/*.txt"),
+                         ["ftp://h/out/sub/c.txt"])
+        self.assertEqual(fs_access.size("ftp://h/out/sub/c.txt"), 1)
+
+    def test_sidecars_are_hidden(self):
+        fs_access = OutputFsAccess(
+            FakeFsAccess(["a.txt", ".cwl_tes_sha1", ".cwl_tes_manifest"]))
+        self.assertEqual(fs_access.glob("ftp://host/out/*"),
+                         ["ftp://host/out/a.txt"])
+        self.assertEqual(fs_access.listdir("ftp://host/out"),
+                         ["ftp://host/out/a.txt"])
+        self.assertEqual(fs_access.size("ftp://host/out/a.txt"), 1)
+
+
+class FakeBuilder(object):
+
+    make_fs_access = StdFsAccess
+
+
+class FakeLocalJob(object):
+    """What TESTask.collect_local_outputs needs of a job."""
+
+    def __init__(self, outdir):
+        self.builder = FakeBuilder()
+        self.outdir = outdir
+        self.exit_code = 0
+
+    def collect_outputs(self, outdir, exit_code, compute_checksum):
+        fs_access = self.builder.make_fs_access(outdir)
+        directory = {"class": "Directory", "location": file_uri(outdir)}
+        get_listing(fs_access, directory, recursive=True)
+        return {"dir": directory}
+
+
+class TestLocalOutputs(unittest.TestCase):
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        for name in ("a.txt", ".cwl_tes_sha1", ".cwl_tes_manifest"):
+            with open(os.path.join(self.outdir, name), "w") as handle:
+                handle.write("x")
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def test_directory_listing_hides_sidecars(self):
+        job = FakeLocalJob(self.outdir)
+        outputs = TESTask.collect_local_outputs(job, True)
+        self.assertEqual(
+            [entry["basename"] for entry in outputs["dir"]["listing"]],
+            ["a.txt"])
+        self.assertIs(job.builder.make_fs_access, StdFsAccess)
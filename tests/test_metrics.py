@@ -0,0 +1,69 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import requests
+
+from cwl_tes.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.observe("upload", 2.0)
+        self.metrics.observe("run", 1.0, "job_a")
+        self.metrics.observe("run", 3.0, "job_b")
+        self.metrics.observe("run", 0.5, "job_a")
+        self.metrics.count("COMPLETE")
+        self.metrics.count("COMPLETE")
+
+    def test_summary(self):
+        summary = self.metrics.summary()
+        self.assertEqual(summary["phases"]["run"],
+                         {"count": 3, "seconds": 4.5, "max_seconds": 3.0})
+        self.assertEqual(summary["jobs"],
+                         {"job_a": {"run": 1.5}, "job_b": {"run": 3.0}})
+        self.assertEqual(summary["counts"], {"COMPLETE": 2})
+
+    def test_timer_records_even_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.timer("collect", "job_a"):
+                raise ValueError()
+        self.assertEqual(self.metrics.summary()["phases"]["collect"]["count"],
+                         1)
+        self.assertIn("collect", self.metrics.summary()["jobs"]["job_a"])
+
+    def test_prometheus(self):
+        lines = self.metrics.prometheus().splitlines()
+        self.assertIn('cwl_tes_phase_seconds_count{phase="run"} 3', lines)
+        self.assertIn('cwl_tes_phase_seconds_sum{phase="run"} 4.500000',
+                      lines)
+        self.assertIn('cwl_tes_phase_seconds_max{phase="upload"} 2.000000',
+                      lines)
+        self.assertIn('cwl_tes_events_total{event="COMPLETE"} 2', lines)
+
+    def test_serve(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.metrics.serve(port, "127.0.0.1")
+        response = requests.get("http://127.0.0.1:{}/metrics".format(port))
+        self.assertEqual(response.text, self.metrics.prometheus())
+
+    def test_write_summary(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "metrics.json")
+            self.metrics.write_summary(path)
+            with open(path) as handle:
+                self.assertEqual(json.load(handle)["counts"],
+                                 {"COMPLETE": 2})
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,60 @@
+from __future__ import unicode_literals
+
+import gzip
+import json
+import unittest
+
+import tes
+
+from cwl_tes.payload import GZIP_MIN_SIZE, TaskEncoder, compact_task
+
+
+def make_task(**fields):
+    return tes.Task(
+        name="job",
+        executors=[tes.Executor(image="alpine", command=["true"],
+                                env={"EMPTY": ""})],
+        **fields)
+
+
+class TestCompactTask(unittest.TestCase):
+
+    def test_unset_fields_and_file_types_are_dropped(self):
+        msg = compact_task(make_task(
+            inputs=[tes.Input(url="ftp://host/a", path="/a")],
+            outputs=[tes.Output(url="ftp://host/o", path="/o",
+                                type="DIRECTORY")],
+            volumes=[]))
+        self.assertEqual(msg["inputs"], [{"url": "ftp://host/a",
+                                          "path": "/a"}])
+        self.assertEqual(msg["outputs"][0]["type"], "DIRECTORY")
+        self.assertNotIn("volumes", msg)
+        self.assertNotIn("resources", msg)
+
+    def test_empty_literal_input_keeps_its_content(self):
+        msg = compact_task(make_task(
+            inputs=[tes.Input(path="/a", content="")]))
+        self.assertEqual(msg["inputs"], [{"path": "/a", "content": ""}])
+
+    def test_env_keeps_empty_values(self):
+        msg = compact_task(make_task())
+        self.assertEqual(msg["executors"][0]["env"], {"EMPTY": ""})
+
+    def test_descriptions_are_cut(self):
+        msg = compact_task(make_task(description="x" * 100),
+                           description_limit=10)
+        self.assertEqual(msg["description"], "xxxxxxx...")
+
+
+class TestTaskEncoder(unittest.TestCase):
+
+    def test_size_limit(self):
+        with self.assertRaises(ValueError):
+            TaskEncoder(max_size=10).encode(make_task())
+
+    def test_large_bodies_are_gzipped(self):
+        encoder = TaskEncoder(compress=True, description_limit=None)
+        body = encoder.encode(make_task(description="x" * GZIP_MIN_SIZE))
+        self.assertIsNone(encoder.gzip(b"{}"))
+        self.assertEqual(gzip.decompress(encoder.gzip(body)), body)
+        self.assertEqual(json.loads(body.decode("utf-8"))["name"], "job")
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from cwl_tes.profiling import Profiler
+
+
+def busy_worker(seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        sum(range(1000))
+
+
+def run_in_thread(seconds):
+    thread = threading.Thread(target=busy_worker, args=(seconds,))
+    thread.start()
+    thread.join()
+    return "result"
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "profile")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cprofile_covers_other_threads(self):
+        profiled = Profiler(self.path, "cprofile").wrap(run_in_thread)
+        self.assertEqual(profiled(0.05), "result")
+        functions = {name for _, _, name in pstats.Stats(self.path).stats}
+        self.assertIn("busy_worker", functions)
+        self.assertIn("run_in_thread", functions)
+
+    def test_sample_writes_folded_stacks(self):
+        profiled = Profiler(self.path, "sample", interval=0.005).wrap(
+            run_in_thread)
+        profiled(0.2)
+        with open(self.path) as handle:
+            lines = handle.read().splitlines()
+        self.assertTrue(any("busy_worker" in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Profiler(self.path, "perf")
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from cwl_tes.main import relocate_outputs_ftp
+
+
+class FakeFtpAccess(object):
+    """Remote storage holding the given file URLs."""
+
+    def __init__(self, files):
+        self.files = dict.fromkeys(files, b"")
+
+    def join(self, path, *paths):
+        return "/".join((path.rstrip("/"),) + paths)
+
+    def isfile(self, url):
+        return url in self.files
+
+    def isdir(self, url):
+        return any(name.startswith(url + "/") for name in self.files)
+
+    def mkdir(self, url):
+        pass
+
+    def rename(self, src, dst):
+        self.files[dst] = self.files.pop(src)
+
+    def upload(self, handle, url):
+        self.files[url] = handle.read()
+
+
+def file_obj(location, secondary=()):
+    obj = {"class": "File", "location": location,
+           "basename": location.rsplit("/", 1)[-1]}
+    if secondary:
+        obj["secondaryFiles"] = [file_obj(url) for url in secondary]
+    return obj
+
+
+class TestRelocateOutputs(unittest.TestCase):
+
+    def test_secondary_files_follow_a_renamed_primary(self):
+        task = "ftp://host/run/output_1/"
+        access = FakeFtpAccess([
+            task + "x.bam", task + "x.bam.bai", task + "x.bai",
+            "ftp://host/out/x.bam"])
+        outputs = {"bam": file_obj(
+            task + "x.bam", [task + "x.bam.bai", task + "x.bai"])}
+        relocate_outputs_ftp(outputs, "ftp://host/run", "ftp://host/out",
+                             access)
+        bam = outputs["bam"]
+        self.assertEqual(bam["location"], "ftp://host/out/x_2.bam")
+        self.assertEqual(
+            [obj["location"] for obj in bam["secondaryFiles"]],
+            ["ftp://host/out/x_2.bam.bai", "ftp://host/out/x_2.bai"])
+        self.assertIn("ftp://host/out/x_2.bai", access.files)
+
+    def test_suffix_is_free_for_the_whole_group(self):
+        task = "ftp://host/run/output_1/"
+        access = FakeFtpAccess([
+            task + "x.bam", task + "x.bam.bai", "ftp://host/out/x.bam.bai"])
+        outputs = {"bam": file_obj(task + "x.bam", [task + "x.bam.bai"])}
+        relocate_outputs_ftp(outputs, "ftp://host/run", "ftp://host/out",
+                             access)
+        self.assertEqual(outputs["bam"]["location"],
+                         "ftp://host/out/x_2.bam")
+        self.assertEqual(outputs["bam"]["secondaryFiles"][0]["location"],
+                         "ftp://host/out/x_2.bam.bai")
+
+    def test_literals_are_uploaded_and_inputs_stay(self):
+        access = FakeFtpAccess(["ftp://host/in/a.txt"])
+        outputs = {
+            "literal": {"class": "File", "location": "_:abc",
+                        "basename": "lit.txt", "contents": "hello"},
+            "input": file_obj("ftp://host/in/a.txt")}
+        relocate_outputs_ftp(outputs, "ftp://host/run", "ftp://host/out",
+                             access)
+        self.assertEqual(outputs["literal"]["location"],
+                         "ftp://host/out/lit.txt")
+        self.assertNotIn("contents", outputs["literal"])
+        self.assertEqual(access.files["ftp://host/out/lit.txt"], b"hello")
+        self.assertEqual(outputs["input"]["location"], "ftp://host/in/a.txt")
@@ -0,0 +1,140 @@
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from cwltool.pathmapper import CONTENT_LIMIT
+
+from benchmarks.s3_server import S3Server
+from cwl_tes.s3 import MIB, S3FsAccess, S3Reader, boto3
+
+if boto3 is not None:
+    import botocore.config
+    from boto3.s3.transfer import TransferConfig
+
+
+class FakeClient(object):
+    """Serves ranged GETs of in-memory objects and records the ranges."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range):
+        data = self.objects[(Bucket, Key)]
+        start, _, end = Range[len("bytes="):].partition("-")
+        start = int(start)
+        end = int(end) + 1 if end else len(data)
+        self.ranges.append((start, min(end, len(data))))
+        return {"Body": io.BytesIO(data[start:end]),
+                "ContentRange": "bytes {}-{}/{}".format(
+                    start, min(end, len(data)) - 1, len(data))}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+
+class TestS3Reader(unittest.TestCase):
+
+    def setUp(self):
+        self.data = bytes(bytearray(range(256))) * (64 * 1024)
+        self.client = FakeClient({("bucket", "big.bam"): self.data})
+
+    def reader(self):
+        return S3Reader(self.client, "bucket", "big.bam", chunk_size=8 * MIB)
+
+    def test_load_contents_transfers_only_what_it_reads(self):
+        head = self.reader().read(CONTENT_LIMIT + 1)
+        self.assertEqual(head, self.data[:CONTENT_LIMIT + 1])
+        self.assertEqual(self.client.ranges, [(0, CONTENT_LIMIT + 1)])
+
+    def test_read_ahead_grows_up_to_chunk_size(self):
+        reader = self.reader()
+        while reader.read(64 * 1024):
+            pass
+        sizes = [end - start for start, end in self.client.ranges]
+        self.assertEqual(sizes[:2], [CONTENT_LIMIT, 2 * CONTENT_LIMIT])
+        self.assertEqual(max(sizes), 8 * MIB)
+        self.assertEqual(sum(sizes), len(self.data))
+
+    def test_seek_from_end(self):
+        reader = self.reader()
+        reader.seek(-4, 2)
+        self.assertEqual(reader.read(), self.data[-4:])
+
+
+@unittest.skipIf(boto3 is None, "needs boto3")
+class TestS3FsAccess(unittest.TestCase):
+    """Against the stand-in S3 server of the benchmarks."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, "bucket"))
+        self.server = S3Server(self.root)
+        client = boto3.session.Session(
+            aws_access_key_id="test", aws_secret_access_key="test",
+            region_name="us-east-1").client(
+                "s3", endpoint_url=self.server.start(),
+                config=botocore.config.Config(
+                    s3={"addressing_style": "path"}))
+        self.fs_access = S3FsAccess(
+            "/", client=client, transfer_config=TransferConfig(
+                multipart_threshold=5 * MIB, multipart_chunksize=5 * MIB,
+                max_concurrency=3))
+        self.data = os.urandom(12 * MIB)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.root)
+
+    def test_large_files_are_uploaded_in_parts(self):
+        checksum = self.fs_access.upload(
+            io.BytesIO(self.data), "s3://bucket/in/big.bin")
+        self.assertEqual(checksum,
+                         "sha1$" + hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(self.server.stats()["requests"]["upload_part"], 3)
+        with open(os.path.join(self.root, "bucket", "in", "big.bin"),
+                  "rb") as handle:
+            self.assertEqual(handle.read(), self.data)
+
+    def test_load_contents_reads_only_the_head(self):
+        self.fs_access.upload(io.BytesIO(self.data), "s3://bucket/big.bin")
+        self.server.reset()
+        with self.fs_access.open("s3://bucket/big.bin", "rb") as handle:
+            head = handle.read(CONTENT_LIMIT + 1)
+        self.assertEqual(head, self.data[:CONTENT_LIMIT + 1])
+        self.assertEqual(self.server.stats()["bytes_sent"], len(head))
+
+    def test_one_listing_answers_lookups(self):
+        self.fs_access.mkdir("s3://bucket/out/sub")
+        self.fs_access.upload(io.BytesIO(b"abc"), "s3://bucket/out/a.txt")
+        self.server.reset()
+        self.assertTrue(self.fs_access.isfile("s3://bucket/out/a.txt"))
+        self.assertTrue(self.fs_access.isdir("s3://bucket/out/sub"))
+        self.assertFalse(self.fs_access.exists("s3://bucket/out/b.txt"))
+        self.assertEqual(self.fs_access.size("s3://bucket/out/a.txt"), 3)
+        self.assertEqual(self.server.stats()["requests"],
+                         {"list_objects": 1})
+
+    def test_rename_moves_a_directory(self):
+        self.fs_access.mkdir("s3://bucket/tmp")
+        for name in ("a.txt", "b.txt"):
+            self.fs_access.upload(io.BytesIO(name.encode("utf-8")),
+                                  "s3://bucket/tmp/" + name)
+        self.fs_access.rename("s3://bucket/tmp", "s3://bucket/final")
+        self.assertEqual(sorted(self.fs_access.listdir("s3://bucket/final")),
+                         ["s3://bucket/final/a.txt",
+                          "s3://bucket/final/b.txt"])
+        self.assertFalse(self.fs_access.exists("s3://bucket/tmp/a.txt"))
+
+    def test_version_changes_with_the_contents(self):
+        url = "s3://bucket/a.txt"
+        self.fs_access.upload(io.BytesIO(b"first"), url)
+        first = self.fs_access.version(url)
+        self.fs_access.upload(io.BytesIO(b"second"), url)
+        self.assertNotEqual(self.fs_access.version(url), first)
+        self.assertIsNone(self.fs_access.version("s3://bucket/missing"))
@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from cwl_tes.storage import RemoteFsAccess, get_backend
+
+
+class FakeRemoteFsAccess(RemoteFsAccess):
+    """Remote storage holding a fixed tree."""
+
+    scheme = "fake"
+    tree = {
+        "fake://host/out": ["a.txt", "b.log", ".hidden.txt", "sub"],
+        "fake://host/out/sub": ["c.txt"],
+    }
+
+    def listdir(self, fn):
+        if fn not in self.tree:
+            raise OSError(fn)
+        return [fn + "/" + name for name in self.tree[fn]]
+
+    def isdir(self, fn):
+        return fn in self.tree
+
+    def isfile(self, fn):
+        parent, _, name = fn.rpartition("/")
+        return name in self.tree.get(parent, []) and fn not in self.tree
+
+    def exists(self, fn):
+        return self.isdir(fn) or self.isfile(fn)
+
+
+class TestRemoteFsAccess(unittest.TestCase):
+
+    def setUp(self):
+        self.fs_access = FakeRemoteFsAccess("/")
+
+    def test_glob_matches_basenames(self):
+        self.assertEqual(self.fs_access._glob("fake://host/out/a*"),
+                         ["fake://host/out/a.txt"])
+        self.assertEqual(self.fs_access._glob("fake://host/out/*.txt"),
+                         ["fake://host/out/a.txt"])
+
+    def test_glob_hides_dotfiles_unless_asked(self):
+        self.assertEqual(self.fs_access._glob("fake://host/out/.*"),
+                         ["fake://host/out/.hidden.txt"])
+
+    def test_glob_in_subdirectories(self):
+        self.assertEqual(self.fs_access._glob("fake://host/out/s*/*"),
+                         ["fake://host/out/sub/c.txt"])
+
+    def test_get_backend(self):
+        self.assertIs(get_backend("file:///data"),
+                      get_backend("file:///other"))
+        with self.assertRaises(ValueError):
+            get_backend("gopher://host/")